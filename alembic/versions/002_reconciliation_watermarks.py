@@ -0,0 +1,28 @@
+"""Add reconciliation watermarks table
+
+Revision ID: 002
+Revises: 001_initial_schema
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '002_reconciliation_watermarks'
+down_revision = '001_initial_schema'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'reconciliation_watermarks',
+        sa.Column('name', sa.String(100), primary_key=True),
+        sa.Column('closed_before', sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('reconciliation_watermarks')
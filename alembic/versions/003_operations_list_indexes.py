@@ -0,0 +1,78 @@
+"""Add indexes for the keyset pagination of the operations list
+
+Revision ID: 003
+Revises: 002_reconciliation_watermarks
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '003_operations_list_indexes'
+down_revision = '002_reconciliation_watermarks'
+branch_labels = None
+depends_on = None
+
+
+# Indexes are created concurrently to not block writes on existing tables
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_operations_accepted_at_uuid',
+            'operations',
+            [sa.text('accepted_at DESC'), sa.text('uuid DESC')],
+            postgresql_concurrently=True,
+        )
+        # Replaces ix_operations_status, which is one of its prefixes
+        op.create_index(
+            'ix_operations_status_accepted_at_uuid',
+            'operations',
+            ['status', sa.text('accepted_at DESC'), sa.text('uuid DESC')],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_operations_op_type_accepted_at_uuid',
+            'operations',
+            ['op_type', sa.text('accepted_at DESC'), sa.text('uuid DESC')],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_operations_running_uuid',
+            'operations',
+            ['uuid'],
+            postgresql_where=sa.text("status = 'RUNNING'"),
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            'ix_operations_status', 'operations', postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_operations_status',
+            'operations',
+            ['status'],
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            'ix_operations_running_uuid', 'operations', postgresql_concurrently=True
+        )
+        op.drop_index(
+            'ix_operations_op_type_accepted_at_uuid',
+            'operations',
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            'ix_operations_status_accepted_at_uuid',
+            'operations',
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            'ix_operations_accepted_at_uuid',
+            'operations',
+            postgresql_concurrently=True,
+        )
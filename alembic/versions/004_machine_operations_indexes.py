@@ -0,0 +1,48 @@
+"""Add indexes for the operations of a machine
+
+Revision ID: 004
+Revises: 003_operations_list_indexes
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '004_machine_operations_indexes'
+down_revision = '003_operations_list_indexes'
+branch_labels = None
+depends_on = None
+
+
+# Indexes are created concurrently to not block writes on existing tables
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_operations_system_id_accepted_at_uuid',
+            'operations',
+            ['system_id', sa.text('accepted_at DESC'), sa.text('uuid DESC')],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_operations_active_system_id_accepted_at',
+            'operations',
+            ['system_id', sa.text('accepted_at DESC')],
+            postgresql_where=sa.text("status IN ('ACCEPTED', 'RUNNING')"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_operations_active_system_id_accepted_at',
+            'operations',
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            'ix_operations_system_id_accepted_at_uuid',
+            'operations',
+            postgresql_concurrently=True,
+        )
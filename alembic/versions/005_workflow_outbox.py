@@ -0,0 +1,37 @@
+"""Add workflow outbox table
+
+Revision ID: 005
+Revises: 004_machine_operations_indexes
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '005_workflow_outbox'
+down_revision = '004_machine_operations_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'workflow_outbox',
+        sa.Column('operation_uuid', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('available_at', sa.DateTime(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_error', sa.Text(), nullable=True),
+    )
+
+    op.create_index(
+        'ix_workflow_outbox_available_at', 'workflow_outbox', ['available_at']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_workflow_outbox_available_at')
+    op.drop_table('workflow_outbox')
@@ -0,0 +1,41 @@
+"""Add operation stats rollup tables
+
+Revision ID: 006
+Revises: 005_workflow_outbox
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '006_operation_stats'
+down_revision = '005_workflow_outbox'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'operation_status_counts',
+        sa.Column('span_seconds', sa.Integer(), primary_key=True),
+        sa.Column('bucket', sa.DateTime(), primary_key=True),
+        sa.Column('op_type', sa.String(100), primary_key=True),
+        sa.Column('status', sa.String(20), primary_key=True),
+        sa.Column('count', sa.BigInteger(), nullable=False),
+    )
+    op.create_table(
+        'operation_duration_histograms',
+        sa.Column('span_seconds', sa.Integer(), primary_key=True),
+        sa.Column('bucket', sa.DateTime(), primary_key=True),
+        sa.Column('op_type', sa.String(100), primary_key=True),
+        sa.Column('metric', sa.String(20), primary_key=True),
+        sa.Column('bin', sa.SmallInteger(), primary_key=True),
+        sa.Column('count', sa.BigInteger(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('operation_duration_histograms')
+    op.drop_table('operation_status_counts')
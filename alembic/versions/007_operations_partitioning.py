@@ -0,0 +1,197 @@
+"""Partition operations by month and add the operations archive
+
+Revision ID: 007
+Revises: 006_operation_stats
+Create Date: 2026-10-17 15:00:00.000000
+
+The operations are copied into a new table partitioned by month of `accepted_at`,
+which replaces the old one: run it while the API and the workers are stopped.
+Partitions are created for every month with operations, up to 3 months ahead;
+the archival workflow then keeps creating them ahead of time (see
+app/archive.py).
+
+Postgres requires the partition key to be part of the primary key, which becomes
+(uuid, accepted_at): the uniqueness of the UUIDs alone is no longer enforced by
+the database, and relies on the API generating random (v4) UUIDs. Indexes can't
+be created concurrently on partitioned tables.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '007_operations_partitioning'
+down_revision = '006_operation_stats'
+branch_labels = None
+depends_on = None
+
+COLUMNS = (
+    'uuid, system_id, op_type, status, accepted_at, started_at, finished_at,'
+    ' parameters, result'
+)
+
+
+def operations_columns():
+    return [
+        sa.Column('uuid', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('system_id', sa.String(6), nullable=False),
+        sa.Column('op_type', sa.String(100), nullable=False),
+        sa.Column('status', sa.String(20), nullable=False),
+        sa.Column('accepted_at', sa.DateTime(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('parameters', postgresql.JSON(), nullable=False),
+        sa.Column('result', postgresql.JSON(), nullable=True),
+    ]
+
+
+def create_operations_indexes() -> None:
+    op.create_index(
+        'ix_operations_accepted_at_uuid',
+        'operations',
+        [sa.text('accepted_at DESC'), sa.text('uuid DESC')],
+    )
+    op.create_index(
+        'ix_operations_status_accepted_at_uuid',
+        'operations',
+        ['status', sa.text('accepted_at DESC'), sa.text('uuid DESC')],
+    )
+    op.create_index(
+        'ix_operations_op_type_accepted_at_uuid',
+        'operations',
+        ['op_type', sa.text('accepted_at DESC'), sa.text('uuid DESC')],
+    )
+    op.create_index(
+        'ix_operations_system_id_accepted_at_uuid',
+        'operations',
+        ['system_id', sa.text('accepted_at DESC'), sa.text('uuid DESC')],
+    )
+    op.create_index(
+        'ix_operations_active_system_id_accepted_at',
+        'operations',
+        ['system_id', sa.text('accepted_at DESC')],
+        postgresql_where=sa.text("status IN ('ACCEPTED', 'RUNNING')"),
+    )
+    op.create_index(
+        'ix_operations_running_uuid',
+        'operations',
+        ['uuid'],
+        postgresql_where=sa.text("status = 'RUNNING'"),
+    )
+
+
+def upgrade() -> None:
+    op.rename_table('operations', 'operations_unpartitioned')
+    op.execute(
+        'ALTER TABLE operations_unpartitioned'
+        ' RENAME CONSTRAINT operations_pkey TO operations_unpartitioned_pkey'
+    )
+    for index in (
+        'ix_operations_accepted_at_uuid',
+        'ix_operations_status_accepted_at_uuid',
+        'ix_operations_op_type_accepted_at_uuid',
+        'ix_operations_system_id_accepted_at_uuid',
+        'ix_operations_active_system_id_accepted_at',
+        'ix_operations_running_uuid',
+    ):
+        op.drop_index(index, 'operations_unpartitioned')
+
+    op.create_table(
+        'operations',
+        *operations_columns(),
+        sa.PrimaryKeyConstraint('uuid', 'accepted_at', name='operations_pkey'),
+        postgresql_partition_by='RANGE (accepted_at)',
+    )
+    op.execute(
+        """
+        DO $$
+        DECLARE
+            month timestamp;
+        BEGIN
+            FOR month IN
+                SELECT generate_series(
+                    date_trunc(
+                        'month',
+                        COALESCE(
+                            (SELECT min(accepted_at) FROM operations_unpartitioned),
+                            now() AT TIME ZONE 'UTC'
+                        )
+                    ),
+                    date_trunc('month', now() AT TIME ZONE 'UTC')
+                        + interval '3 months',
+                    interval '1 month'
+                )
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF operations'
+                    ' FOR VALUES FROM (%L) TO (%L)',
+                    'operations_' || to_char(month, 'YYYY_MM'),
+                    month,
+                    month + interval '1 month'
+                );
+            END LOOP;
+        END
+        $$
+        """
+    )
+    op.execute(
+        f'INSERT INTO operations ({COLUMNS})'
+        f' SELECT {COLUMNS} FROM operations_unpartitioned'
+    )
+    op.drop_table('operations_unpartitioned')
+    create_operations_indexes()
+
+    op.create_table(
+        'operation_archives',
+        sa.Column('month', sa.Date(), primary_key=True),
+        sa.Column('operations', sa.BigInteger(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+    )
+    op.create_table(
+        'operation_archive_chunks',
+        sa.Column('month', sa.Date(), primary_key=True),
+        sa.Column('min_uuid', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('max_uuid', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('operations', sa.Integer(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+    )
+    # Chunks are already gzipped, don't let TOAST try to compress them again
+    op.execute(
+        'ALTER TABLE operation_archive_chunks ALTER COLUMN data SET STORAGE EXTERNAL'
+    )
+
+
+def downgrade() -> None:
+    # Archived operations are not restored
+    op.drop_table('operation_archive_chunks')
+    op.drop_table('operation_archives')
+
+    op.rename_table('operations', 'operations_partitioned')
+    op.execute(
+        'ALTER TABLE operations_partitioned'
+        ' RENAME CONSTRAINT operations_pkey TO operations_partitioned_pkey'
+    )
+    for index in (
+        'ix_operations_accepted_at_uuid',
+        'ix_operations_status_accepted_at_uuid',
+        'ix_operations_op_type_accepted_at_uuid',
+        'ix_operations_system_id_accepted_at_uuid',
+        'ix_operations_active_system_id_accepted_at',
+        'ix_operations_running_uuid',
+    ):
+        op.drop_index(index, 'operations_partitioned')
+
+    op.create_table(
+        'operations',
+        *operations_columns(),
+        sa.PrimaryKeyConstraint('uuid', name='operations_pkey'),
+    )
+    op.execute(
+        f'INSERT INTO operations ({COLUMNS})'
+        f' SELECT {COLUMNS} FROM operations_partitioned'
+    )
+    # Drops the partitions too
+    op.drop_table('operations_partitioned')
+    create_operations_indexes()
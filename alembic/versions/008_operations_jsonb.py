@@ -0,0 +1,70 @@
+"""Store parameters and result as JSONB and index them
+
+Revision ID: 008
+Revises: 007_operations_partitioning
+Create Date: 2026-10-17 16:00:00.000000
+
+Changing the type rewrites the operations, and indexes can't be created
+concurrently on partitioned tables: run it while the API and the workers are
+stopped. `pg_trgm` ships with Postgres and can be created by the owner of the
+database.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '008_operations_jsonb'
+down_revision = '007_operations_partitioning'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    op.execute(
+        'ALTER TABLE operations'
+        ' ALTER COLUMN parameters TYPE JSONB USING parameters::jsonb,'
+        ' ALTER COLUMN result TYPE JSONB USING result::jsonb'
+    )
+
+    op.create_index(
+        'ix_operations_parameters',
+        'operations',
+        ['parameters'],
+        postgresql_using='gin',
+        postgresql_ops={'parameters': 'jsonb_path_ops'},
+    )
+    op.create_index(
+        'ix_operations_result',
+        'operations',
+        ['result'],
+        postgresql_using='gin',
+        postgresql_ops={'result': 'jsonb_path_ops'},
+    )
+    op.create_index(
+        'ix_operations_parameters_timeout',
+        'operations',
+        [sa.text("(parameters -> 'timeout')")],
+    )
+    op.create_index(
+        'ix_operations_result_error_trgm',
+        'operations',
+        [sa.text("(result ->> 'error') gin_trgm_ops")],
+        postgresql_using='gin',
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_operations_result_error_trgm', 'operations')
+    op.drop_index('ix_operations_parameters_timeout', 'operations')
+    op.drop_index('ix_operations_result', 'operations')
+    op.drop_index('ix_operations_parameters', 'operations')
+
+    op.execute(
+        'ALTER TABLE operations'
+        ' ALTER COLUMN parameters TYPE JSON USING parameters::json,'
+        ' ALTER COLUMN result TYPE JSON USING result::json'
+    )
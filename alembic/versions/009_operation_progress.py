@@ -0,0 +1,29 @@
+"""Add the progress of the operations
+
+Revision ID: 009
+Revises: 008_operations_jsonb
+Create Date: 2026-10-17 17:00:00.000000
+
+A nullable column without default, added without rewriting the operations.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '009_operation_progress'
+down_revision = '008_operations_jsonb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'operations', sa.Column('progress', postgresql.JSONB(), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('operations', 'progress')
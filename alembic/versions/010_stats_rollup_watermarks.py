@@ -0,0 +1,43 @@
+"""Roll up the operation stats asynchronously
+
+Revision ID: 010
+Revises: 009_operation_progress
+Create Date: 2026-10-17 18:00:00.000000
+
+Transitions now only count in the minute buckets, and the hour and day buckets
+are recomputed from them by the `StatsRollupWorkflow`, up to a watermark per
+span. The existing hour and day buckets were maintained with the minute ones, so
+the watermarks start at the current hour and day.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '010_stats_rollup_watermarks'
+down_revision = '009_operation_progress'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'stats_rollup_watermarks',
+        sa.Column(
+            'span_seconds', sa.Integer(), primary_key=True, autoincrement=False
+        ),
+        sa.Column('rolled_up_until', sa.DateTime(), nullable=False),
+    )
+    op.execute(
+        """
+        INSERT INTO stats_rollup_watermarks (span_seconds, rolled_up_until)
+        VALUES
+            (3600, date_trunc('hour', now() AT TIME ZONE 'UTC')),
+            (86400, date_trunc('day', now() AT TIME ZONE 'UTC'))
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('stats_rollup_watermarks')
@@ -0,0 +1,40 @@
+"""Add a DEFAULT partition to the operations
+
+Revision ID: 011
+Revises: 010_stats_rollup_watermarks
+Create Date: 2026-10-17 19:00:00.000000
+
+Operations accepted in a month without a partition (e.g. if the archival
+workflow didn't run for months) were rejected. They now go to the DEFAULT
+partition, and are moved to the partition of their month when it is created
+(see app/archive.py).
+
+Note that since 007, the primary key of the operations is (uuid, accepted_at):
+Postgres can't enforce a unique constraint on a partitioned table without the
+partition key, so the database no longer guarantees that a UUID is unique. UUIDs
+are random (v4) and generated by the API, which is relied upon instead.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '011_operations_default_partition'
+down_revision = '010_stats_rollup_watermarks'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE TABLE operations_default PARTITION OF operations DEFAULT')
+
+
+def downgrade() -> None:
+    # Fails if operations without a monthly partition are left in it
+    op.execute(
+        'DO $$ BEGIN'
+        ' IF EXISTS (SELECT FROM operations_default) THEN'
+        " RAISE EXCEPTION 'operations_default is not empty';"
+        ' END IF; END $$'
+    )
+    op.drop_table('operations_default')
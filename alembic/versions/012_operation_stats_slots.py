@@ -0,0 +1,61 @@
+"""Shard the minute buckets of the operation stats
+
+Revision ID: 012
+Revises: 011_operations_default_partition
+Create Date: 2026-10-17 20:00:00.000000
+
+The minute buckets are upserted in the transactions accepting and transitioning
+operations, and their row locks held until commit: with a single row per (minute,
+op type, status), concurrent transactions counting the same status were
+serialized on it. Each transaction now counts in one of `STATS_SLOTS` slots,
+picked at random, which the rollups and the reads sum over.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '012_operation_stats_slots'
+down_revision = '011_operations_default_partition'
+branch_labels = None
+depends_on = None
+
+
+# Tables -> columns of their key, besides the slot
+TABLES = {
+    'operation_status_counts': ('span_seconds', 'bucket', 'op_type', 'status'),
+    'operation_duration_histograms': (
+        'span_seconds', 'bucket', 'op_type', 'metric', 'bin'
+    ),
+}
+
+
+def upgrade() -> None:
+    for table, keys in TABLES.items():
+        op.add_column(
+            table,
+            sa.Column('slot', sa.SmallInteger(), nullable=False, server_default='0'),
+        )
+        op.drop_constraint(f'{table}_pkey', table, type_='primary')
+        op.create_primary_key(f'{table}_pkey', table, [*keys, 'slot'])
+
+
+def downgrade() -> None:
+    for table, keys in TABLES.items():
+        columns = ', '.join(keys)
+        # Merge the slots of each bucket into slot 0 before dropping them
+        op.execute(
+            f"""
+            WITH merged AS (
+                DELETE FROM {table} WHERE slot <> 0 RETURNING {columns}, count
+            )
+            INSERT INTO {table} ({columns}, slot, count)
+            SELECT {columns}, 0, sum(count) FROM merged GROUP BY {columns}
+            ON CONFLICT ({columns}, slot)
+            DO UPDATE SET count = {table}.count + excluded.count
+            """
+        )
+        op.drop_constraint(f'{table}_pkey', table, type_='primary')
+        op.drop_column(table, 'slot')
+        op.create_primary_key(f'{table}_pkey', table, list(keys))
@@ -1,25 +1,51 @@
+import asyncio
+import time
 import uuid as uuid_lib
-from datetime import datetime
-from typing import List, Optional
-
-from fastapi import Depends, FastAPI, HTTPException, Query
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from temporalio.common import (
-    SearchAttributePair,
-    TypedSearchAttributes,
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import BaseModel, ValidationError, conlist, constr
+from sqlalchemy import ColumnElement, Select, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.archive import find_archived_operation
+from app.cache import OperationCache
+from app.constants import (
+    OPERATION_CACHE_SIZE,
+    OPERATION_CACHE_TTL_SECONDS,
 )
-
-from app.constants import OPERATION_UUID_SEARCH_ATTR, TEMPORAL_TASK_QUEUE
-from app.database import SessionLocal
+from app.database import (
+    DatabaseRole,
+    get_current_lsn,
+    get_sessionmaker,
+    parse_lsn,
+    replica_router,
+)
+from app.database import get_db as open_db
 from app.enums import OperationStatus, OperationType
-from app.models import Operation
+from app.export import export_operations, gzip_stream
+from app.json_filters import parse_json_filter
+from app.metrics import HTTP_REQUEST_DURATION, register_stats, temporal_metrics
+from app.models import Operation, WorkflowOutbox
+from app.notifications import status_listener
+from app.outbox import get_outbox_backlog, outbox_dispatcher
+from app.pagination import encode_cursor, paginate
+from app.serialization import render_operations, select_operation_rows
+from app.stats import (
+    QUEUE_WAIT,
+    RUN_TIME,
+    StatsDelta,
+    get_window_stats,
+    percentile,
+    record_stats,
+)
+from app.transitions import ACTIVE_STATUSES, TERMINAL_STATUSES
 from app.temporal.client import get_temporal_client
 from app.temporal.schedules import setup_schedules
-from app.temporal.workflows.long_running_operation import (
-    LongRunningOperationWorkflow,
-    WorkflowInput,
-)
 
 app = FastAPI(
     title="Long-Running Operations API",
@@ -27,11 +53,30 @@ app = FastAPI(
     version="1.0.0",
 )
 
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Returned by the writes when a replica is configured, to pass to the reads that
+# must see them
+CONSISTENCY_TOKEN_HEADER = "X-Consistency-Token"
+MAX_PAGE_SIZE = 1000
+LONG_POLL_MAX_SECONDS = 60
+MAX_BULK_OPERATIONS = 10000
+# Rows per multi-row INSERT of a bulk submission, keeping its statements well
+# below the 32767 bind parameters limit of Postgres
+BULK_INSERT_CHUNK_SIZE = 2000
+# Interval of the comments keeping idle event streams open through proxies
+SSE_KEEPALIVE_SECONDS = 15
+
 
 class MachineOperationParams(BaseModel):
     timeout: int
 
 
+class OperationProgress(BaseModel):
+    percent: float
+    phase: Optional[str] = None
+    updated_at: str
+
+
 class OperationResponse(BaseModel):
     uuid: str
     workflow_run_id: Optional[str] = None
@@ -43,14 +88,106 @@ class OperationResponse(BaseModel):
     finished_at: Optional[str] = None
     parameters: dict
     result: Optional[dict] = None
+    # Last progress reported while RUNNING, updated at most every
+    # PROGRESS_MIN_INTERVAL_SECONDS. Progress writes aren't notified, so a cached
+    # operation returns it up to OPERATION_CACHE_TTL_SECONDS late
+    progress: Optional[OperationProgress] = None
 
 
 class CreatedOperationResponse(BaseModel):
     uuid: str
 
 
+class BulkOperationItem(BaseModel):
+    machine_id: constr(min_length=1, max_length=6)
+    op: OperationType
+    parameters: MachineOperationParams
+
+
+class BulkOperationsRequest(BaseModel):
+    # `BulkOperationItem`s, validated one by one so that an invalid item doesn't
+    # reject the others
+    items: conlist(Dict[str, Any], min_items=1, max_items=MAX_BULK_OPERATIONS)
+
+
+class BulkOperationResult(BaseModel):
+    machine_id: Optional[str] = None
+    # Set only if the operation has been accepted
+    uuid: Optional[str] = None
+    status: Optional[OperationStatus] = None
+    error: Optional[str] = None
+
+
+class BulkOperationsResponse(BaseModel):
+    accepted: int
+    rejected: int
+    # In the same order as the request items
+    results: List[BulkOperationResult]
+
+
+class DurationStatsResponse(BaseModel):
+    count: int
+    # Upper bounds of the histogram bins holding the percentiles
+    p50_seconds: float
+    p90_seconds: float
+    p99_seconds: float
+
+
+class OpTypeStatsResponse(BaseModel):
+    op_type: str
+    # Operations that moved to each status during the window
+    counts: Dict[str, int]
+    queue_wait: Optional[DurationStatsResponse] = None
+    run_time: Optional[DurationStatsResponse] = None
+
+
+class OperationStatsResponse(BaseModel):
+    since: datetime
+    until: datetime
+    op_types: List[OpTypeStatsResponse]
+
+
+class OutboxResponse(BaseModel):
+    depth: int
+    oldest_age_seconds: float
+    dispatched: int
+    failed_attempts: int
+    abandoned: int
+    last_dispatch_lag_seconds: float
+
+
+operation_cache: OperationCache[OperationResponse] = OperationCache(
+    max_size=OPERATION_CACHE_SIZE, ttl=OPERATION_CACHE_TTL_SECONDS
+)
+
+register_stats("operation_cache", lambda: operation_cache.stats)
+register_stats("outbox", lambda: outbox_dispatcher.stats)
+
+
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Labeled by route template, not by path, to bound the cardinality
+    route = request.scope.get("route")
+    HTTP_REQUEST_DURATION.labels(
+        request.method, route.path if route else "unmatched", response.status_code
+    ).observe(time.perf_counter() - start)
+    return response
+
+
 @app.on_event("startup")
 async def startup_event():
+    # Before connecting, for the client to use the instrumented runtime
+    temporal_metrics.install()
+    temporal_metrics.start()
+
+    status_listener.on_transition(
+        lambda op_uuid, _: operation_cache.invalidate(op_uuid)
+    )
+    status_listener.start()
+    outbox_dispatcher.start()
+
     try:
         client = await get_temporal_client()
         await setup_schedules(client)
@@ -59,38 +196,74 @@ async def startup_event():
         print(f"Could not connect to Temporal: {e}")
 
 
-def get_db():
-    """Duplicate of `get_db` in app/database.py because FastAPI doesn't like `@contextmanager`
-    """
-    db = SessionLocal()
+@app.on_event("shutdown")
+async def shutdown_event():
+    await status_listener.stop()
+    await outbox_dispatcher.stop()
+    await temporal_metrics.stop()
+
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """Session on the primary, for the writes and the reads that must see them."""
+    async with open_db(DatabaseRole.API_WRITE) as db:
+        yield db
+
+
+async def get_read_role(
+    consistency_token: Optional[str] = Header(
+        None,
+        alias=CONSISTENCY_TOKEN_HEADER,
+        description=f"`{CONSISTENCY_TOKEN_HEADER}` header of a previous write, to"
+        " read its effects",
+    ),
+) -> DatabaseRole:
     try:
+        min_lsn = parse_lsn(consistency_token) if consistency_token else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid consistency token")
+    return await replica_router.read_role(min_lsn)
+
+
+async def get_read_db(
+    role: DatabaseRole = Depends(get_read_role),
+) -> AsyncIterator[AsyncSession]:
+    """Session on the replica if any, unless it lags (see `ReplicaRouter`)."""
+    async with open_db(role) as db:
         yield db
-        db.commit()
-    except Exception:
-        db.rollback()
-        raise
-    finally:
-        db.close()
+
+
+async def set_consistency_token(db: AsyncSession, response: Response) -> None:
+    """Let the client read what it has just committed, even from the replica."""
+    if replica_router.enabled:
+        response.headers[CONSISTENCY_TOKEN_HEADER] = await get_current_lsn(db)
+
 
 @app.get("/")
 async def root():
     return { "status": "healthy" }
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.post(
     "/machines/{machine_id}", response_model=CreatedOperationResponse, status_code=201
 )
 async def do_operation_on_machine(
     machine_id: str,
     parameters: MachineOperationParams,
+    response: Response,
     op: OperationType = Query(..., description="Type of operation to perform"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ) -> CreatedOperationResponse:
     """
     Start a new long-running operation on a specific machine.
 
-    Creates a new operation record in the database and starts a Temporal workflow.
-    Returns the operation UUID for tracking.
+    Creates a new operation record in the database, along with the outbox entry
+    from which its Temporal workflow is started, and counts its acceptance in the
+    stats. Returns the operation UUID for tracking as soon as all are committed.
 
     Args:
         machine_id: The ID of the machine to perform the operation on
@@ -109,60 +282,489 @@ async def do_operation_on_machine(
     )
 
     db.add(db_operation)
+    db.add(WorkflowOutbox(operation_uuid=op_uuid, created_at=db_operation.accepted_at))
 
-    try:
-        client = await get_temporal_client()
+    accepted = StatsDelta()
+    accepted.count(db_operation.accepted_at, op, OperationStatus.ACCEPTED)
+    await record_stats(db, accepted)
+
+    await db.commit()
+    outbox_dispatcher.wake_up()
+    await set_consistency_token(db, response)
+
+    return CreatedOperationResponse(uuid=str(db_operation.uuid))
+
+
+@app.post(
+    "/operations/batch", response_model=BulkOperationsResponse, status_code=201
+)
+async def do_bulk_operations(
+    request: BulkOperationsRequest,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+) -> BulkOperationsResponse:
+    """
+    Start a long-running operation on each of the given machines.
 
-        workflow_id = f"{machine_id}-{op}-{op_uuid}"
-        workflow_input = WorkflowInput(timeout=parameters.timeout)
-
-        await client.start_workflow(
-            LongRunningOperationWorkflow.run,
-            workflow_input,
-            id=workflow_id,
-            task_queue=TEMPORAL_TASK_QUEUE,
-            search_attributes=TypedSearchAttributes(
-                [
-                    SearchAttributePair(OPERATION_UUID_SEARCH_ATTR, str(op_uuid)),
-                ]
-            ),
+    Each item gets its own result: invalid items are reported with an error,
+    without rejecting the others. The operation records and outbox entries of the
+    valid ones are inserted with multi-row INSERTs of up to
+    `BULK_INSERT_CHUNK_SIZE` rows, in a single transaction, and their workflows
+    are then started in batches by the outbox dispatcher.
+    """
+    accepted_at = datetime.utcnow()
+    results: List[BulkOperationResult] = []
+    items: Dict[uuid_lib.UUID, BulkOperationItem] = {}
+    for raw_item in request.items:
+        machine_id = raw_item.get("machine_id")
+        try:
+            item = BulkOperationItem.parse_obj(raw_item)
+        except ValidationError as e:
+            results.append(
+                BulkOperationResult(
+                    machine_id=machine_id if isinstance(machine_id, str) else None,
+                    error="; ".join(
+                        f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+                        for error in e.errors()
+                    ),
+                )
+            )
+            continue
+
+        op_uuid = uuid_lib.uuid4()
+        items[op_uuid] = item
+        results.append(
+            BulkOperationResult(
+                machine_id=item.machine_id,
+                uuid=str(op_uuid),
+                status=OperationStatus.ACCEPTED,
+            )
         )
 
-    except Exception as e:
-        db.delete(db_operation)
-        print(f"Error starting workflow: {e}")
+    if items:
+        # Rows passed to `values()` rather than as executemany parameters, which
+        # the driver would send as one INSERT per row
+        rows = list(items.items())
+        for i in range(0, len(rows), BULK_INSERT_CHUNK_SIZE):
+            chunk = rows[i : i + BULK_INSERT_CHUNK_SIZE]
+            await db.execute(
+                insert(Operation).values(
+                    [
+                        {
+                            "uuid": op_uuid,
+                            "system_id": item.machine_id,
+                            "op_type": item.op,
+                            "status": OperationStatus.ACCEPTED,
+                            "accepted_at": accepted_at,
+                            "parameters": {"timeout": item.parameters.timeout},
+                        }
+                        for op_uuid, item in chunk
+                    ]
+                )
+            )
+            await db.execute(
+                insert(WorkflowOutbox).values(
+                    [
+                        {"operation_uuid": op_uuid, "created_at": accepted_at}
+                        for op_uuid, _ in chunk
+                    ]
+                )
+            )
+
+        accepted = StatsDelta()
+        for item in items.values():
+            accepted.count(accepted_at, item.op, OperationStatus.ACCEPTED)
+        await record_stats(db, accepted)
+
+        await db.commit()
+        outbox_dispatcher.wake_up()
+        await set_consistency_token(db, response)
+
+    return BulkOperationsResponse(
+        accepted=len(items),
+        rejected=len(results) - len(items),
+        results=results,
+    )
 
-    return CreatedOperationResponse(uuid=str(db_operation.uuid))
 
+@app.get("/outbox", response_model=OutboxResponse)
+async def get_outbox(db: AsyncSession = Depends(get_db)) -> OutboxResponse:
+    """Backlog of the workflows to start and stats of this process' dispatcher."""
+    backlog = await get_outbox_backlog(db)
+    stats = outbox_dispatcher.stats
 
-@app.get("/operations/{operation_uuid}", response_model=OperationResponse)
-async def get_operation(
-    operation_uuid: str, db: Session = Depends(get_db)
-) -> OperationResponse:
+    return OutboxResponse(
+        depth=backlog.depth,
+        oldest_age_seconds=backlog.oldest_age_seconds,
+        dispatched=stats.dispatched,
+        failed_attempts=stats.failed_attempts,
+        abandoned=stats.abandoned,
+        last_dispatch_lag_seconds=stats.last_dispatch_lag_seconds,
+    )
+
+
+def as_utc(value: datetime) -> datetime:
+    """Convert to the naive UTC datetimes stored in the database."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+@dataclass
+class OperationFilters:
+    """Filters of the operations lists, as query parameters."""
+
+    status: Optional[OperationStatus] = None
+    system_id: Optional[str] = None
+    op_type: Optional[OperationType] = None
+    # Accepted in [accepted_after, accepted_before), naive times are UTC
+    accepted_after: Optional[datetime] = None
+    accepted_before: Optional[datetime] = None
+
+    def apply(self, query: Select) -> Select:
+        if self.status:
+            query = query.where(Operation.status == self.status)
+        if self.system_id:
+            query = query.where(Operation.system_id == self.system_id)
+        if self.op_type:
+            query = query.where(Operation.op_type == self.op_type)
+        if self.accepted_after:
+            query = query.where(Operation.accepted_at >= as_utc(self.accepted_after))
+        if self.accepted_before:
+            query = query.where(Operation.accepted_at < as_utc(self.accepted_before))
+        return query
+
+
+async def get_json_filters(
+    expressions: List[str] = Query(
+        [],
+        alias="filter",
+        description="Filter on `parameters` or `result`, e.g."
+        " `parameters.timeout>600` or `result.error~timeout`, with the operators"
+        " `=`, `>`, `>=`, `<`, `<=` and `~` (contains). Can be repeated",
+    ),
+) -> List[ColumnElement[bool]]:
+    try:
+        return [parse_json_filter(expression) for expression in expressions]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get(
+    "/operations/export",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
+async def export_operations_ndjson(
+    filters: OperationFilters = Depends(),
+    json_filters: List[ColumnElement[bool]] = Depends(get_json_filters),
+    gzip: bool = Query(False, description="Compress with `Content-Encoding: gzip`"),
+    role: DatabaseRole = Depends(get_read_role),
+) -> StreamingResponse:
+    """
+    Export the operations matching the filters as NDJSON, one `OperationResponse`
+    per line, most recently accepted first.
+
+    The response is streamed, so exports of any size run in constant memory.
+    """
+    query = filters.apply(select_operation_rows()).where(*json_filters)
+    chunks = export_operations(query, role)
+    headers = {}
+    if gzip:
+        chunks = gzip_stream(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        chunks, media_type="application/x-ndjson", headers=headers
+    )
+
+
+def duration_stats(histogram: Dict[int, int]) -> Optional[DurationStatsResponse]:
+    if not histogram:
+        return None
+    return DurationStatsResponse(
+        count=sum(histogram.values()),
+        p50_seconds=percentile(histogram, 0.5),
+        p90_seconds=percentile(histogram, 0.9),
+        p99_seconds=percentile(histogram, 0.99),
+    )
+
+
+@app.get("/operations/stats", response_model=OperationStatsResponse)
+async def get_operations_stats(
+    since: Optional[datetime] = Query(
+        None, description="Defaults to an hour before `until`, naive times are UTC"
+    ),
+    until: Optional[datetime] = Query(
+        None, description="Defaults to now, naive times are UTC"
+    ),
+    op_type: Optional[OperationType] = None,
+    db: AsyncSession = Depends(get_read_db),
+) -> OperationStatsResponse:
+    """
+    Status counts and queue wait and run time percentiles per op type, for the
+    transitions in [since, until) rounded outwards to whole minutes.
+
+    Answered from rollups maintained along with each status transition, so its
+    cost doesn't depend on the number of operations.
+    """
+    until = as_utc(until) if until else datetime.utcnow()
+    since = as_utc(since) if since else until - timedelta(hours=1)
+    if since > until:
+        raise HTTPException(status_code=400, detail="`since` is after `until`")
+
+    stats = await get_window_stats(db, since, until, op_type)
+
+    op_types = []
+    for stats_op_type in sorted(stats.counts.keys() | stats.histograms.keys()):
+        histograms = stats.histograms.get(stats_op_type, {})
+        op_types.append(
+            OpTypeStatsResponse(
+                op_type=stats_op_type,
+                counts=stats.counts.get(stats_op_type, {}),
+                queue_wait=duration_stats(histograms.get(QUEUE_WAIT, {})),
+                run_time=duration_stats(histograms.get(RUN_TIME, {})),
+            )
+        )
+
+    return OperationStatsResponse(
+        since=stats.since, until=stats.until, op_types=op_types
+    )
+
+
+def parse_operation_uuid(operation_uuid: str) -> uuid_lib.UUID:
     try:
-        op_uuid = uuid_lib.UUID(operation_uuid)
+        return uuid_lib.UUID(operation_uuid)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid UUID format")
 
-    operation = db.query(Operation).filter(Operation.uuid == op_uuid).first()
 
-    if not operation:
+async def load_operation(
+    db: AsyncSession, op_uuid: uuid_lib.UUID, use_cache: bool = True
+) -> OperationResponse:
+    """
+    Read an operation, from the cache if `use_cache`. The operation read is
+    cached either way.
+    """
+    if use_cache:
+        cached = operation_cache.get(str(op_uuid))
+        if cached is not None:
+            return cached
+
+    # `populate_existing` because the session may be reused after a transition
+    operation = await db.scalar(
+        select(Operation)
+        .where(Operation.uuid == op_uuid)
+        .execution_options(populate_existing=True)
+    )
+
+    if operation:
+        response = OperationResponse(**operation.to_dict())
+        operation_cache.put(str(op_uuid), operation.status, response)
+        return response
+
+    # Only looked up after the partitions, archived operations being the oldest
+    # ones
+    archived = await find_archived_operation(db, op_uuid)
+    if not archived:
         raise HTTPException(status_code=404, detail="Operation not found")
 
-    return OperationResponse(**operation.to_dict())
+    response = OperationResponse(**archived)
+    operation_cache.put(str(op_uuid), response.status, response)
+    return response
+
+
+@app.get("/operations/{operation_uuid}", response_model=OperationResponse)
+async def get_operation(
+    operation_uuid: str,
+    wait: Optional[str] = Query(
+        None,
+        regex=r"^\d+s?$",
+        description=(
+            "Long-poll: wait up to this duration (e.g. `30s`, at most"
+            f" {LONG_POLL_MAX_SECONDS}s) for the status of a not finished"
+            " operation to change before responding"
+        ),
+    ),
+    db: AsyncSession = Depends(get_read_db),
+) -> OperationResponse:
+    """
+    Get an operation, possibly waiting for the next change of its status.
+
+    Its `progress` is written at most every `PROGRESS_MIN_INTERVAL_SECONDS`
+    while it runs, and may be returned up to `OPERATION_CACHE_TTL_SECONDS` later
+    than written: progress writes don't invalidate the cached operations, and
+    don't wake up the waiting requests, unlike the status transitions.
+    """
+    op_uuid = parse_operation_uuid(operation_uuid)
+
+    if not wait:
+        return await load_operation(db, op_uuid)
+
+    timeout = min(int(wait.rstrip("s")), LONG_POLL_MAX_SECONDS)
+
+    # Read from the primary, as the replica may not have replayed yet the
+    # transitions notified by it, and bypassing the cache, which may hold a status
+    # older than the subscription: a transition notified before it would never
+    # wake up the request
+    async with open_db(DatabaseRole.API_WRITE) as db:
+        # Subscribe before reading the operation to not miss any transition
+        with status_listener.subscribe(str(op_uuid)) as transitions:
+            operation = await load_operation(db, op_uuid, use_cache=False)
+            if operation.status in TERMINAL_STATUSES:
+                return operation
+
+            # Give the connection back to the pool while waiting
+            await db.commit()
+
+            try:
+                await asyncio.wait_for(transitions.get(), timeout)
+            except asyncio.TimeoutError:
+                return operation
+
+        return await load_operation(db, op_uuid, use_cache=False)
+
+
+@app.get("/operations/{operation_uuid}/events")
+async def stream_operation_events(operation_uuid: str) -> StreamingResponse:
+    """
+    Stream the status of an operation as Server-Sent Events.
+
+    A `status` event with the operation is sent right away and on every
+    transition, until the operation is finished. The operation is read from the
+    primary, which notifies the transitions, without going through the cache.
+    """
+    op_uuid = parse_operation_uuid(operation_uuid)
+
+    # Fail with a 404 before starting the stream
+    async with get_sessionmaker(DatabaseRole.API_WRITE)() as db:
+        await load_operation(db, op_uuid)
+
+    return StreamingResponse(
+        operation_events(op_uuid),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+async def operation_events(op_uuid: uuid_lib.UUID) -> AsyncIterator[str]:
+    # Read like the long-poll, from the primary and bypassing the cache
+    with status_listener.subscribe(str(op_uuid)) as transitions:
+        async with get_sessionmaker(DatabaseRole.API_WRITE)() as db:
+            operation = await load_operation(db, op_uuid, use_cache=False)
+        yield f"event: status\ndata: {operation.json()}\n\n"
+
+        while operation.status not in TERMINAL_STATUSES:
+            try:
+                await asyncio.wait_for(transitions.get(), SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+
+            previous_status = operation.status
+            async with get_sessionmaker(DatabaseRole.API_WRITE)() as db:
+                operation = await load_operation(db, op_uuid, use_cache=False)
+            if operation.status != previous_status:
+                yield f"event: status\ndata: {operation.json()}\n\n"
 
 
 @app.get("/operations", response_model=List[OperationResponse])
 async def list_operations(
+    filters: OperationFilters = Depends(),
+    json_filters: List[ColumnElement[bool]] = Depends(get_json_filters),
+    cursor: Optional[str] = Query(
+        None, description="`X-Next-Cursor` header of the previous page"
+    ),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    """
+    List operations, most recently accepted first.
+
+    Results are paginated with an opaque cursor: when more operations are
+    available, the `X-Next-Cursor` response header contains the cursor to pass to
+    get the next page.
+
+    `filter` query parameters filter on the JSON `parameters` and `result` of the
+    operations, e.g. `?status=FAILED&filter=result.error~timeout` or
+    `?op_type=DEPLOY&filter=parameters.timeout>600`.
+    """
+    return await fetch_page(
+        db,
+        filters.apply(select_operation_rows()).where(*json_filters),
+        cursor,
+        limit,
+    )
+
+
+@app.get(
+    "/machines/{machine_id}/operations", response_model=List[OperationResponse]
+)
+async def list_machine_operations(
+    machine_id: str,
     status: Optional[OperationStatus] = None,
-    limit: int = 100,
-    db: Session = Depends(get_db),
-) -> List[OperationResponse]:
-    query = db.query(Operation)
+    cursor: Optional[str] = Query(
+        None, description="`X-Next-Cursor` header of the previous page"
+    ),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    """
+    List the operations of a machine, most recently accepted first.
+
+    Paginated like `GET /operations`.
+    """
+    filters = OperationFilters(status=status, system_id=machine_id)
+    return await fetch_page(
+        db, filters.apply(select_operation_rows()), cursor, limit
+    )
+
+
+@app.get(
+    "/machines/{machine_id}/operations/active", response_model=OperationResponse
+)
+async def get_machine_active_operation(
+    machine_id: str, db: AsyncSession = Depends(get_read_db)
+) -> OperationResponse:
+    """Get the most recently accepted operation of a machine that isn't finished."""
+    operation = await db.scalar(
+        select(Operation)
+        .where(
+            Operation.system_id == machine_id,
+            Operation.status.in_(sorted(ACTIVE_STATUSES)),
+        )
+        .order_by(Operation.accepted_at.desc())
+        .limit(1)
+    )
 
-    if status:
-        query = query.filter(Operation.status == status)
+    if not operation:
+        raise HTTPException(status_code=404, detail="No active operation")
 
-    operations = query.order_by(Operation.accepted_at.desc()).limit(limit).all()
+    return OperationResponse(**operation.to_dict())
 
-    return [OperationResponse(**op.to_dict()) for op in operations]
+
+async def fetch_page(
+    db: AsyncSession,
+    query: Select,
+    cursor: Optional[str],
+    limit: int,
+) -> Response:
+    """
+    Fetch a page of operations, setting the cursor of the next one if any.
+
+    `query` must select the `select_operation_rows` columns: the page is rendered
+    straight to JSON, `response_model` only documents it.
+    """
+    try:
+        query = paginate(query, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    rows = (await db.execute(query)).all()
+
+    headers = {}
+    if len(rows) == limit:
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1].accepted_at, rows[-1].uuid)
+
+    return Response(
+        content=render_operations(rows), media_type="application/json", headers=headers
+    )
@@ -0,0 +1,233 @@
+"""
+Monthly partitions of the operations and their archive.
+
+`operations` is range-partitioned by `accepted_at`, with one partition per month
+named `operations_YYYY_MM`. Partitions are created ahead of time, so that the
+operations accepted this month and the next ones always have one. Operations
+without a partition for their month (e.g. if the archival workflow didn't run
+for months) go to the DEFAULT partition `operations_default` instead of failing,
+and are moved to the partition of their month when it is created.
+
+Once all the operations of an old month are finished, its partition is moved to
+the archive: its operations, sorted by UUID, are stored as gzipped NDJSON in
+chunks (`OperationArchiveChunk`) covering disjoint UUID ranges, and the
+partition is dropped. Scans, indexes and vacuums of `operations` then only deal
+with the recent months, while an archived operation is still found by UUID with
+one index probe per archived month.
+"""
+
+import gzip
+import re
+import uuid
+from datetime import date, datetime, time
+from typing import Callable, List, Optional
+
+import orjson
+from sqlalchemy import exists, func, select, text, true
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.constants import OPERATIONS_ARCHIVE_CHUNK_SIZE, STREAM_BATCH_SIZE
+from app.models import Operation, OperationArchive, OperationArchiveChunk
+from app.serialization import render_operation_lines, select_operation_rows
+from app.transitions import ACTIVE_STATUSES
+
+_PARTITION_NAME = re.compile(r"^operations_(\d{4})_(\d{2})$")
+DEFAULT_PARTITION = "operations_default"
+
+# Creating or dropping a partition locks the whole `operations` table: rather
+# than queueing behind long queries, and blocking every query queued after it,
+# give up and let the activity retry
+PARTITION_LOCK_TIMEOUT = "5s"
+_lock_timeout_statement = text(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'")
+
+
+def month_of(value: datetime) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"operations_{month:%Y_%m}"
+
+
+async def list_partitions(db: AsyncSession) -> List[date]:
+    """Months of the existing partitions, in order."""
+    names = await db.scalars(
+        text(
+            "SELECT child.relname FROM pg_inherits"
+            " JOIN pg_class parent ON parent.oid = pg_inherits.inhparent"
+            " JOIN pg_class child ON child.oid = pg_inherits.inhrelid"
+            " WHERE parent.relname = 'operations'"
+        )
+    )
+    months = []
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            months.append(date(int(match[1]), int(match[2]), 1))
+    return sorted(months)
+
+
+async def create_partitions(
+    db: AsyncSession, first_month: date, last_month: date
+) -> List[date]:
+    """
+    Create the missing partitions from `first_month` to `last_month` included.
+
+    A partition can't be added while the DEFAULT partition holds rows of its
+    range: each one is created detached, filled with these rows, which are
+    deleted from the DEFAULT partition, and then attached.
+    """
+    existing = set(await list_partitions(db))
+    created = []
+    month = first_month
+    while month <= last_month:
+        if month not in existing:
+            name = partition_name(month)
+            start, end = month, add_months(month, 1)
+            await db.execute(_lock_timeout_statement)
+            await db.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {name}"
+                    " (LIKE operations INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+                )
+            )
+            await db.execute(
+                text(
+                    f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION}"
+                    f" WHERE accepted_at >= '{start}' AND accepted_at < '{end}'"
+                    f" RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+                )
+            )
+            await db.execute(
+                text(
+                    f"ALTER TABLE operations ATTACH PARTITION {name}"
+                    f" FOR VALUES FROM ('{start}') TO ('{end}')"
+                )
+            )
+            created.append(month)
+        month = add_months(month, 1)
+    return created
+
+
+async def count_default_partition_rows(db: AsyncSession) -> int:
+    """Operations in the DEFAULT partition, i.e. without a partition for their month."""
+    return await db.scalar(text(f"SELECT count(*) FROM {DEFAULT_PARTITION}"))
+
+
+def _in_month(query, month: date):
+    # Pruned to the partition of the month
+    return query.where(
+        Operation.accepted_at >= datetime.combine(month, time()),
+        Operation.accepted_at < datetime.combine(add_months(month, 1), time()),
+    )
+
+
+async def has_active_operations(db: AsyncSession, month: date) -> bool:
+    return await db.scalar(
+        select(
+            exists(
+                _in_month(select(Operation.uuid), month).where(
+                    Operation.status.in_(sorted(ACTIVE_STATUSES))
+                )
+            )
+        )
+    )
+
+
+async def copy_to_archive(
+    db: AsyncSession,
+    month: date,
+    chunk_size: int = OPERATIONS_ARCHIVE_CHUNK_SIZE,
+    on_chunk: Optional[Callable[[int], None]] = None,
+) -> int:
+    """
+    Copy the operations of a month to the archive, returning how many there are.
+
+    Rows are streamed in UUID order through a server-side cursor, so memory only
+    depends on `chunk_size`. `on_chunk` is called with the number of operations
+    copied so far after each chunk, e.g. to heartbeat.
+    """
+    result = await db.stream(
+        _in_month(select_operation_rows(), month)
+        .order_by(Operation.uuid)
+        .execution_options(yield_per=STREAM_BATCH_SIZE)
+    )
+    copied = 0
+    async for rows in result.partitions(chunk_size):
+        db.add(
+            OperationArchiveChunk(
+                month=month,
+                min_uuid=rows[0].uuid,
+                max_uuid=rows[-1].uuid,
+                operations=len(rows),
+                data=gzip.compress(render_operation_lines(rows)),
+            )
+        )
+        copied += len(rows)
+        # Keeps at most one chunk in the session
+        await db.flush()
+        db.expunge_all()
+        if on_chunk:
+            on_chunk(copied)
+
+    db.add(OperationArchive(month=month, operations=copied))
+    return copied
+
+
+async def drop_partition(db: AsyncSession, month: date) -> None:
+    """Drop the partition of an archived month, checking that it's all archived."""
+    archived = await db.scalar(
+        select(OperationArchive.operations).where(OperationArchive.month == month)
+    )
+    if archived is None:
+        raise ValueError(f"{partition_name(month)} isn't archived")
+
+    count = await db.scalar(_in_month(select(func.count()), month))
+    if count != archived:
+        raise ValueError(
+            f"{partition_name(month)} has {count} operations, {archived} archived"
+        )
+
+    await db.execute(_lock_timeout_statement)
+    await db.execute(text(f"DROP TABLE IF EXISTS {partition_name(month)}"))
+
+
+async def find_archived_operation(
+    db: AsyncSession, op_uuid: uuid.UUID
+) -> Optional[dict]:
+    """
+    Find an archived operation, as the fields of an `OperationResponse`.
+
+    For each archived month, the only chunk whose UUID range may hold the
+    operation is found with an index probe, and then decompressed.
+    """
+    chunk = (
+        select(OperationArchiveChunk.max_uuid, OperationArchiveChunk.data)
+        .where(
+            OperationArchiveChunk.month == OperationArchive.month,
+            OperationArchiveChunk.min_uuid <= op_uuid,
+        )
+        .order_by(OperationArchiveChunk.min_uuid.desc())
+        .limit(1)
+        .lateral()
+    )
+    chunks = await db.scalars(
+        select(chunk.c.data)
+        .select_from(OperationArchive)
+        .join(chunk, true())
+        .where(chunk.c.max_uuid >= op_uuid)
+    )
+
+    # Lines start with the UUID, see `OPERATION_RESPONSE_COLUMNS`
+    prefix = b'{"uuid":"%s"' % str(op_uuid).encode()
+    for data in chunks:
+        lines = gzip.decompress(data)
+        start = lines.find(prefix)
+        if start != -1:
+            return orjson.loads(lines[start : lines.index(b"\n", start)])
+    return None
@@ -0,0 +1,76 @@
+"""In-process cache of the operations served by the API."""
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Generic, Optional, Tuple, TypeVar
+
+from app.enums import OperationStatus
+from app.transitions import TERMINAL_STATUSES
+
+T = TypeVar("T")
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class OperationCache(Generic[T]):
+    """
+    LRU cache of operations keyed by UUID.
+
+    Operations in a terminal status never change, so they are kept until evicted
+    by the LRU policy. Other operations expire after `ttl` seconds, bounding how
+    stale a cached status can be. A `max_size` of 0 disables the cache.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self._max_size = max_size
+        self._ttl = ttl
+        # UUID -> (value, expiration time, None if it never expires)
+        self._entries: OrderedDict[str, Tuple[T, Optional[float]]] = OrderedDict()
+        self.stats = CacheStats()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, op_uuid: str) -> Optional[T]:
+        entry = self._entries.get(op_uuid)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[op_uuid]
+            self.stats.misses += 1
+            return None
+
+        self._entries.move_to_end(op_uuid)
+        self.stats.hits += 1
+        return value
+
+    def put(self, op_uuid: str, status: OperationStatus, value: T) -> None:
+        if self._max_size <= 0:
+            return
+
+        expires_at = None
+        if status not in TERMINAL_STATUSES:
+            expires_at = time.monotonic() + self._ttl
+
+        self._entries[op_uuid] = (value, expires_at)
+        self._entries.move_to_end(op_uuid)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def invalidate(self, op_uuid: str) -> None:
+        self._entries.pop(op_uuid, None)
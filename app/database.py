@@ -1,25 +1,310 @@
-from contextlib import contextmanager
-from typing import Generator
+"""
+Database engines and sessions.
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
+Each role gets its own engine, so that its connection pool is sized and timed out
+for its workload and can't be exhausted by the others: heavy list and export
+traffic of the API doesn't delay its writes, nor the status writes of the worker.
 
-from app.constants import DATABASE_URL
+`API_READ` engines connect to ASYNC_REPLICA_DATABASE_URL when it's set, the
+other ones always to the primary. Engines are created on first use, so a process
+only opens the pools of the roles it uses.
+"""
 
+import asyncio
+import enum
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncGenerator, Dict, Optional
 
-engine = create_engine(DATABASE_URL)
+from sqlalchemy import Text, cast, event, func, select, text
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+from app.constants import (
+    ASYNC_DATABASE_URL,
+    ASYNC_REPLICA_DATABASE_URL,
+    DB_API_READ_MAX_OVERFLOW,
+    DB_API_READ_POOL_PRE_PING,
+    DB_API_READ_POOL_SIZE,
+    DB_API_READ_POOL_TIMEOUT,
+    DB_API_WRITE_MAX_OVERFLOW,
+    DB_API_WRITE_POOL_PRE_PING,
+    DB_API_WRITE_POOL_SIZE,
+    DB_API_WRITE_POOL_TIMEOUT,
+    DB_RECONCILIATION_MAX_OVERFLOW,
+    DB_RECONCILIATION_POOL_PRE_PING,
+    DB_RECONCILIATION_POOL_SIZE,
+    DB_RECONCILIATION_POOL_TIMEOUT,
+    DB_WORKER_WRITE_MAX_OVERFLOW,
+    DB_WORKER_WRITE_POOL_PRE_PING,
+    DB_WORKER_WRITE_POOL_SIZE,
+    DB_WORKER_WRITE_POOL_TIMEOUT,
+    REPLICA_MAX_LAG_SECONDS,
+)
+from app.metrics import (
+    DB_POOL_CHECKOUT_WAIT,
+    DB_QUERY_DURATION,
+    DB_SESSION_DURATION,
+    REPLICA_FALLBACKS,
+    REPLICA_LAG,
+    register_stats,
+    timed,
+)
 
+logger = logging.getLogger(__name__)
 
-@contextmanager
-def get_db() -> Generator[Session, None, None]:
-    db = SessionLocal()
+
+class DatabaseRole(enum.StrEnum):
+    # Read-only endpoints of the API, possibly served by the replica
+    API_READ = "api_read"
+    # Writes of the API, and its reads that must see the latest writes
+    API_WRITE = "api_write"
+    # Status transitions written by the worker
+    WORKER_WRITE = "worker_write"
+    # Scans and fixes of the reconciliation, the archival and the stats rollups
+    RECONCILIATION = "reconciliation"
+
+
+@dataclass(frozen=True)
+class PoolSettings:
+    size: int
+    max_overflow: int
+    timeout: float
+    pre_ping: bool
+
+
+POOL_SETTINGS: Dict[DatabaseRole, PoolSettings] = {
+    DatabaseRole.API_READ: PoolSettings(
+        DB_API_READ_POOL_SIZE,
+        DB_API_READ_MAX_OVERFLOW,
+        DB_API_READ_POOL_TIMEOUT,
+        DB_API_READ_POOL_PRE_PING,
+    ),
+    DatabaseRole.API_WRITE: PoolSettings(
+        DB_API_WRITE_POOL_SIZE,
+        DB_API_WRITE_MAX_OVERFLOW,
+        DB_API_WRITE_POOL_TIMEOUT,
+        DB_API_WRITE_POOL_PRE_PING,
+    ),
+    DatabaseRole.WORKER_WRITE: PoolSettings(
+        DB_WORKER_WRITE_POOL_SIZE,
+        DB_WORKER_WRITE_MAX_OVERFLOW,
+        DB_WORKER_WRITE_POOL_TIMEOUT,
+        DB_WORKER_WRITE_POOL_PRE_PING,
+    ),
+    DatabaseRole.RECONCILIATION: PoolSettings(
+        DB_RECONCILIATION_POOL_SIZE,
+        DB_RECONCILIATION_MAX_OVERFLOW,
+        DB_RECONCILIATION_POOL_TIMEOUT,
+        DB_RECONCILIATION_POOL_PRE_PING,
+    ),
+}
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Records the time spent waiting for a connection, labeled by role."""
+
+    def _do_get(self):
+        # The logging name is the role, and is kept when the pool is recreated
+        with timed(DB_POOL_CHECKOUT_WAIT.labels(self._orig_logging_name)):
+            return super()._do_get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.query_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Labeled by verb only (SELECT, UPDATE...) to bound the cardinality
+    DB_QUERY_DURATION.labels(statement.split(None, 1)[0].upper()).observe(
+        time.perf_counter() - context.query_started_at
+    )
+
+
+def _create_engine(role: DatabaseRole) -> AsyncEngine:
+    url = ASYNC_DATABASE_URL
+    if role == DatabaseRole.API_READ and ASYNC_REPLICA_DATABASE_URL:
+        url = ASYNC_REPLICA_DATABASE_URL
+
+    settings = POOL_SETTINGS[role]
+    engine = create_async_engine(
+        url,
+        poolclass=InstrumentedPool,
+        pool_size=settings.size,
+        max_overflow=settings.max_overflow,
+        pool_timeout=settings.timeout,
+        pool_pre_ping=settings.pre_ping,
+        pool_logging_name=str(role),
+    )
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    return engine
+
+
+_engines: Dict[DatabaseRole, AsyncEngine] = {}
+_sessionmakers: Dict[DatabaseRole, async_sessionmaker[AsyncSession]] = {}
+
+
+def get_engine(role: DatabaseRole) -> AsyncEngine:
+    if role not in _engines:
+        _engines[role] = _create_engine(role)
+    return _engines[role]
+
+
+def get_sessionmaker(role: DatabaseRole) -> async_sessionmaker[AsyncSession]:
+    if role not in _sessionmakers:
+        _sessionmakers[role] = async_sessionmaker(
+            bind=get_engine(role), autoflush=False, expire_on_commit=False
+        )
+    return _sessionmakers[role]
+
+
+async def dispose_engines() -> None:
+    for engine in _engines.values():
+        await engine.dispose()
+
+
+@dataclass
+class PoolStats:
+    # Connections kept open by the pool, whether in use or not
+    size: int
+    checked_out: int
+    idle: int
+    # Connections opened above `size`
+    overflow: int
+    max_connections: int
+
+
+def pool_stats() -> Dict[str, PoolStats]:
+    stats = {}
+    for role, engine in _engines.items():
+        pool = engine.pool
+        settings = POOL_SETTINGS[role]
+        stats[str(role)] = PoolStats(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            idle=pool.checkedin(),
+            overflow=max(0, pool.overflow()),
+            max_connections=settings.size + settings.max_overflow,
+        )
+    return stats
+
+
+register_stats("db_pool", pool_stats, label="role")
+
+
+@asynccontextmanager
+async def get_db(
+    role: DatabaseRole = DatabaseRole.API_WRITE,
+) -> AsyncGenerator[AsyncSession, None]:
+    db = get_sessionmaker(role)()
     try:
-        yield db
-        db.commit()
+        with timed(DB_SESSION_DURATION):
+            yield db
+            await db.commit()
     except Exception:
-        db.rollback()
+        await db.rollback()
         raise
     finally:
-        db.close()
+        await db.close()
+
+
+def parse_lsn(lsn: str) -> int:
+    """Parse a Postgres WAL location (e.g. `16/B374D848`) into a comparable int."""
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+async def get_current_lsn(db: AsyncSession) -> str:
+    """WAL location of the primary, i.e. after all the committed transactions."""
+    return await db.scalar(select(cast(func.pg_current_wal_lsn(), Text)))
+
+
+# On an idle primary the last replayed transaction gets old without the replica
+# lagging, hence the comparison of the received and replayed locations first.
+# Both locations are NULL when the "replica" is actually a primary
+_replica_status_statement = text(
+    """
+    SELECT
+        pg_last_wal_replay_lsn()::text AS replayed_lsn,
+        CASE
+            WHEN pg_last_wal_receive_lsn() IS NULL
+                OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+            THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+        END AS lag_seconds
+    """
+)
+
+
+class ReplicaRouter:
+    """
+    Picks the role of the read-only requests: `API_READ` (the replica) when it's
+    caught up, `API_WRITE` (the primary) otherwise.
+
+    The replication lag and replayed WAL location are checked at most every
+    `check_interval` seconds. A client that needs to read its own writes passes
+    the WAL location returned by the primary after them: until the replica has
+    replayed it, its reads go to the primary. Concurrent requests share the same
+    check, and a replica that can't be checked is considered lagging.
+
+    Without a replica, `API_READ` is always used, as it connects to the primary.
+    """
+
+    def __init__(
+        self,
+        max_lag_seconds: float = REPLICA_MAX_LAG_SECONDS,
+        check_interval: float = 1.0,
+    ) -> None:
+        self.enabled = ASYNC_REPLICA_DATABASE_URL is not None
+        self._max_lag_seconds = max_lag_seconds
+        self._check_interval = check_interval
+        self._lag_seconds = float("inf")
+        self._replayed_lsn = 0
+        self._checked_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    async def _check(self) -> None:
+        try:
+            async with get_db(DatabaseRole.API_READ) as db:
+                status = (await db.execute(_replica_status_statement)).one()
+        except Exception as e:
+            logger.error(f"Error checking the replica: {e}")
+            self._lag_seconds = float("inf")
+        else:
+            self._lag_seconds = float(status.lag_seconds)
+            self._replayed_lsn = (
+                parse_lsn(status.replayed_lsn) if status.replayed_lsn else 2**64
+            )
+        REPLICA_LAG.set(self._lag_seconds)
+        self._checked_at = time.monotonic()
+
+    async def read_role(self, min_lsn: Optional[int] = None) -> DatabaseRole:
+        if not self.enabled:
+            return DatabaseRole.API_READ
+
+        requested_at = time.monotonic()
+        behind = min_lsn is not None and min_lsn > self._replayed_lsn
+        if behind or requested_at - self._checked_at > self._check_interval:
+            async with self._lock:
+                # Unless another request checked meanwhile
+                if self._checked_at < requested_at:
+                    await self._check()
+
+        if self._lag_seconds > self._max_lag_seconds:
+            REPLICA_FALLBACKS.labels("lag").inc()
+            return DatabaseRole.API_WRITE
+        if min_lsn is not None and min_lsn > self._replayed_lsn:
+            REPLICA_FALLBACKS.labels("consistency_token").inc()
+            return DatabaseRole.API_WRITE
+        return DatabaseRole.API_READ
+
+
+replica_router = ReplicaRouter()
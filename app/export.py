@@ -0,0 +1,55 @@
+"""Streaming NDJSON export of operations."""
+
+import zlib
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import Select
+
+from app.constants import EXPORT_CHUNK_SIZE, STREAM_BATCH_SIZE
+from app.database import DatabaseRole, get_db
+from app.pagination import encode_cursor, paginate
+from app.serialization import render_operation_lines
+
+
+async def export_operations(
+    query: Select,
+    role: DatabaseRole = DatabaseRole.API_READ,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> AsyncIterator[bytes]:
+    """
+    Stream the operations of `query` as NDJSON, most recently accepted first.
+
+    `query` must select the `select_operation_rows` columns. Operations are read
+    through a server-side cursor, `STREAM_BATCH_SIZE` rows at a time, so memory
+    doesn't depend on the size of the export. The export is split in chunks of
+    `chunk_size` operations, each read in its own short transaction and resumed
+    from the previous one with a keyset cursor, so no snapshot is held for the
+    whole export. Operations accepted during the export are not included.
+
+    All the chunks are read with the engine of `role`, e.g. from the replica.
+    """
+    cursor: Optional[str] = None
+    while True:
+        count = 0
+        async with get_db(role) as db:
+            result = await db.stream(
+                paginate(query, cursor, chunk_size).execution_options(
+                    yield_per=STREAM_BATCH_SIZE
+                )
+            )
+            async for rows in result.partitions():
+                count += len(rows)
+                cursor = encode_cursor(rows[-1].accepted_at, rows[-1].uuid)
+                yield render_operation_lines(rows)
+
+        if count < chunk_size:
+            return
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
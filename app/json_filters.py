@@ -0,0 +1,107 @@
+"""
+Filters on the JSONB `parameters` and `result` of the operations.
+
+A filter is `<column>.<key>[.<key>...]<operator><value>`, e.g.
+`parameters.timeout>600` or `result.error~timeout`, turned into an operator that
+the indexes of app/models.py can serve:
+
+- `=`: equality with the value parsed as JSON (`600`, `true`, `"600"`), or as a
+  string if it isn't valid JSON. Turned into a containment
+  (`parameters @> '{"timeout": 600}'`), served by the GIN index of the column
+- `>`, `>=`, `<`, `<=`: comparison with a number
+  (`parameters -> 'timeout' > '600'`), served by the expression index of the key
+  if it has one (`parameters.timeout`)
+- `~`: case-insensitive substring (`result ->> 'error' ILIKE '%timeout%'`),
+  served by the trigram index of the key if it has one (`result.error`)
+"""
+
+import json
+import math
+import re
+from typing import Any, List, Union
+
+from sqlalchemy import ColumnElement, and_, func, literal
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.models import Operation
+
+COLUMNS = {"parameters": Operation.parameters, "result": Operation.result}
+
+_FILTER = re.compile(
+    r"^(?P<column>parameters|result)(?P<path>(?:\.[\w-]+)+)"
+    r"(?P<operator>>=|<=|=|>|<|~)(?P<value>.*)$",
+    re.DOTALL,
+)
+
+_COMPARISONS = {
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+}
+
+
+def _key(key: str) -> ColumnElement:
+    # Rendered inline instead of as a bound parameter, so that the expression
+    # matches the ones of the indexes
+    return literal(key, literal_execute=True)
+
+
+def _element(column: ColumnElement, path: List[str], as_text: bool) -> ColumnElement:
+    """`column -> 'a' -> 'b'`, ending with `->> 'b'` if `as_text`."""
+    for key in path[:-1]:
+        column = column.op("->", return_type=JSONB)(_key(key))
+    if as_text:
+        return column.op("->>")(_key(path[-1]))
+    return column.op("->", return_type=JSONB)(_key(path[-1]))
+
+
+def _number(value: str) -> Union[int, float]:
+    try:
+        return int(value)
+    except ValueError:
+        number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"{value} isn't a finite number")
+    return number
+
+
+def _escape_like(value: str) -> str:
+    # Backslash is the default escape character of LIKE patterns in Postgres
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def parse_json_filter(expression: str) -> ColumnElement[bool]:
+    """Raises `ValueError` if the filter is malformed."""
+    match = _FILTER.match(expression)
+    if not match:
+        raise ValueError(
+            f"Invalid filter {expression!r}, expected e.g. `parameters.timeout>600`"
+        )
+
+    column = COLUMNS[match["column"]]
+    path = match["path"][1:].split(".")
+    operator, value = match["operator"], match["value"]
+
+    if operator == "=":
+        try:
+            document: Any = json.loads(value)
+        except ValueError:
+            document = value
+        for key in reversed(path):
+            document = {key: document}
+        return column.contains(document)
+
+    if operator == "~":
+        return _element(column, path, as_text=True).ilike(f"%{_escape_like(value)}%")
+
+    try:
+        number = _number(value)
+    except ValueError:
+        raise ValueError(f"Invalid filter {expression!r}, {value!r} isn't a number")
+    element = _element(column, path, as_text=False)
+    # JSONB orders the booleans, arrays and objects after all the numbers
+    return and_(
+        _COMPARISONS[operator](element, literal(number, JSONB)),
+        func.jsonb_typeof(element) == "number",
+    )
@@ -0,0 +1,243 @@
+"""
+Prometheus metrics of the API and of the worker.
+
+Metrics are collected in the default `prometheus_client` registry, exposed on
+`/metrics` by the API and on `WORKER_METRICS_PORT` by the worker. The metrics of
+the Temporal SDK runtime are buffered by `TemporalMetrics` and copied into the
+same registry.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import fields
+from typing import Any, Callable, Iterator, Optional
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily, Metric
+from prometheus_client.registry import Collector
+from temporalio.runtime import (
+    BUFFERED_METRIC_KIND_COUNTER,
+    BUFFERED_METRIC_KIND_GAUGE,
+    BufferedMetric,
+    MetricBuffer,
+    MetricBufferDurationFormat,
+    Runtime,
+    TelemetryConfig,
+)
+
+logger = logging.getLogger(__name__)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time to handle an API request, until its response starts",
+    ["method", "route", "status_code"],
+)
+
+DB_SESSION_DURATION = Histogram(
+    "db_session_duration_seconds", "Time a database session is held"
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Time to execute a database statement",
+    ["statement"],
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time to get a connection from the pool, including the time to open it",
+    ["role"],
+)
+REPLICA_LAG = Gauge(
+    "db_replica_lag_seconds", "Replication lag of the replica, at its last check"
+)
+# `reason` is either "lag" or "consistency_token"
+REPLICA_FALLBACKS = Counter(
+    "db_replica_fallbacks",
+    "Read-only requests sent to the primary instead of the replica",
+    ["reason"],
+)
+
+STATUS_UPDATE_DURATION = Histogram(
+    "operation_status_update_duration_seconds",
+    "Duration of the update_operation_status activity",
+    ["status", "outcome"],
+)
+
+# `mode` is either "full" (a page of the full scan) or "incremental"
+RECONCILIATION_DURATION = Histogram(
+    "reconciliation_duration_seconds",
+    "Duration of a reconciliation activity",
+    ["mode"],
+)
+RECONCILIATION_CHECKED = Counter(
+    "reconciliation_checked_operations",
+    "Operations checked against Temporal by the reconciliation",
+    ["mode"],
+)
+RECONCILIATION_RECONCILED = Counter(
+    "reconciliation_reconciled_operations",
+    "Operations whose status was fixed by the reconciliation",
+    ["mode"],
+)
+RECONCILIATION_VISIBILITY_RPCS = Counter(
+    "reconciliation_visibility_rpcs",
+    "Visibility RPCs done by the reconciliation",
+    ["mode"],
+)
+
+
+@contextmanager
+def timed(histogram: Histogram) -> Iterator[None]:
+    """Like `Histogram.time`, also observing the blocks that raise."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start)
+
+
+class StatsCollector(Collector):
+    """
+    Exposes the numeric fields of a stats dataclass (e.g. `CacheStats`) as gauges
+    named `<prefix>_<field>`, read at each scrape.
+
+    With a `label`, `get_stats` returns the stats of each value of the label
+    instead (e.g. of each connection pool), exposed as labeled gauges.
+    """
+
+    def __init__(
+        self, prefix: str, get_stats: Callable[[], Any], label: Optional[str] = None
+    ) -> None:
+        self._prefix = prefix
+        self._get_stats = get_stats
+        self._label = label
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        stats_by_label = self._get_stats()
+        if self._label is None:
+            stats_by_label = {None: stats_by_label}
+
+        gauges: dict[str, GaugeMetricFamily] = {}
+        for label_value, stats in stats_by_label.items():
+            for field in fields(stats):
+                value = getattr(stats, field.name)
+                if not isinstance(value, (int, float)):
+                    continue
+                if field.name not in gauges:
+                    gauges[field.name] = GaugeMetricFamily(
+                        f"{self._prefix}_{field.name}",
+                        f"{type(stats).__name__}.{field.name}",
+                        labels=[self._label] if self._label else [],
+                    )
+                gauges[field.name].add_metric(
+                    [label_value] if self._label else [], value
+                )
+        yield from gauges.values()
+
+
+def register_stats(
+    prefix: str, get_stats: Callable[[], Any], label: Optional[str] = None
+) -> None:
+    REGISTRY.register(StatsCollector(prefix, get_stats, label))
+
+
+class TemporalMetrics(Collector):
+    """
+    Copies the metrics of the Temporal SDK runtime into the Prometheus registry.
+
+    The runtime records its metrics in a buffer, drained every `interval` seconds
+    by a background task. The updates of a metric don't all have the same
+    attributes, so it is copied into a Prometheus metric per set of attribute
+    names, merged into a single family when collected.
+    """
+
+    def __init__(self, buffer_size: int = 100_000, interval: float = 1.0) -> None:
+        self._buffer = MetricBuffer(
+            buffer_size, duration_format=MetricBufferDurationFormat.SECONDS
+        )
+        self._interval = interval
+        # Metric name -> label names -> unregistered Prometheus metric
+        self._metrics: dict[str, dict[tuple[str, ...], Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        REGISTRY.register(self)
+
+    def install(self) -> None:
+        """Set the default runtime, to be called before connecting any client."""
+        Runtime.set_default(
+            Runtime(telemetry=TelemetryConfig(metrics=self._buffer)),
+            error_if_already_set=False,
+        )
+
+    def _metric(self, metric: BufferedMetric, label_names: tuple[str, ...]) -> Any:
+        by_label_names = self._metrics.setdefault(metric.name, {})
+        if label_names not in by_label_names:
+            if by_label_names:
+                logger.info(
+                    f"Temporal metric {metric.name} updated with attributes"
+                    f" {list(label_names)}, besides {list(next(iter(by_label_names)))}"
+                )
+            description = metric.description or metric.name
+            metric_class: Any = Histogram
+            if metric.kind == BUFFERED_METRIC_KIND_COUNTER:
+                metric_class = Counter
+            elif metric.kind == BUFFERED_METRIC_KIND_GAUGE:
+                metric_class = Gauge
+            by_label_names[label_names] = metric_class(
+                metric.name, description, label_names, registry=None
+            )
+        return by_label_names[label_names]
+
+    def drain(self) -> None:
+        for update in self._buffer.retrieve_updates():
+            label_names = tuple(sorted(update.attributes))
+            prometheus_metric = self._metric(update.metric, label_names)
+            if label_names:
+                prometheus_metric = prometheus_metric.labels(
+                    *(str(update.attributes[name]) for name in label_names)
+                )
+
+            kind = update.metric.kind
+            if kind == BUFFERED_METRIC_KIND_COUNTER:
+                prometheus_metric.inc(update.value)
+            elif kind == BUFFERED_METRIC_KIND_GAUGE:
+                prometheus_metric.set(update.value)
+            else:
+                prometheus_metric.observe(update.value)
+
+    def collect(self) -> Iterator[Metric]:
+        # Scraped from another thread than the one draining the buffer
+        for by_label_names in list(self._metrics.values()):
+            families = [
+                family
+                for prometheus_metric in list(by_label_names.values())
+                for family in prometheus_metric.collect()
+            ]
+            merged, *others = families
+            for family in others:
+                merged.samples.extend(family.samples)
+            yield merged
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                self.drain()
+            except Exception as e:
+                logger.error(f"Error collecting the Temporal metrics: {e}")
+            await asyncio.sleep(self._interval)
+
+
+temporal_metrics = TemporalMetrics()
@@ -1,7 +1,21 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import JSON, UUID, Column, DateTime, String
+from sqlalchemy import (
+    UUID,
+    BigInteger,
+    Column,
+    Date,
+    DateTime,
+    Index,
+    Integer,
+    LargeBinary,
+    SmallInteger,
+    String,
+    Text,
+    text,
+)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base
 
 from app.enums import OperationStatus
@@ -13,18 +27,21 @@ class Operation(Base):
     """Model for tracking long-running operations."""
 
     __tablename__ = "operations"
+    # One partition per month, see app/archive.py. The partition key has to be
+    # part of the primary key, so the uniqueness of `uuid` alone isn't enforced
+    __table_args__ = {"postgresql_partition_by": "RANGE (accepted_at)"}
 
     uuid = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     system_id = Column(String(6), nullable=False)
     op_type = Column(String(100), nullable=False)
-    status = Column(
-        String(20), nullable=False, default=OperationStatus.ACCEPTED, index=True
-    )
-    accepted_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    status = Column(String(20), nullable=False, default=OperationStatus.ACCEPTED)
+    accepted_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
     started_at = Column(DateTime, nullable=True)
     finished_at = Column(DateTime, nullable=True)
-    parameters = Column(JSON, nullable=False)
-    result = Column(JSON, nullable=True)
+    parameters = Column(JSONB, nullable=False)
+    result = Column(JSONB, nullable=True)
+    # Last progress reported while RUNNING, see app/temporal/progress_writer.py
+    progress = Column(JSONB, nullable=True)
 
     def to_dict(self) -> dict:
         """Convert operation to dictionary for API responses."""
@@ -38,4 +55,169 @@ class Operation(Base):
             "finished_at": self.finished_at.isoformat() if self.finished_at else None,
             "parameters": self.parameters,
             "result": self.result,
+            "progress": self.progress,
         }
+
+
+# Indexes matching the keyset pagination of the operations list, see
+# app/pagination.py
+Index(
+    "ix_operations_accepted_at_uuid",
+    Operation.accepted_at.desc(),
+    Operation.uuid.desc(),
+)
+Index(
+    "ix_operations_status_accepted_at_uuid",
+    Operation.status,
+    Operation.accepted_at.desc(),
+    Operation.uuid.desc(),
+)
+Index(
+    "ix_operations_op_type_accepted_at_uuid",
+    Operation.op_type,
+    Operation.accepted_at.desc(),
+    Operation.uuid.desc(),
+)
+Index(
+    "ix_operations_system_id_accepted_at_uuid",
+    Operation.system_id,
+    Operation.accepted_at.desc(),
+    Operation.uuid.desc(),
+)
+# Active operation of a machine, only a tiny fraction of the operations
+Index(
+    "ix_operations_active_system_id_accepted_at",
+    Operation.system_id,
+    Operation.accepted_at.desc(),
+    postgresql_where=text("status IN ('ACCEPTED', 'RUNNING')"),
+)
+# Reconciliation pages through the RUNNING operations by UUID
+Index(
+    "ix_operations_running_uuid",
+    Operation.uuid,
+    postgresql_where=text("status = 'RUNNING'"),
+)
+# Filters on parameters and result, see app/json_filters.py: containment on any
+# key, numeric comparisons on `parameters.timeout` and substring search on
+# `result.error`
+Index(
+    "ix_operations_parameters",
+    Operation.parameters,
+    postgresql_using="gin",
+    postgresql_ops={"parameters": "jsonb_path_ops"},
+)
+Index(
+    "ix_operations_result",
+    Operation.result,
+    postgresql_using="gin",
+    postgresql_ops={"result": "jsonb_path_ops"},
+)
+Index("ix_operations_parameters_timeout", text("(parameters -> 'timeout')"))
+Index(
+    "ix_operations_result_error_trgm",
+    text("(result ->> 'error') gin_trgm_ops"),
+    postgresql_using="gin",
+)
+
+
+class ReconciliationWatermark(Base):
+    """High-water mark of the incremental reconciliation."""
+
+    __tablename__ = "reconciliation_watermarks"
+
+    name = Column(String(100), primary_key=True)
+    # Workflows closed before this time have already been reconciled
+    closed_before = Column(DateTime, nullable=False)
+
+
+class WorkflowOutbox(Base):
+    """
+    Workflows to start for accepted operations.
+
+    Rows are written in the same transaction as their operation and deleted once
+    the workflow has been started, see app/outbox.py.
+    """
+
+    __tablename__ = "workflow_outbox"
+
+    operation_uuid = Column(UUID(as_uuid=True), primary_key=True)
+    # `accepted_at` of the operation, its partition key
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # Not dispatched before this time, moved forward after each failed attempt
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+
+
+class OperationStatusCount(Base):
+    """
+    Operations that moved to a status during a time bucket.
+
+    Counted by the minute, and rolled up in hour and day buckets, see
+    app/stats.py.
+    """
+
+    __tablename__ = "operation_status_counts"
+
+    span_seconds = Column(Integer, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    op_type = Column(String(100), primary_key=True)
+    status = Column(String(20), primary_key=True)
+    # Shard of the minute buckets counted in by concurrent transactions, summed
+    # over by the rollups and the reads. Rolled up buckets only use slot 0
+    slot = Column(SmallInteger, primary_key=True, autoincrement=False, default=0)
+    count = Column(BigInteger, nullable=False)
+
+
+class OperationDurationHistogram(Base):
+    """
+    Histograms of the queue wait and run time of the operations, bucketed like
+    `OperationStatusCount` by the time of the transition ending the duration.
+    """
+
+    __tablename__ = "operation_duration_histograms"
+
+    span_seconds = Column(Integer, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    op_type = Column(String(100), primary_key=True)
+    metric = Column(String(20), primary_key=True)
+    # Logarithmic bin of the duration, see `duration_bin` in app/stats.py
+    bin = Column(SmallInteger, primary_key=True)
+    slot = Column(SmallInteger, primary_key=True, autoincrement=False, default=0)
+    count = Column(BigInteger, nullable=False)
+
+
+class StatsRollupWatermark(Base):
+    """High-water mark of the rollups of a span, see `roll_up_stats`."""
+
+    __tablename__ = "stats_rollup_watermarks"
+
+    span_seconds = Column(Integer, primary_key=True, autoincrement=False)
+    # Buckets of this span before this time are rolled up from the minute ones
+    rolled_up_until = Column(DateTime, nullable=False)
+
+
+class OperationArchive(Base):
+    """A month of operations moved from its partition to the archive."""
+
+    __tablename__ = "operation_archives"
+
+    # First day of the month
+    month = Column(Date, primary_key=True)
+    operations = Column(BigInteger, nullable=False)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class OperationArchiveChunk(Base):
+    """
+    Archived operations of a month with UUIDs in [min_uuid, max_uuid], as gzipped
+    NDJSON. The UUID ranges of the chunks of a month don't overlap.
+    """
+
+    __tablename__ = "operation_archive_chunks"
+
+    month = Column(Date, primary_key=True)
+    min_uuid = Column(UUID(as_uuid=True), primary_key=True)
+    max_uuid = Column(UUID(as_uuid=True), nullable=False)
+    operations = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
@@ -0,0 +1,114 @@
+"""Fan-out of the status transitions notified by Postgres to the API waiters."""
+
+import asyncio
+import json
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+import asyncpg
+from sqlalchemy.engine import make_url
+
+from app.constants import ASYNC_DATABASE_URL, OPERATION_STATUS_CHANNEL
+from app.enums import OperationStatus
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before reconnecting after losing the LISTEN connection
+RECONNECT_DELAY = 1.0
+
+
+class StatusListener:
+    """
+    Listens to `OPERATION_STATUS_CHANNEL` on a single connection and wakes up the
+    waiters of the operations whose status changed.
+
+    Waiters subscribe to an operation and get its new statuses through a queue.
+    A `None` status means that notifications may have been missed (i.e. the
+    connection has been lost) and waiters should check the database again.
+    """
+
+    def __init__(self, dsn: str) -> None:
+        self._dsn = dsn
+        self._waiters: Dict[str, Set[asyncio.Queue]] = {}
+        self._callbacks: List[Callable[[str, OperationStatus], None]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def waiters(self) -> int:
+        return sum(len(queues) for queues in self._waiters.values())
+
+    def on_transition(self, callback: Callable[[str, OperationStatus], None]) -> None:
+        """Call `callback` with the UUID and new status of every transition."""
+        self._callbacks.append(callback)
+
+    @contextmanager
+    def subscribe(self, op_uuid: str) -> Iterator[asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._waiters.setdefault(op_uuid, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            queues = self._waiters[op_uuid]
+            queues.discard(queue)
+            if not queues:
+                del self._waiters[op_uuid]
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                connection = await asyncpg.connect(self._dsn)
+            except Exception as e:
+                logger.error(f"Could not connect to listen for transitions: {e}")
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+
+            terminated = asyncio.Event()
+            connection.add_termination_listener(lambda _: terminated.set())
+            try:
+                await connection.add_listener(OPERATION_STATUS_CHANNEL, self._notify)
+                # Transitions may have been missed while disconnected
+                self._wake_up_all()
+                await terminated.wait()
+                logger.warning("Lost the connection listening for transitions")
+            finally:
+                await connection.close()
+
+    def _notify(self, connection, pid: int, channel: str, payload: str) -> None:
+        transition = json.loads(payload)
+        op_uuid = transition["uuid"]
+        status = OperationStatus(transition["status"])
+
+        for callback in self._callbacks:
+            callback(op_uuid, status)
+
+        for queue in self._waiters.get(op_uuid, ()):
+            queue.put_nowait(status)
+
+    def _wake_up_all(self) -> None:
+        for queues in self._waiters.values():
+            for queue in queues:
+                queue.put_nowait(None)
+
+
+def listener_dsn(url: str) -> str:
+    """asyncpg DSN of a SQLAlchemy URL."""
+    return make_url(url).set(drivername="postgresql").render_as_string(
+        hide_password=False
+    )
+
+
+status_listener = StatusListener(listener_dsn(ASYNC_DATABASE_URL))
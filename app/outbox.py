@@ -0,0 +1,360 @@
+"""
+Transactional outbox of the workflow starts.
+
+The API writes an outbox row in the same transaction as each accepted operation,
+so it doesn't wait on Temporal. The `OutboxDispatcher` drains the outbox in
+batches: it claims a batch in a short transaction, starts its workflows
+concurrently with no transaction open, then deletes the started rows and retries
+the failed starts with an exponential backoff. Workflow IDs are derived from the
+operation, so a start retried after a partial failure, or by another dispatcher
+after the lease of its row expired, never runs a workflow twice.
+"""
+
+import asyncio
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import and_, bindparam, delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from temporalio.client import Client
+from temporalio.common import (
+    SearchAttributePair,
+    TypedSearchAttributes,
+    WorkflowIDReusePolicy,
+)
+from temporalio.exceptions import WorkflowAlreadyStartedError
+from temporalio.service import RPCError, RPCStatusCode
+
+from app.constants import (
+    OPERATION_UUID_SEARCH_ATTR,
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_LEASE_SECONDS,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_POLL_INTERVAL_SECONDS,
+    TEMPORAL_TASK_QUEUE,
+    WORKFLOW_START_CONCURRENCY,
+)
+from app.database import DatabaseRole, get_db
+from app.enums import OperationStatus
+from app.models import Operation, WorkflowOutbox
+from app.temporal.client import get_temporal_client
+from app.temporal.workflows.long_running_operation import (
+    LongRunningOperationWorkflow,
+    WorkflowInput,
+)
+from app.transitions import StatusTransition, apply_transitions
+
+logger = logging.getLogger(__name__)
+
+outbox = WorkflowOutbox.__table__
+
+# Maximum delay between two attempts to start the same workflow
+MAX_BACKOFF_SECONDS = 60
+
+
+def operation_workflow_id(machine_id: str, op: str, op_uuid: uuid.UUID) -> str:
+    return f"{machine_id}-{op}-{op_uuid}"
+
+
+async def start_operation_workflow(
+    client: Client, machine_id: str, op: str, op_uuid: uuid.UUID, timeout: int
+) -> None:
+    workflow_id = operation_workflow_id(machine_id, op, op_uuid)
+    workflow_input = WorkflowInput(timeout=timeout)
+
+    try:
+        await client.start_workflow(
+            LongRunningOperationWorkflow.run,
+            workflow_input,
+            id=workflow_id,
+            task_queue=TEMPORAL_TASK_QUEUE,
+            id_reuse_policy=WorkflowIDReusePolicy.REJECT_DUPLICATE,
+            search_attributes=TypedSearchAttributes(
+                [
+                    SearchAttributePair(OPERATION_UUID_SEARCH_ATTR, str(op_uuid)),
+                ]
+            ),
+        )
+    except WorkflowAlreadyStartedError:
+        # Started by a previous attempt
+        pass
+
+
+async def is_operation_workflow_started(
+    client: Client, machine_id: str, op: str, op_uuid: uuid.UUID
+) -> bool:
+    """
+    Whether Temporal knows the workflow of an operation, e.g. started by an
+    attempt whose request timed out. Raises if it can't tell.
+    """
+    handle = client.get_workflow_handle(operation_workflow_id(machine_id, op, op_uuid))
+    try:
+        await handle.describe()
+    except RPCError as e:
+        if e.status == RPCStatusCode.NOT_FOUND:
+            return False
+        raise
+    return True
+
+
+@dataclass
+class OutboxStats:
+    dispatched: int = 0
+    failed_attempts: int = 0
+    abandoned: int = 0
+    # Longest time between the acceptance of an operation and the start of its
+    # workflow in the last dispatched batch, i.e. for its oldest operation
+    last_dispatch_lag_seconds: float = 0.0
+
+
+@dataclass
+class OutboxBacklog:
+    depth: int
+    oldest_age_seconds: float
+
+
+async def get_outbox_backlog(db: AsyncSession) -> OutboxBacklog:
+    depth, oldest = (
+        await db.execute(
+            select(func.count(), func.min(WorkflowOutbox.created_at))
+        )
+    ).one()
+
+    age = (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0
+    return OutboxBacklog(depth=depth, oldest_age_seconds=age)
+
+
+class OutboxDispatcher:
+    """
+    Starts the workflows of the outbox.
+
+    Rows are claimed with `FOR UPDATE SKIP LOCKED` and leased for
+    `OUTBOX_LEASE_SECONDS`, so several dispatchers (e.g. one per API process) can
+    drain the same outbox without holding a transaction during the starts.
+    Starts failing `OUTBOX_MAX_ATTEMPTS` times are abandoned, failing their
+    operation, unless their workflow turns out to exist.
+    """
+
+    def __init__(self) -> None:
+        self._wake_up = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = OutboxStats()
+
+    def wake_up(self) -> None:
+        """Dispatch right away instead of at the next poll."""
+        self._wake_up.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                client = await get_temporal_client()
+                # Keep going while there are full batches to dispatch
+                while await self.dispatch(client) == OUTBOX_BATCH_SIZE:
+                    pass
+            except Exception as e:
+                logger.error(f"Error dispatching the workflow outbox: {e}")
+
+            try:
+                await asyncio.wait_for(
+                    self._wake_up.wait(), OUTBOX_POLL_INTERVAL_SECONDS
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._wake_up.clear()
+
+    async def dispatch(self, client: Client) -> int:
+        """Dispatch a batch of workflow starts, returning its size."""
+        leased_until = datetime.utcnow() + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+        claimed = await self._claim(leased_until)
+        rows = [row for row in claimed if row.has_operation]
+        if not rows:
+            return len(claimed)
+
+        # No transaction is open while the workflows are started
+        semaphore = asyncio.Semaphore(WORKFLOW_START_CONCURRENCY)
+        errors: dict[uuid.UUID, str] = {}
+        # Last attempts whose workflow is known not to exist
+        not_started: set[uuid.UUID] = set()
+
+        async def start(row) -> None:
+            async with semaphore:
+                try:
+                    await start_operation_workflow(
+                        client,
+                        row.system_id,
+                        row.op_type,
+                        row.operation_uuid,
+                        row.parameters["timeout"],
+                    )
+                    return
+                except Exception as e:
+                    errors[row.operation_uuid] = str(e)
+                if row.attempts + 1 < OUTBOX_MAX_ATTEMPTS:
+                    return
+
+                # A start may fail on the client, e.g. timing out, after succeeding
+                # on the server: its operation is only failed if Temporal doesn't
+                # know the workflow, and retried again if that can't be checked
+                try:
+                    started = await is_operation_workflow_started(
+                        client, row.system_id, row.op_type, row.operation_uuid
+                    )
+                except Exception as e:
+                    logger.warning(
+                        f"Could not check the workflow of {row.operation_uuid}: {e}"
+                    )
+                    return
+                if started:
+                    del errors[row.operation_uuid]
+                else:
+                    not_started.add(row.operation_uuid)
+
+        await asyncio.gather(*(start(row) for row in rows))
+
+        now = datetime.utcnow()
+        done = [row for row in rows if row.operation_uuid not in errors]
+        retried = [
+            row
+            for row in rows
+            if row.operation_uuid in errors and row.operation_uuid not in not_started
+        ]
+        abandoned = [row for row in rows if row.operation_uuid in not_started]
+
+        async with get_db(DatabaseRole.API_WRITE) as db:
+            # Rows whose lease expired may have been claimed again meanwhile, and
+            # are left to the dispatcher holding them
+            leased = outbox.c.available_at == leased_until
+
+            finished = [row.operation_uuid for row in done + abandoned]
+            if finished:
+                await db.execute(
+                    delete(outbox).where(outbox.c.operation_uuid.in_(finished), leased)
+                )
+
+            if retried:
+                await db.execute(
+                    update(outbox)
+                    .where(outbox.c.operation_uuid == bindparam("b_uuid"), leased)
+                    .values(
+                        attempts=bindparam("b_attempts"),
+                        available_at=bindparam("b_available_at"),
+                        last_error=bindparam("b_last_error"),
+                    ),
+                    [
+                        {
+                            "b_uuid": row.operation_uuid,
+                            "b_attempts": row.attempts + 1,
+                            "b_available_at": now
+                            + timedelta(
+                                seconds=min(2**row.attempts, MAX_BACKOFF_SECONDS)
+                            ),
+                            "b_last_error": errors[row.operation_uuid],
+                        }
+                        for row in retried
+                    ],
+                )
+
+            if abandoned:
+                await apply_transitions(
+                    db,
+                    [
+                        StatusTransition(
+                            operation_uuid=row.operation_uuid,
+                            status=OperationStatus.FAILED,
+                            result={
+                                "error": "Error starting workflow:"
+                                f" {errors[row.operation_uuid]}"
+                            },
+                        )
+                        for row in abandoned
+                    ],
+                )
+
+        self.stats.dispatched += len(done)
+        self.stats.failed_attempts += len(errors)
+        self.stats.abandoned += len(abandoned)
+        if done:
+            self.stats.last_dispatch_lag_seconds = (
+                now - min(row.created_at for row in done)
+            ).total_seconds()
+
+        if errors:
+            logger.warning(
+                f"Could not start {len(errors)} workflows out of {len(rows)},"
+                f" {len(abandoned)} abandoned"
+            )
+        return len(claimed)
+
+    async def _claim(self, leased_until: datetime) -> list:
+        """
+        Claim a batch of the available rows in a short transaction, leasing them
+        until `leased_until`: other dispatchers skip them while their workflows
+        are started, and take them over if this one dies before finishing them.
+
+        Rows whose operation doesn't exist anymore (archived or deleted before
+        its workflow was started) are deleted.
+        """
+        async with get_db(DatabaseRole.API_WRITE) as db:
+            rows = (
+                await db.execute(
+                    select(
+                        WorkflowOutbox.operation_uuid,
+                        WorkflowOutbox.created_at,
+                        WorkflowOutbox.attempts,
+                        Operation.system_id,
+                        Operation.op_type,
+                        Operation.parameters,
+                        Operation.uuid.is_not(None).label("has_operation"),
+                    )
+                    # Matching the partition key lets the join skip the partitions
+                    # of the other months
+                    .outerjoin(
+                        Operation,
+                        and_(
+                            Operation.uuid == WorkflowOutbox.operation_uuid,
+                            Operation.accepted_at == WorkflowOutbox.created_at,
+                        ),
+                    )
+                    .where(WorkflowOutbox.available_at <= datetime.utcnow())
+                    .order_by(WorkflowOutbox.available_at)
+                    .limit(OUTBOX_BATCH_SIZE)
+                    .with_for_update(of=WorkflowOutbox, skip_locked=True)
+                )
+            ).all()
+
+            orphans = [row.operation_uuid for row in rows if not row.has_operation]
+            if orphans:
+                await db.execute(
+                    delete(outbox).where(outbox.c.operation_uuid.in_(orphans))
+                )
+                logger.warning(
+                    f"Deleted {len(orphans)} outbox rows without an operation"
+                )
+
+            leased = [row.operation_uuid for row in rows if row.has_operation]
+            if leased:
+                await db.execute(
+                    update(outbox)
+                    .where(outbox.c.operation_uuid.in_(leased))
+                    .values(available_at=leased_until)
+                )
+        return rows
+
+
+outbox_dispatcher = OutboxDispatcher()
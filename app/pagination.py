@@ -0,0 +1,44 @@
+"""Keyset pagination over operations, ordered by `(accepted_at, uuid)` descending."""
+
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import Select, tuple_
+
+from app.models import Operation
+
+
+def encode_cursor(accepted_at: datetime, op_uuid: uuid.UUID) -> str:
+    """Opaque cursor pointing right after the given operation."""
+    payload = json.dumps([accepted_at.isoformat(), str(op_uuid)])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """Raises `ValueError` if the cursor is malformed."""
+    try:
+        accepted_at, op_uuid = json.loads(base64.urlsafe_b64decode(cursor))
+        return datetime.fromisoformat(accepted_at), uuid.UUID(op_uuid)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {e}") from e
+
+
+def paginate(query: Select, cursor: Optional[str], limit: int) -> Select:
+    """
+    Add keyset pagination to a query on operations.
+
+    The page is fetched through an index seek on `(accepted_at, uuid)` (possibly
+    prefixed by the filtered columns), so its cost doesn't depend on its depth.
+    """
+    if cursor:
+        accepted_at, op_uuid = decode_cursor(cursor)
+        query = query.where(
+            tuple_(Operation.accepted_at, Operation.uuid) < (accepted_at, op_uuid)
+        )
+
+    return query.order_by(Operation.accepted_at.desc(), Operation.uuid.desc()).limit(
+        limit
+    )
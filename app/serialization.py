@@ -0,0 +1,50 @@
+"""
+Fast-path JSON rendering of operations lists.
+
+Rows are selected as plain tuples and serialized straight to JSON bytes with
+orjson, skipping the ORM objects, `Operation.to_dict` and the per-row Pydantic
+validation. The output matches `OperationResponse`.
+"""
+
+from typing import Sequence
+
+import orjson
+from sqlalchemy import Row, Select, null, select
+
+from app.models import Operation
+
+# Fields of `OperationResponse`, in the same order
+OPERATION_RESPONSE_COLUMNS = (
+    Operation.uuid,
+    null().label("workflow_run_id"),
+    Operation.system_id,
+    Operation.op_type,
+    Operation.status,
+    Operation.accepted_at,
+    Operation.started_at,
+    Operation.finished_at,
+    Operation.parameters,
+    Operation.result,
+    Operation.progress,
+)
+
+
+def select_operation_rows() -> Select:
+    return select(*OPERATION_RESPONSE_COLUMNS)
+
+
+def render_operations(rows: Sequence[Row]) -> bytes:
+    """
+    Render rows of `select_operation_rows` as a JSON list.
+
+    orjson renders UUIDs as strings and naive datetimes in ISO 8601, like
+    `Operation.to_dict`.
+    """
+    return orjson.dumps([row._asdict() for row in rows])
+
+
+def render_operation_lines(rows: Sequence[Row]) -> bytes:
+    """Render rows of `select_operation_rows` as NDJSON, one operation per line."""
+    return b"".join(
+        orjson.dumps(row._asdict(), option=orjson.OPT_APPEND_NEWLINE) for row in rows
+    )
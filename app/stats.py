@@ -0,0 +1,369 @@
+"""
+Incrementally maintained statistics of the operations.
+
+Every applied status transition is counted in time buckets by op type and
+status, and the durations it ends (queue wait on RUNNING, run time on a terminal
+status) are added to logarithmic histograms. Histograms of the same op type and
+metric are merged by summing the counts of their bins.
+
+Transitions are only counted in minute buckets, by the transactions applying
+them. Their row locks are held until commit, so each transaction counts in one
+of `STATS_SLOTS` rows per bucket, picked at random: concurrent transactions
+counting the same status in the same minute only wait on each other when they
+pick the same slot. `roll_up_stats`, run every few minutes by the
+`StatsRollupWorkflow`, recomputes the hour and day buckets from the minute ones,
+summing their slots, up to a watermark per span. A window is answered from the
+rolled up buckets before their watermark and from the minute ones after it, i.e.
+from a few rows per span and slot (e.g. a 30 days window from at most 59 minute,
+23 hour and 30 day buckets on each side, plus the minutes not rolled up yet)
+instead of from the operations table.
+"""
+
+import math
+import random
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Final, Mapping, Optional, Sequence
+
+from sqlalchemy import and_, func, literal_column, or_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.constants import STATS_SLOTS
+from app.models import (
+    OperationDurationHistogram,
+    OperationStatusCount,
+    StatsRollupWatermark,
+)
+
+# Spans of the rollups, in seconds, smallest first: each one must be a multiple
+# of the previous one
+ROLLUP_SPANS: Final = (60, 3600, 86400)
+
+# Minute buckets are rolled up once ended for this long, leaving time to the
+# transactions counting in them to commit. Increments committed later are picked
+# up by the next rollup, which recomputes the last bucket of each span
+ROLLUP_DELAY: Final = timedelta(minutes=1)
+
+QUEUE_WAIT: Final = "queue_wait"  # accepted_at -> started_at
+RUN_TIME: Final = "run_time"  # started_at -> finished_at
+
+# Each bin is ~19% wider than the previous one, bounding the relative error of
+# the percentiles
+HISTOGRAM_BASE: Final = 2**0.25
+
+_EPOCH: Final = datetime(1970, 1, 1)
+
+
+def duration_bin(seconds: float) -> int:
+    """Bin of a duration: (HISTOGRAM_BASE**(bin-1), HISTOGRAM_BASE**bin] ms."""
+    return max(0, math.ceil(math.log(max(seconds * 1000, 1.0), HISTOGRAM_BASE)))
+
+
+def bin_upper_bound(bin: int) -> float:
+    """Largest duration of a bin, in seconds."""
+    return HISTOGRAM_BASE**bin / 1000
+
+
+def bucket_start(at: datetime, span_seconds: int) -> datetime:
+    return at - (at - _EPOCH) % timedelta(seconds=span_seconds)
+
+
+@dataclass
+class StatsDelta:
+    """Increments of the rollups, keyed by the start of their minute bucket."""
+
+    # (bucket, op_type, status) -> count
+    counts: Counter = field(default_factory=Counter)
+    # (bucket, op_type, metric, bin) -> count
+    durations: Counter = field(default_factory=Counter)
+
+    def count(self, at: datetime, op_type: str, status: str) -> None:
+        self.counts[(bucket_start(at, ROLLUP_SPANS[0]), op_type, status)] += 1
+
+    def observe(self, at: datetime, op_type: str, metric: str, seconds: float) -> None:
+        bucket = bucket_start(at, ROLLUP_SPANS[0])
+        self.durations[(bucket, op_type, metric, duration_bin(seconds))] += 1
+
+    def __bool__(self) -> bool:
+        return bool(self.counts or self.durations)
+
+
+def _sorted(increments: Counter) -> list[tuple[tuple, int]]:
+    """
+    Increments sorted by primary key, so that concurrent upserts lock the rows in
+    the same order and can't deadlock.
+    """
+    return sorted(increments.items())
+
+
+async def record_stats(db: AsyncSession, delta: StatsDelta) -> None:
+    """
+    Add the increments to a random slot of the minute buckets, with one upsert
+    per table.
+
+    Meant to be called in the transaction applying the counted transitions, so
+    that the rollups are updated if and only if the transitions are.
+    """
+    minute = ROLLUP_SPANS[0]
+    slot = random.randrange(STATS_SLOTS)
+    if delta.counts:
+        upsert = insert(OperationStatusCount).values(
+            [
+                {
+                    "span_seconds": minute,
+                    "bucket": bucket,
+                    "op_type": op_type,
+                    "status": status,
+                    "slot": slot,
+                    "count": count,
+                }
+                for (bucket, op_type, status), count in _sorted(delta.counts)
+            ]
+        )
+        await db.execute(
+            upsert.on_conflict_do_update(
+                index_elements=list(OperationStatusCount.__table__.primary_key),
+                set_={"count": OperationStatusCount.count + upsert.excluded.count},
+            )
+        )
+
+    if delta.durations:
+        upsert = insert(OperationDurationHistogram).values(
+            [
+                {
+                    "span_seconds": minute,
+                    "bucket": bucket,
+                    "op_type": op_type,
+                    "metric": metric,
+                    "bin": bin,
+                    "slot": slot,
+                    "count": count,
+                }
+                for (bucket, op_type, metric, bin), count in _sorted(delta.durations)
+            ]
+        )
+        await db.execute(
+            upsert.on_conflict_do_update(
+                index_elements=list(OperationDurationHistogram.__table__.primary_key),
+                set_={
+                    "count": OperationDurationHistogram.count + upsert.excluded.count
+                },
+            )
+        )
+
+
+# Rollup tables -> columns of their key, besides the span and the bucket
+_ROLLUP_KEYS: Final = {
+    OperationStatusCount: ("op_type", "status"),
+    OperationDurationHistogram: ("op_type", "metric", "bin"),
+}
+
+
+def _roll_up_statement(
+    table, span: int, since: Optional[datetime], until: datetime
+):
+    """
+    Recompute the buckets of `span` in [since, until) from the minute buckets,
+    summing their slots into slot 0 and replacing their counts.
+    """
+    # Inlined rather than bound, so that GROUP BY matches the selected expression
+    bucket = func.date_bin(
+        literal_column(f"interval '{span} seconds'"),
+        table.bucket,
+        literal_column(f"timestamp '{_EPOCH.isoformat(' ')}'"),
+    )
+    keys = [getattr(table, name) for name in _ROLLUP_KEYS[table]]
+    minutes = (
+        select(
+            literal_column(str(span)),
+            bucket,
+            *keys,
+            literal_column("0"),
+            func.sum(table.count),
+        )
+        .where(table.span_seconds == ROLLUP_SPANS[0], table.bucket < until)
+        .group_by(bucket, *keys)
+    )
+    if since is not None:
+        minutes = minutes.where(table.bucket >= since)
+
+    upsert = insert(table).from_select(
+        ["span_seconds", "bucket", *_ROLLUP_KEYS[table], "slot", "count"], minutes
+    )
+    return upsert.on_conflict_do_update(
+        index_elements=list(table.__table__.primary_key),
+        set_={"count": upsert.excluded.count},
+    )
+
+
+async def get_rollup_watermarks(db: AsyncSession) -> dict[int, datetime]:
+    """Span -> end of its buckets rolled up from the minute ones."""
+    rows = await db.execute(
+        select(StatsRollupWatermark.span_seconds, StatsRollupWatermark.rolled_up_until)
+    )
+    return {span: rolled_up_until for span, rolled_up_until in rows}
+
+
+async def roll_up_stats(db: AsyncSession, now: datetime) -> dict[int, datetime]:
+    """
+    Roll the minute buckets ended `ROLLUP_DELAY` before `now` up into the larger
+    spans, and advance their watermarks, returning them.
+
+    The last bucket rolled up by the previous run of each span is recomputed, so
+    that it includes the increments committed since. Spans without a watermark
+    are rolled up from the first minute bucket.
+    """
+    rows = await db.execute(select(StatsRollupWatermark).with_for_update())
+    watermarks = {row.span_seconds: row for row in rows.scalars()}
+
+    rolled_up_until = {}
+    for span in ROLLUP_SPANS[1:]:
+        until = bucket_start(now - ROLLUP_DELAY, span)
+        watermark = watermarks.get(span)
+        since = (
+            watermark.rolled_up_until - timedelta(seconds=span) if watermark else None
+        )
+        for table in _ROLLUP_KEYS:
+            await db.execute(_roll_up_statement(table, span, since, until))
+
+        if watermark:
+            watermark.rolled_up_until = max(watermark.rolled_up_until, until)
+        else:
+            watermark = StatsRollupWatermark(span_seconds=span, rolled_up_until=until)
+            db.add(watermark)
+        rolled_up_until[span] = watermark.rolled_up_until
+
+    return rolled_up_until
+
+
+def window_buckets(
+    since: datetime, until: datetime, rolled_up_until: Mapping[int, datetime]
+) -> list[tuple[int, datetime, datetime]]:
+    """
+    Cover [since, until) with the fewest buckets, as (span, first bucket, end)
+    ranges, using the buckets of the larger spans only before their watermark in
+    `rolled_up_until`. Both bounds must be aligned on the smallest span.
+    """
+    ranges = []
+
+    def cover(start: datetime, end: datetime, spans: Sequence[int]) -> None:
+        if start >= end:
+            return
+        span, *smaller = spans
+        if not smaller:
+            ranges.append((span, start, end))
+            return
+        first = bucket_start(start, span)
+        if first < start:
+            first += timedelta(seconds=span)
+        last = min(bucket_start(end, span), rolled_up_until.get(span, _EPOCH))
+        if first < last:
+            ranges.append((span, first, last))
+            cover(start, first, smaller)
+            cover(last, end, smaller)
+        else:
+            cover(start, end, smaller)
+
+    cover(since, until, ROLLUP_SPANS[::-1])
+    return ranges
+
+
+def _in_window(
+    table, since: datetime, until: datetime, rolled_up_until: Mapping[int, datetime]
+):
+    return or_(
+        *(
+            and_(
+                table.span_seconds == span,
+                table.bucket >= first,
+                table.bucket < end,
+            )
+            for span, first, end in window_buckets(since, until, rolled_up_until)
+        )
+    )
+
+
+@dataclass
+class WindowStats:
+    since: datetime
+    until: datetime
+    # op_type -> status -> count
+    counts: dict[str, dict[str, int]]
+    # op_type -> metric -> bin -> count
+    histograms: dict[str, dict[str, dict[int, int]]]
+
+
+async def get_window_stats(
+    db: AsyncSession, since: datetime, until: datetime, op_type: Optional[str] = None
+) -> WindowStats:
+    """
+    Stats of the transitions in [since, until), rounded outwards to whole minutes.
+
+    Its cost depends at most on the length of the window in days, and not on the
+    number of operations.
+    """
+    minute = ROLLUP_SPANS[0]
+    since = bucket_start(since, minute)
+    if bucket_start(until, minute) < until:
+        until = bucket_start(until, minute) + timedelta(seconds=minute)
+    stats = WindowStats(since=since, until=until, counts={}, histograms={})
+    if since >= until:
+        return stats
+
+    rolled_up_until = await get_rollup_watermarks(db)
+    counts = (
+        select(
+            OperationStatusCount.op_type,
+            OperationStatusCount.status,
+            func.sum(OperationStatusCount.count),
+        )
+        .where(_in_window(OperationStatusCount, since, until, rolled_up_until))
+        .group_by(OperationStatusCount.op_type, OperationStatusCount.status)
+    )
+    histograms = (
+        select(
+            OperationDurationHistogram.op_type,
+            OperationDurationHistogram.metric,
+            OperationDurationHistogram.bin,
+            func.sum(OperationDurationHistogram.count),
+        )
+        .where(
+            _in_window(OperationDurationHistogram, since, until, rolled_up_until)
+        )
+        .group_by(
+            OperationDurationHistogram.op_type,
+            OperationDurationHistogram.metric,
+            OperationDurationHistogram.bin,
+        )
+    )
+    if op_type:
+        counts = counts.where(OperationStatusCount.op_type == op_type)
+        histograms = histograms.where(OperationDurationHistogram.op_type == op_type)
+
+    for row_op_type, status, count in await db.execute(counts):
+        stats.counts.setdefault(row_op_type, {})[status] = int(count)
+    for row_op_type, metric, bin, count in await db.execute(histograms):
+        stats.histograms.setdefault(row_op_type, {}).setdefault(metric, {})[bin] = int(
+            count
+        )
+    return stats
+
+
+def percentile(histogram: Mapping[int, int], q: float) -> Optional[float]:
+    """
+    Upper bound, in seconds, of the bin holding the `q` quantile (0 < q <= 1) of
+    a histogram, None if it's empty.
+    """
+    total = sum(histogram.values())
+    if not total:
+        return None
+
+    rank = q * total
+    seen = 0
+    for bin in sorted(histogram):
+        seen += histogram[bin]
+        if seen >= rank:
+            return bin_upper_bound(bin)
+    return bin_upper_bound(max(histogram))
@@ -1,18 +1,64 @@
 import asyncio
+import time
+import uuid as uuid_lib
 from dataclasses import dataclass
-from datetime import datetime
-from typing import Dict, Optional
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
 from temporalio import activity
-from temporalio.client import WorkflowExecutionStatus
-
-from app.constants import OPERATION_UUID_ATTR_NAME
-from app.database import get_db
+from temporalio.client import Client, WorkflowExecutionStatus
+
+from app.archive import (
+    add_months,
+    copy_to_archive,
+    count_default_partition_rows,
+    create_partitions,
+    drop_partition,
+    has_active_operations,
+    list_partitions,
+    month_of,
+)
+from app.constants import (
+    OPERATION_UUID_ATTR_NAME,
+    OPERATIONS_ARCHIVE_AFTER_MONTHS,
+    OPERATIONS_PARTITIONS_AHEAD_MONTHS,
+    RECONCILIATION_FULL_SCAN_INTERVAL_MINUTES,
+    RECONCILIATION_PAGE_SIZE,
+    RECONCILIATION_QUERY_CHUNK_SIZE,
+    RECONCILIATION_QUERY_CONCURRENCY,
+    RECONCILIATION_WATERMARK_OVERLAP_SECONDS,
+    RECONCILIATION_WINDOW_MINUTES,
+    STREAM_BATCH_SIZE,
+    TRACKED_WORKFLOW_TYPES,
+    WORK_CHECKPOINT_SECONDS,
+)
+from app.database import DatabaseRole, get_db
 from app.enums import OperationStatus
-from app.models import Operation
+from app.metrics import (
+    RECONCILIATION_CHECKED,
+    RECONCILIATION_DURATION,
+    RECONCILIATION_RECONCILED,
+    RECONCILIATION_VISIBILITY_RPCS,
+    STATUS_UPDATE_DURATION,
+)
+from app.models import Operation, OperationArchive, ReconciliationWatermark
+from app.stats import roll_up_stats
 from app.temporal.client import get_temporal_client
-
-
+from app.temporal.converter import compact_payload
+from app.temporal.progress_writer import get_progress_writer
+from app.temporal.status_writer import get_status_writer
+from app.temporal.visibility import (
+    VisibilityStats,
+    get_workflows_status,
+    list_workflows,
+    operation_uuid_of,
+)
+from app.transitions import StatusTransition, apply_transitions
+
+
+@compact_payload("operation_uuid")
 @dataclass
 class UpdateStatusInput:
     operation_uuid: str
@@ -21,10 +67,13 @@ class UpdateStatusInput:
     error: Optional[str] = None
 
 
+@compact_payload("operation_uuid")
 @dataclass
 class SimulateWorkInput:
     duration: int
     task_name: str
+    # Operation whose progress is reported, if any
+    operation_uuid: Optional[str] = None
 
 
 @activity.defn(name="update_operation_status")
@@ -33,68 +82,152 @@ async def update_operation_status(input: UpdateStatusInput) -> None:
         f"Updating operation {input.operation_uuid} to status {input.status}"
     )
 
-    with get_db() as db:
-        operation = (
-            db.query(Operation).filter(Operation.uuid == input.operation_uuid).first()
+    result = None
+    if input.result:
+        result = input.result
+    elif input.error:
+        result = {"error": input.error}
+
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        await get_status_writer().submit(
+            StatusTransition(
+                operation_uuid=uuid_lib.UUID(input.operation_uuid),
+                status=OperationStatus(input.status),
+                result=result,
+            )
+        )
+        outcome = "ok"
+    finally:
+        STATUS_UPDATE_DURATION.labels(input.status, outcome).observe(
+            time.perf_counter() - start
         )
-
-        if not operation:
-            raise ValueError(f"Operation {input.operation_uuid} not found")
-
-        operation.status = OperationStatus(input.status)
-
-        if input.status == OperationStatus.RUNNING:
-            operation.started_at = datetime.utcnow()
-        elif input.status in [OperationStatus.COMPLETED, OperationStatus.FAILED]:
-            operation.finished_at = datetime.utcnow()
-
-        if input.result:
-            operation.result = input.result
-        elif input.error:
-            operation.result = {"error": input.error}
-
-        db.commit()
 
     activity.logger.info(f"Successfully updated operation {input.operation_uuid}")
 
 
 @activity.defn(name="simulate_work")
 async def simulate_work(input: SimulateWorkInput) -> None:
-    activity.logger.info(
-        f"Starting {input.task_name}, will sleep {input.duration} seconds"
-    )
-    await asyncio.sleep(input.duration)
+    """
+    Sleep for `input.duration` seconds, heartbeating the seconds done every
+    WORK_CHECKPOINT_SECONDS. A retry, e.g. after a worker crash, resumes from the
+    last checkpoint received by Temporal instead of starting over.
+
+    Each checkpoint is also reported as the progress of the operation, with the
+    task name as phase.
+    """
+    details = activity.info().heartbeat_details
+    done = float(details[0]) if details else 0.0
+    if done:
+        activity.logger.info(
+            f"Resuming {input.task_name} after {done:.0f}/{input.duration} seconds"
+        )
+    else:
+        activity.logger.info(
+            f"Starting {input.task_name}, will sleep {input.duration} seconds"
+        )
+
+    while done < input.duration:
+        step = min(WORK_CHECKPOINT_SECONDS, input.duration - done)
+        await asyncio.sleep(step)
+        done += step
+        activity.heartbeat(done)
+        if input.operation_uuid:
+            get_progress_writer().report(
+                uuid_lib.UUID(input.operation_uuid),
+                percent=100 * done / input.duration,
+                phase=input.task_name,
+            )
+
     activity.logger.info(f"Completed {input.task_name}")
 
 
+@compact_payload("after", "until")
+@dataclass
+class GetRunningOperationsInput:
+    # Key range (after, until] of the operations UUIDs, unbounded if None
+    after: Optional[str] = None
+    until: Optional[str] = None
+    # Bounds the memory of the activity and the size of its output
+    limit: int = RECONCILIATION_PAGE_SIZE
+
+
+@compact_payload("operations_uuids", "next_after")
 @dataclass
 class GetRunningOperationsOutput:
     operations_uuids: set[str]
+    # Cursor to pass as `after` to get the next page, None if this is the last one
+    next_after: Optional[str] = None
 
 
 @activity.defn(name="get_running_operations")
-async def get_running_operations() -> GetRunningOperationsOutput:
-    with get_db() as db:
-        operations = (
-            db.query(Operation)
-            .filter(Operation.status == OperationStatus.RUNNING)
-            .all()
+async def get_running_operations(
+    input: GetRunningOperationsInput,
+) -> GetRunningOperationsOutput:
+    # Only the UUID column is selected, and rows are streamed through a
+    # server-side cursor instead of being buffered by the driver
+    query = select(Operation.uuid).where(Operation.status == OperationStatus.RUNNING)
+    if input.after is not None:
+        query = query.where(Operation.uuid > uuid_lib.UUID(input.after))
+    if input.until is not None:
+        query = query.where(Operation.uuid <= uuid_lib.UUID(input.until))
+
+    result: set[str] = set()
+    last = None
+    async with get_db(DatabaseRole.RECONCILIATION) as db:
+        uuids = await db.stream_scalars(
+            query.order_by(Operation.uuid)
+            .limit(input.limit)
+            .execution_options(yield_per=STREAM_BATCH_SIZE)
         )
+        async for op_uuid in uuids:
+            last = str(op_uuid)
+            result.add(last)
 
-        result = {str(op.uuid) for op in operations}
+    next_after = last if len(result) == input.limit else None
 
     activity.logger.info(f"Found {len(result)} RUNNING operations")
-    return GetRunningOperationsOutput(operations_uuids=result)
+    return GetRunningOperationsOutput(operations_uuids=result, next_after=next_after)
 
 
+@compact_payload("operations_uuids")
 @dataclass
 class ReconcileOperationInput:
     operations_uuids: set[str]
 
 
+@compact_payload()
 @dataclass
 class ReconcileOperationOutput:
     reconciled: int
+    visibility_rpcs: int = 0
+    duration_seconds: float = 0.0
+
+
+def to_operation_status(
+    workflow_status: WorkflowExecutionStatus,
+) -> Optional[OperationStatus]:
+    """Map a closed workflow status to the status of its operation."""
+    if workflow_status == WorkflowExecutionStatus.COMPLETED:
+        return OperationStatus.COMPLETED
+    if workflow_status in [
+        WorkflowExecutionStatus.FAILED,
+        WorkflowExecutionStatus.CANCELED,
+        WorkflowExecutionStatus.TERMINATED,
+        WorkflowExecutionStatus.TIMED_OUT,
+    ]:
+        return OperationStatus.FAILED
+    return None
+
+
+def record_reconciliation_metrics(
+    mode: str, checked: int, reconciled: int, visibility_rpcs: int, duration: float
+) -> None:
+    RECONCILIATION_DURATION.labels(mode).observe(duration)
+    RECONCILIATION_CHECKED.labels(mode).inc(checked)
+    RECONCILIATION_RECONCILED.labels(mode).inc(reconciled)
+    RECONCILIATION_VISIBILITY_RPCS.labels(mode).inc(visibility_rpcs)
 
 
 @activity.defn(name="reconcile_operation_status")
@@ -107,79 +240,292 @@ async def reconcile_operation_status(
 
     activity.logger.info(f"Reconciling {len(input.operations_uuids)} operations")
 
+    start = time.monotonic()
     client = await get_temporal_client()
+    stats = VisibilityStats()
+
+    # Operations whose workflow is still running are skipped below, looking them
+    # up in chunks is cheaper than listing all the running workflows of the
+    # namespace for every page of operations
+    workflows_status = await get_workflows_status(
+        client,
+        input.operations_uuids,
+        stats,
+        chunk_size=RECONCILIATION_QUERY_CHUNK_SIZE,
+        concurrency=RECONCILIATION_QUERY_CONCURRENCY,
+        on_chunk_done=activity.heartbeat,
+    )
 
-    reconciled_count = 0
-
-    running_workflow_uuids = set()
-    async for workflow in client.list_workflows("ExecutionStatus = 'Running'"):
-        uuid = workflow.search_attributes.get(OPERATION_UUID_ATTR_NAME)
-        if not uuid:
+    transitions = []
+    for op_uuid in input.operations_uuids:
+        workflow_status = workflows_status.get(op_uuid)
+        if workflow_status is None:
+            activity.logger.warning(
+                f"Operation with UUID {op_uuid} not found in workflows."
+            )
             continue
 
-        uuid = str(uuid[0])
-        running_workflow_uuids.add(uuid)
+        new_status = to_operation_status(workflow_status)
+        if new_status:
+            transitions.append(
+                StatusTransition(
+                    operation_uuid=uuid_lib.UUID(op_uuid), status=new_status
+                )
+            )
+
+    async with get_db(DatabaseRole.RECONCILIATION) as db:
+        outcome = await apply_transitions(db, transitions)
+
+    for transition in transitions:
+        if transition.operation_uuid in outcome.applied:
+            activity.logger.info(
+                f"Reconciled operation {transition.operation_uuid}:"
+                f" -> {transition.status}"
+            )
+    if outcome.missing:
+        activity.logger.warning(f"Operations {outcome.missing} not found")
+
+    output = ReconcileOperationOutput(
+        reconciled=len(outcome.applied),
+        visibility_rpcs=stats.rpcs,
+        duration_seconds=time.monotonic() - start,
+    )
+    record_reconciliation_metrics(
+        "full",
+        len(input.operations_uuids),
+        output.reconciled,
+        output.visibility_rpcs,
+        output.duration_seconds,
+    )
+    activity.logger.info(
+        f"Reconciled {output.reconciled} operations with {output.visibility_rpcs}"
+        f" visibility RPCs in {output.duration_seconds:.2f}s"
+    )
+    return output
+
+
+# Name of the watermark of `reconcile_closed_operations`
+CLOSED_WORKFLOWS_WATERMARK = "closed-workflows"
 
-    activity.logger.info(f"Found {len(running_workflow_uuids)} workflows still running")
 
-    # Query only the workflows that are NOT running
-    workflows_to_check = input.operations_uuids - running_workflow_uuids
-    activity.logger.info(f"Querying {len(workflows_to_check)} non-running workflows")
+@compact_payload()
+@dataclass
+class ReconcileClosedOperationsOutput:
+    checked: int
+    reconciled: int
+    visibility_rpcs: int
+    duration_seconds: float
+
+
+async def reconcile_closed_window(
+    client: Client,
+    closed_after: datetime,
+    closed_before: datetime,
+    stats: VisibilityStats,
+) -> Tuple[int, int]:
+    """
+    Reconcile the operations of the workflows closed in (closed_after,
+    closed_before] and move the watermark to `closed_before`, in the same
+    transaction. Returns the number of workflows checked and of operations
+    reconciled.
+    """
+    workflow_types = ", ".join(f"'{t}'" for t in TRACKED_WORKFLOW_TYPES)
+    query = (
+        f"WorkflowType IN ({workflow_types})"
+        f" AND {OPERATION_UUID_ATTR_NAME} IS NOT NULL"
+        f" AND CloseTime > '{closed_after.isoformat()}Z'"
+        f" AND CloseTime <= '{closed_before.isoformat()}Z'"
+    )
 
-    for op_uuid in workflows_to_check:
-        try:
-            workflow_status = None
-            async for workflow in client.list_workflows(
-                f"{OPERATION_UUID_ATTR_NAME} = '{op_uuid}'", page_size=1
-            ):
-                workflow_status = workflow.status
+    transitions: dict[str, StatusTransition] = {}
+    async for workflow in list_workflows(
+        client, query, stats, on_page_done=activity.heartbeat
+    ):
+        op_uuid = operation_uuid_of(workflow)
+        new_status = to_operation_status(workflow.status) if workflow.status else None
+        # Visibility returns the most recent workflows first
+        if op_uuid and new_status and op_uuid not in transitions:
+            transitions[op_uuid] = StatusTransition(
+                operation_uuid=uuid_lib.UUID(op_uuid), status=new_status
+            )
+
+    async with get_db(DatabaseRole.RECONCILIATION) as db:
+        outcome = await apply_transitions(
+            db, list(transitions.values()), check_not_applied=False
+        )
 
-            if workflow_status is None:
-                activity.logger.warning(
-                    f"Operation with UUID {op_uuid} not found in workflows."
-                )
-                continue
-
-            # Map Temporal status to OperationStatus
-            new_status = None
-            if workflow_status == WorkflowExecutionStatus.COMPLETED:
-                new_status = OperationStatus.COMPLETED
-            elif workflow_status in [
-                WorkflowExecutionStatus.FAILED,
-                WorkflowExecutionStatus.CANCELED,
-                WorkflowExecutionStatus.TERMINATED,
-                WorkflowExecutionStatus.TIMED_OUT,
-            ]:
-                new_status = OperationStatus.FAILED
-
-            if new_status:
-                with get_db() as db:
-                    operation = (
-                        db.query(Operation).filter(Operation.uuid == op_uuid).first()
-                    )
-
-                    if not operation:
-                        activity.logger.warning(f"Operation {op_uuid} not found")
-                        continue
-
-                    old_status = operation.status
-                    operation.status = new_status
-
-                    if new_status in [
-                        OperationStatus.COMPLETED,
-                        OperationStatus.FAILED,
-                    ]:
-                        operation.finished_at = datetime.utcnow()
-
-                    db.commit()
-                    reconciled_count += 1
-
-                    activity.logger.info(
-                        f"Reconciled operation {op_uuid}: {old_status} -> {new_status}"
-                    )
-
-        except Exception as e:
-            activity.logger.error(f"Error reconciling operation {op_uuid}: {e}")
-            continue
+        upsert = insert(ReconciliationWatermark).values(
+            name=CLOSED_WORKFLOWS_WATERMARK, closed_before=closed_before
+        )
+        await db.execute(
+            upsert.on_conflict_do_update(
+                index_elements=[ReconciliationWatermark.name],
+                set_={"closed_before": upsert.excluded.closed_before},
+            )
+        )
+
+    for op_uuid in outcome.applied:
+        activity.logger.info(
+            f"Reconciled operation {op_uuid}: -> {transitions[str(op_uuid)].status}"
+        )
+    return len(transitions), len(outcome.applied)
+
+
+@activity.defn(name="reconcile_closed_operations")
+async def reconcile_closed_operations() -> ReconcileClosedOperationsOutput:
+    """
+    Incremental reconciliation: only the workflows closed since the last run are
+    queried, so the cost depends on the number of changes and not on the number of
+    running operations.
+
+    Operations whose workflow already updated them are left untouched by the
+    transitions guard. Runs go back at most one full scan interval, the full scan
+    being in charge of anything older, and work through it in windows of
+    RECONCILIATION_WINDOW_MINUTES, moving the watermark after each one and
+    heartbeating after each page of workflows.
+    """
+    start = time.monotonic()
+    run_started_at = datetime.utcnow()
+
+    async with get_db(DatabaseRole.RECONCILIATION) as db:
+        watermark = await db.get(ReconciliationWatermark, CLOSED_WORKFLOWS_WATERMARK)
+
+    closed_after = run_started_at - timedelta(
+        minutes=RECONCILIATION_FULL_SCAN_INTERVAL_MINUTES
+    )
+    if watermark:
+        closed_after = max(
+            closed_after,
+            watermark.closed_before
+            - timedelta(seconds=RECONCILIATION_WATERMARK_OVERLAP_SECONDS),
+        )
+    activity.logger.info(f"Reconciling workflows closed after {closed_after}")
+
+    client = await get_temporal_client()
+    stats = VisibilityStats()
+
+    checked = reconciled = 0
+    while closed_after < run_started_at:
+        closed_before = min(
+            closed_after + timedelta(minutes=RECONCILIATION_WINDOW_MINUTES),
+            run_started_at,
+        )
+        window_checked, window_reconciled = await reconcile_closed_window(
+            client, closed_after, closed_before, stats
+        )
+        checked += window_checked
+        reconciled += window_reconciled
+        closed_after = closed_before
+
+    output = ReconcileClosedOperationsOutput(
+        checked=checked,
+        reconciled=reconciled,
+        visibility_rpcs=stats.rpcs,
+        duration_seconds=time.monotonic() - start,
+    )
+    record_reconciliation_metrics(
+        "incremental",
+        output.checked,
+        output.reconciled,
+        output.visibility_rpcs,
+        output.duration_seconds,
+    )
+    activity.logger.info(
+        f"Checked {output.checked} closed workflows, reconciled {output.reconciled}"
+        f" operations with {output.visibility_rpcs} visibility RPCs in"
+        f" {output.duration_seconds:.2f}s"
+    )
+    return output
+
+
+@activity.defn(name="roll_up_operation_stats")
+async def roll_up_operation_stats() -> None:
+    """Roll the minute buckets of the operation stats up into the larger spans."""
+    async with get_db(DatabaseRole.RECONCILIATION) as db:
+        rolled_up_until = await roll_up_stats(db, datetime.utcnow())
 
-    return ReconcileOperationOutput(reconciled=reconciled_count)
+    activity.logger.info(
+        "Rolled up the operation stats until "
+        + ", ".join(
+            f"{until.isoformat()} ({span}s)" for span, until in rolled_up_until.items()
+        )
+    )
+
+
+@activity.defn(name="create_operations_partitions")
+async def create_operations_partitions() -> List[str]:
+    """Create the missing partitions up to OPERATIONS_PARTITIONS_AHEAD_MONTHS ahead."""
+    this_month = month_of(datetime.utcnow())
+    async with get_db(DatabaseRole.RECONCILIATION) as db:
+        created = await create_partitions(
+            db, this_month, add_months(this_month, OPERATIONS_PARTITIONS_AHEAD_MONTHS)
+        )
+        # Left there only for months before this one, which get no partition
+        unpartitioned = await count_default_partition_rows(db)
+
+    activity.logger.info(f"Created {len(created)} operations partitions")
+    if unpartitioned:
+        activity.logger.warning(
+            f"{unpartitioned} operations are in the default partition, outside of"
+            " the monthly partitions"
+        )
+    return [month.isoformat() for month in created]
+
+
+@activity.defn(name="get_archivable_partitions")
+async def get_archivable_partitions() -> List[str]:
+    """Months of the partitions ended more than OPERATIONS_ARCHIVE_AFTER_MONTHS ago."""
+    before = add_months(month_of(datetime.utcnow()), -OPERATIONS_ARCHIVE_AFTER_MONTHS)
+    async with get_db(DatabaseRole.RECONCILIATION) as db:
+        months = await list_partitions(db)
+
+    return [month.isoformat() for month in months if month < before]
+
+
+@compact_payload()
+@dataclass
+class ArchivePartitionInput:
+    # First day of the month, in ISO format
+    month: str
+
+
+@compact_payload()
+@dataclass
+class ArchivePartitionOutput:
+    archived: int
+    # Not archived because some of its operations aren't finished
+    skipped: bool = False
+
+
+@activity.defn(name="archive_operations_partition")
+async def archive_operations_partition(
+    input: ArchivePartitionInput,
+) -> ArchivePartitionOutput:
+    """
+    Move the operations of a month to the archive and drop their partition.
+
+    The operations are copied in a first transaction, heartbeating after each
+    chunk, and the partition is dropped in a second one, as it locks the whole
+    table. A retry after a failed drop only retries the drop. Partitions with
+    operations that aren't finished are left untouched, as these may still
+    change: finished operations never do.
+    """
+    month = date.fromisoformat(input.month)
+
+    async with get_db(DatabaseRole.RECONCILIATION) as db:
+        archive = await db.get(OperationArchive, month)
+        if archive:
+            archived = archive.operations
+        elif await has_active_operations(db, month):
+            activity.logger.warning(
+                f"Not archiving the operations of {input.month}, some aren't finished"
+            )
+            return ArchivePartitionOutput(archived=0, skipped=True)
+        else:
+            archived = await copy_to_archive(db, month, on_chunk=activity.heartbeat)
+
+    async with get_db(DatabaseRole.RECONCILIATION) as db:
+        await drop_partition(db, month)
+
+    activity.logger.info(f"Archived {archived} operations of {input.month}")
+    return ArchivePartitionOutput(archived=archived)
@@ -3,6 +3,7 @@ from typing import Optional
 from temporalio.client import Client
 
 from app.constants import TEMPORAL_HOST, TEMPORAL_NAMESPACE
+from app.temporal.converter import data_converter
 
 
 
@@ -14,7 +15,7 @@ async def get_temporal_client() -> Client:
 
     if _temporal_client is None:
         _temporal_client = await Client.connect(
-            TEMPORAL_HOST, namespace=TEMPORAL_NAMESPACE
+            TEMPORAL_HOST, namespace=TEMPORAL_NAMESPACE, data_converter=data_converter
         )
 
     return _temporal_client
@@ -0,0 +1,183 @@
+"""
+Compact Temporal payloads for the dataclasses of the activities.
+
+Temporal's default converter writes dataclasses as JSON objects, with UUIDs as
+36-character strings: a page of RUNNING operations costs ~39 bytes per UUID,
+written to the history of the reconciliation on every run. Dataclasses
+registered with `compact_payload` are instead encoded as `binary/compact`:
+
+    <length of the JSON: uint32><JSON array of the other fields>
+    <number of UUIDs: uint32><16 bytes per UUID> for each UUID field
+
+i.e. their UUID fields (`str`, `Optional[str]` or a set or list of `str`) are
+packed as 16 bytes per UUID, in order for lists and sorted for sets (making the
+payloads deterministic), and their other fields are written as a JSON array of
+their values without the field names. Fields are read back in order and
+missing trailing fields get their default, so new fields must be added at the end.
+
+Operations UUIDs are random (v4), so neither delta encoding nor compression would
+make the packed UUIDs smaller. Payloads written by the default converter are
+still decoded, so that workflows started before keep running.
+"""
+
+import dataclasses
+import json
+import operator
+import re
+import struct
+import typing
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type
+
+from temporalio.api.common.v1 import Payload
+from temporalio.converter import (
+    AdvancedJSONEncoder,
+    CompositePayloadConverter,
+    DataConverter,
+    DefaultPayloadConverter,
+    EncodingPayloadConverter,
+    value_to_type,
+)
+
+ENCODING = b"binary/compact"
+
+_LENGTH = struct.Struct("!I")
+
+
+def pack_uuids(values: Iterable[str]) -> bytes:
+    """Pack UUID strings as 16 bytes each, in order."""
+    hexes = [value.replace("-", "") for value in values]
+    data = bytes.fromhex("".join(hexes))
+    if len(data) != 16 * len(hexes):
+        raise ValueError("Not a collection of UUIDs")
+    return data
+
+
+_UUID_HEX = re.compile(".{32}", re.DOTALL)
+_UUID_PARTS = operator.itemgetter(
+    slice(0, 8), slice(8, 12), slice(12, 16), slice(16, 20), slice(20, 32)
+)
+
+
+def unpack_uuids(data: bytes) -> List[str]:
+    # Looping in builtins only, several times faster than `uuid.UUID(bytes=...)`
+    return list(map("-".join, map(_UUID_PARTS, _UUID_HEX.findall(data.hex()))))
+
+
+@dataclasses.dataclass
+class _Layout:
+    cls: type
+    plain_fields: List[Tuple[str, Any]]
+    # Name and collection type of the UUID fields, None for a single UUID
+    uuid_fields: List[Tuple[str, Optional[Callable[[Iterable[str]], Any]]]]
+
+
+_layouts: Dict[str, _Layout] = {}
+
+
+def _uuid_collection(hint: Any) -> Optional[Callable[[Iterable[str]], Any]]:
+    if hint is str or hint == Optional[str]:
+        return None
+    origin = typing.get_origin(hint)
+    if origin in (set, frozenset, list) and typing.get_args(hint) == (str,):
+        return origin
+    raise TypeError(f"{hint} isn't a UUID or a collection of UUIDs")
+
+
+def compact_payload(*uuid_fields: str) -> Callable[[type], type]:
+    """Register a dataclass to be encoded as `binary/compact`."""
+
+    def register(cls: type) -> type:
+        # Payloads only carry the name of the class, which must be unique. Modules
+        # re-imported by the workflow sandbox register their classes again
+        registered = _layouts.get(cls.__qualname__)
+        if registered and registered.cls.__module__ != cls.__module__:
+            raise ValueError(f"{cls.__qualname__} is already registered")
+        hints = typing.get_type_hints(cls)
+        names = [field.name for field in dataclasses.fields(cls)]
+        _layouts[cls.__qualname__] = _Layout(
+            cls=cls,
+            plain_fields=[
+                (name, hints[name]) for name in names if name not in uuid_fields
+            ],
+            uuid_fields=[
+                (name, _uuid_collection(hints[name]))
+                for name in names
+                if name in uuid_fields
+            ],
+        )
+        return cls
+
+    return register
+
+
+class CompactEncodingPayloadConverter(EncodingPayloadConverter):
+    @property
+    def encoding(self) -> str:
+        return ENCODING.decode()
+
+    def to_payload(self, value: Any) -> Optional[Payload]:
+        layout = _layouts.get(type(value).__qualname__)
+        if layout is None or type(value).__module__ != layout.cls.__module__:
+            return None
+
+        plain = json.dumps(
+            [getattr(value, name) for name, _ in layout.plain_fields],
+            cls=AdvancedJSONEncoder,
+            separators=(",", ":"),
+        ).encode()
+        chunks = [_LENGTH.pack(len(plain)), plain]
+        for name, collection in layout.uuid_fields:
+            uuids = getattr(value, name)
+            if collection is None:
+                uuids = () if uuids is None else (uuids,)
+            elif collection is not list:
+                uuids = sorted(uuids)
+            chunks.append(_LENGTH.pack(len(uuids)))
+            chunks.append(pack_uuids(uuids))
+
+        return Payload(
+            metadata={"encoding": ENCODING, "type": layout.cls.__qualname__.encode()},
+            data=b"".join(chunks),
+        )
+
+    def from_payload(self, payload: Payload, type_hint: Optional[Type] = None) -> Any:
+        name = payload.metadata["type"].decode()
+        layout = _layouts.get(name)
+        if layout is None:
+            raise RuntimeError(f"Unknown compact payload type {name}")
+
+        data = payload.data
+        (length,) = _LENGTH.unpack_from(data)
+        offset = _LENGTH.size + length
+        values = json.loads(data[_LENGTH.size : offset])
+        fields = {
+            name: value_to_type(hint, value)
+            for (name, hint), value in zip(layout.plain_fields, values)
+        }
+        for name, collection in layout.uuid_fields:
+            if offset == len(data):
+                break
+            (count,) = _LENGTH.unpack_from(data, offset)
+            offset += _LENGTH.size
+            uuids = unpack_uuids(data[offset : offset + 16 * count])
+            offset += 16 * count
+            if collection is None:
+                fields[name] = uuids[0] if uuids else None
+            else:
+                fields[name] = collection(uuids)
+        return layout.cls(**fields)
+
+
+class CompactPayloadConverter(CompositePayloadConverter):
+    """Default payload converter, encoding the registered dataclasses compactly."""
+
+    def __init__(self) -> None:
+        super().__init__(
+            CompactEncodingPayloadConverter(),
+            *DefaultPayloadConverter.default_encoding_payload_converters,
+        )
+
+
+# Must be used by every client and worker handling the activities: both
+# `get_temporal_client` and the worker use it
+data_converter = DataConverter(payload_converter_class=CompactPayloadConverter)
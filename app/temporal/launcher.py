@@ -0,0 +1,96 @@
+"""
+Runs several worker processes, so that a single container can use several cores.
+
+    python -m app.temporal.launcher --processes 4
+
+Processes are started with the `spawn` method: each one imports the application
+anew and gets its own Temporal runtime, client and database engines, none of
+which survive a fork.
+
+Shutdown protocol: on SIGINT or SIGTERM the launcher sends SIGTERM to every
+worker, which stops polling and waits up to WORKER_GRACEFUL_SHUTDOWN_SECONDS for
+its running activities. Workers still running after that (plus a margin) are
+killed. If a worker exits on its own, the others are shut down the same way and
+the launcher exits with its exit code, leaving the restart to the supervisor
+(e.g. the restart policy of the container).
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import multiprocessing.connection
+import signal
+import sys
+import time
+from typing import List
+
+from app.constants import WORKER_GRACEFUL_SHUTDOWN_SECONDS, WORKER_PROCESSES
+
+# Time given to the workers to exit on top of their graceful shutdown
+SHUTDOWN_MARGIN_SECONDS = 10
+
+
+def run_worker_process(index: int) -> None:
+    # Imported here so that the launcher itself doesn't connect to anything
+    from app.temporal.worker import run_worker
+
+    asyncio.run(run_worker(index))
+
+
+def stop_workers(workers: List[multiprocessing.Process]) -> None:
+    for worker in workers:
+        if worker.is_alive():
+            worker.terminate()
+
+    deadline = time.monotonic() + WORKER_GRACEFUL_SHUTDOWN_SECONDS
+    deadline += SHUTDOWN_MARGIN_SECONDS
+    for worker in workers:
+        worker.join(max(0.0, deadline - time.monotonic()))
+        if worker.is_alive():
+            print(f"{worker.name} didn't stop in time, killing it")
+            worker.kill()
+            worker.join()
+
+
+def launch(processes: int) -> int:
+    """Run the worker processes until a signal or until one of them exits."""
+    stopping = False
+
+    def handle_shutdown(signum, frame):
+        nonlocal stopping
+        print(f"\nShutdown signal received, stopping {processes} workers...")
+        stopping = True
+
+    signal.signal(signal.SIGINT, handle_shutdown)
+    signal.signal(signal.SIGTERM, handle_shutdown)
+
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=run_worker_process, args=(i,), name=f"worker-{i}")
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+
+    while not stopping and all(worker.is_alive() for worker in workers):
+        multiprocessing.connection.wait([w.sentinel for w in workers], timeout=1)
+
+    exited = [worker for worker in workers if not worker.is_alive()]
+    stop_workers(workers)
+
+    if stopping:
+        return 0
+    print(f"{exited[0].name} exited with code {exited[0].exitcode}")
+    return exited[0].exitcode or 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES)
+    args = parser.parse_args()
+
+    sys.exit(launch(args.processes))
+
+
+if __name__ == "__main__":
+    main()
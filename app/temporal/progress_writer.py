@@ -0,0 +1,170 @@
+"""Rate-limited write-behind buffer coalescing progress reports into batched UPDATEs."""
+
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import UUID, Update, column, update, values
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.constants import PROGRESS_BATCH_MAX_SIZE, PROGRESS_MIN_INTERVAL_SECONDS
+from app.database import DatabaseRole, get_db
+from app.enums import OperationStatus
+from app.models import Operation
+
+logger = logging.getLogger(__name__)
+
+operations = Operation.__table__
+
+# Linger before each batch to let the reports of other operations join it
+_BATCH_DELAY = 0.1
+
+
+@dataclass
+class ProgressWriterStats:
+    reported: int = 0
+    # Reports replaced by a newer one of the same operation before being written
+    coalesced: int = 0
+    written: int = 0
+    flushes: int = 0
+    failed_flushes: int = 0
+    pending: int = 0
+
+
+def progress_statement(progress: Dict[uuid.UUID, dict]) -> Update:
+    """
+    Build a single `UPDATE ... FROM (VALUES ...)` writing the progress of several
+    operations. Operations that aren't RUNNING anymore are left untouched, so a
+    late report can't overwrite the progress of a finished operation.
+    """
+    rows = values(
+        column("uuid", UUID(as_uuid=True)),
+        column("progress", JSONB),
+        name="reports",
+    ).data(list(progress.items()))
+
+    return (
+        update(operations)
+        .where(
+            operations.c.uuid == rows.c.uuid,
+            operations.c.status == OperationStatus.RUNNING,
+        )
+        .values(progress=rows.c.progress)
+    )
+
+
+class ProgressWriter:
+    """
+    Writes the latest progress reported for each operation to its row, at most
+    every `min_interval` seconds per operation.
+
+    Reports received while an operation waits for its next write replace each
+    other, so its row is updated at most once per `min_interval` whatever the
+    reporting rate, and the operations due are written with a single UPDATE per
+    batch of up to `max_batch_size` operations. `report` doesn't wait for the
+    write: progress is informative, a failed write is dropped and superseded by
+    the next report.
+    """
+
+    def __init__(self, min_interval: float, max_batch_size: int) -> None:
+        self._min_interval = min_interval
+        self._max_batch_size = max_batch_size
+        self._pending: Dict[uuid.UUID, dict] = {}
+        # Last write of the operations written less than `min_interval` ago
+        self._written_at: Dict[uuid.UUID, float] = {}
+        self._has_pending = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = ProgressWriterStats()
+
+    def report(
+        self, operation_uuid: uuid.UUID, percent: float, phase: Optional[str] = None
+    ) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+        if operation_uuid in self._pending:
+            self.stats.coalesced += 1
+        self._pending[operation_uuid] = {
+            "percent": round(min(max(percent, 0.0), 100.0), 1),
+            "phase": phase,
+            "updated_at": datetime.utcnow().isoformat(),
+        }
+        self.stats.reported += 1
+        self.stats.pending = len(self._pending)
+        self._has_pending.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_pending.wait()
+            await asyncio.sleep(_BATCH_DELAY)
+
+            batch, next_due = self._take_batch(time.monotonic())
+            if batch:
+                await self._flush(batch)
+            else:
+                # Only operations written less than `min_interval` ago are pending
+                await asyncio.sleep(next_due - time.monotonic())
+
+    def _take_batch(self, now: float) -> Tuple[Dict[uuid.UUID, dict], float]:
+        """Take the pending operations due for a write, and the next due time."""
+        self._written_at = {
+            op_uuid: written_at
+            for op_uuid, written_at in self._written_at.items()
+            if written_at + self._min_interval > now
+        }
+
+        batch: Dict[uuid.UUID, dict] = {}
+        next_due = float("inf")
+        for op_uuid in self._pending:
+            written_at = self._written_at.get(op_uuid)
+            if written_at is not None:
+                next_due = min(next_due, written_at + self._min_interval)
+            elif len(batch) < self._max_batch_size:
+                batch[op_uuid] = self._pending[op_uuid]
+
+        for op_uuid in batch:
+            del self._pending[op_uuid]
+            self._written_at[op_uuid] = now
+        if not self._pending:
+            self._has_pending.clear()
+        self.stats.pending = len(self._pending)
+
+        return batch, next_due
+
+    async def _flush(self, batch: Dict[uuid.UUID, dict]) -> None:
+        start = time.perf_counter()
+        try:
+            async with get_db(DatabaseRole.WORKER_WRITE) as db:
+                await db.execute(progress_statement(batch))
+        except Exception as e:
+            self.stats.failed_flushes += 1
+            logger.error(
+                f"Failed to write the progress of {len(batch)} operations: {e}"
+            )
+            return
+
+        self.stats.flushes += 1
+        self.stats.written += len(batch)
+        logger.debug(
+            f"Wrote the progress of {len(batch)} operations in"
+            f" {(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+
+
+_progress_writer: Optional[ProgressWriter] = None
+
+
+def get_progress_writer() -> ProgressWriter:
+    global _progress_writer
+
+    if _progress_writer is None:
+        _progress_writer = ProgressWriter(
+            min_interval=PROGRESS_MIN_INTERVAL_SECONDS,
+            max_batch_size=PROGRESS_BATCH_MAX_SIZE,
+        )
+
+    return _progress_writer
@@ -11,14 +11,24 @@ from temporalio.client import (
     ScheduleUpdateInput,
 )
 
-from app.constants import TEMPORAL_TASK_QUEUE
+from app.constants import (
+    RECONCILIATION_FULL_SCAN_INTERVAL_MINUTES,
+    STATS_ROLLUP_INTERVAL_MINUTES,
+    TEMPORAL_TASK_QUEUE,
+)
+from app.temporal.workflows.archival import ArchivalWorkflow
 from app.temporal.workflows.reconciliation import (
     ReconciliationWorkflow,
+    ReconciliationWorkflowInput,
 )
+from app.temporal.workflows.stats_rollup import StatsRollupWorkflow
 
 
 # Schedule ID constants
 RECONCILIATION_SCHEDULE_ID = "reconciliation-schedule"
+FULL_RECONCILIATION_SCHEDULE_ID = "full-reconciliation-schedule"
+ARCHIVAL_SCHEDULE_ID = "archival-schedule"
+STATS_ROLLUP_SCHEDULE_ID = "stats-rollup-schedule"
 
 
 # Define all schedules
@@ -30,7 +40,44 @@ SCHEDULES: Final[dict[str, Schedule]] = {
             task_queue=TEMPORAL_TASK_QUEUE,
         ),
         spec=ScheduleSpec(intervals=[ScheduleIntervalSpec(every=timedelta(minutes=1))]),
-    )
+    ),
+    FULL_RECONCILIATION_SCHEDULE_ID: Schedule(
+        action=ScheduleActionStartWorkflow(
+            ReconciliationWorkflow.run,
+            ReconciliationWorkflowInput(full_scan=True),
+            id=f"reconciliation-{FULL_RECONCILIATION_SCHEDULE_ID}",
+            task_queue=TEMPORAL_TASK_QUEUE,
+        ),
+        spec=ScheduleSpec(
+            intervals=[
+                ScheduleIntervalSpec(
+                    every=timedelta(minutes=RECONCILIATION_FULL_SCAN_INTERVAL_MINUTES)
+                )
+            ]
+        ),
+    ),
+    ARCHIVAL_SCHEDULE_ID: Schedule(
+        action=ScheduleActionStartWorkflow(
+            ArchivalWorkflow.run,
+            id=f"archival-{ARCHIVAL_SCHEDULE_ID}",
+            task_queue=TEMPORAL_TASK_QUEUE,
+        ),
+        spec=ScheduleSpec(intervals=[ScheduleIntervalSpec(every=timedelta(days=1))]),
+    ),
+    STATS_ROLLUP_SCHEDULE_ID: Schedule(
+        action=ScheduleActionStartWorkflow(
+            StatsRollupWorkflow.run,
+            id=f"stats-rollup-{STATS_ROLLUP_SCHEDULE_ID}",
+            task_queue=TEMPORAL_TASK_QUEUE,
+        ),
+        spec=ScheduleSpec(
+            intervals=[
+                ScheduleIntervalSpec(
+                    every=timedelta(minutes=STATS_ROLLUP_INTERVAL_MINUTES)
+                )
+            ]
+        ),
+    ),
 }
 
 
@@ -0,0 +1,167 @@
+"""Write-behind buffer coalescing status transitions into batched UPDATEs."""
+
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from app.constants import STATUS_BATCH_MAX_DELAY_MS, STATUS_BATCH_MAX_SIZE
+from app.database import DatabaseRole, get_db
+from app.transitions import StatusTransition, apply_transitions
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StatusWriterStats:
+    flushes: int = 0
+    transitions: int = 0
+    failed_flushes: int = 0
+    last_batch_size: int = 0
+    max_batch_size: int = 0
+    last_flush_seconds: float = 0.0
+    total_flush_seconds: float = 0.0
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.transitions / self.flushes if self.flushes else 0.0
+
+    @property
+    def mean_flush_seconds(self) -> float:
+        return self.total_flush_seconds / self.flushes if self.flushes else 0.0
+
+
+class StatusWriter:
+    """
+    Collects status transitions for up to `max_delay` seconds or `max_batch_size`
+    items and writes them with a single multi-row UPDATE in one transaction.
+
+    `submit` returns only once the transition has been committed, so callers
+    (i.e. the `update_operation_status` local activity) keep their durability
+    guarantees. Transitions are flushed by a single background task: while a
+    batch is being written the next one keeps filling up.
+    """
+
+    def __init__(self, max_batch_size: int, max_delay: float) -> None:
+        self._max_batch_size = max_batch_size
+        self._max_delay = max_delay
+        self._pending: List[Tuple[StatusTransition, asyncio.Future]] = []
+        self._has_pending = asyncio.Event()
+        self._is_full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = StatusWriterStats()
+
+    async def submit(self, transition: StatusTransition) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((transition, future))
+        self._has_pending.set()
+        if len(self._pending) >= self._max_batch_size:
+            self._is_full.set()
+
+        await future
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_pending.wait()
+
+            # Linger to let concurrent transitions join the batch
+            try:
+                await asyncio.wait_for(self._is_full.wait(), self._max_delay)
+            except asyncio.TimeoutError:
+                pass
+
+            await self._flush(self._take_batch())
+
+    def _take_batch(self) -> List[Tuple[StatusTransition, asyncio.Future]]:
+        batch: List[Tuple[StatusTransition, asyncio.Future]] = []
+        deferred: List[Tuple[StatusTransition, asyncio.Future]] = []
+        batch_uuids: set[uuid.UUID] = set()
+
+        for item in self._pending:
+            transition, future = item
+            if future.done():
+                # The caller gave up (e.g. activity timeout), it will be retried
+                continue
+
+            # An operation can appear only once per UPDATE, later transitions
+            # for the same operation go in the next batch to keep their order
+            if (
+                len(batch) >= self._max_batch_size
+                or transition.operation_uuid in batch_uuids
+            ):
+                deferred.append(item)
+                continue
+
+            batch.append(item)
+            batch_uuids.add(transition.operation_uuid)
+
+        self._pending = deferred
+        if not deferred:
+            self._has_pending.clear()
+        if len(deferred) < self._max_batch_size:
+            self._is_full.clear()
+
+        return batch
+
+    async def _flush(self, batch: List[Tuple[StatusTransition, asyncio.Future]]) -> None:
+        if not batch:
+            return
+
+        start = time.perf_counter()
+        try:
+            async with get_db(DatabaseRole.WORKER_WRITE) as db:
+                outcome = await apply_transitions(db, [t for t, _ in batch])
+        except Exception as e:
+            self.stats.failed_flushes += 1
+            logger.error(f"Failed to write {len(batch)} status transitions: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        elapsed = time.perf_counter() - start
+        self.stats.flushes += 1
+        self.stats.transitions += len(batch)
+        self.stats.last_batch_size = len(batch)
+        self.stats.max_batch_size = max(self.stats.max_batch_size, len(batch))
+        self.stats.last_flush_seconds = elapsed
+        self.stats.total_flush_seconds += elapsed
+        logger.debug(
+            f"Wrote {len(batch)} status transitions in {elapsed * 1000:.1f} ms"
+            f" ({len(outcome.rejected)} not allowed)"
+        )
+
+        for transition, future in batch:
+            if future.done():
+                continue
+            if transition.operation_uuid in outcome.rejected:
+                logger.info(
+                    f"Ignored transition of operation {transition.operation_uuid}"
+                    f" to {transition.status}: not allowed from its current status"
+                )
+            if transition.operation_uuid not in outcome.missing:
+                future.set_result(None)
+            else:
+                future.set_exception(
+                    ValueError(f"Operation {transition.operation_uuid} not found")
+                )
+
+
+_status_writer: Optional[StatusWriter] = None
+
+
+def get_status_writer() -> StatusWriter:
+    global _status_writer
+
+    if _status_writer is None:
+        _status_writer = StatusWriter(
+            max_batch_size=STATUS_BATCH_MAX_SIZE,
+            max_delay=STATUS_BATCH_MAX_DELAY_MS / 1000,
+        )
+
+    return _status_writer
@@ -1,6 +1,6 @@
 import functools
 from datetime import timedelta
-from typing import Any, Callable
+from typing import Any, Callable, Optional
 
 from temporalio import workflow
 
@@ -14,6 +14,13 @@ with workflow.unsafe.imports_passed_through():
     )
 
 
+def get_operation_uuid() -> Optional[str]:
+    """UUID of the operation of the current workflow, None if it isn't tracked."""
+    uuid = workflow.info().search_attributes.get(OPERATION_UUID_ATTR_NAME)
+    # the search attribute is always a list
+    return str(uuid[0]) if uuid else None
+
+
 def track_operation_status(func: Callable) -> Callable:
     """
     Decorator for workflow run methods that automatically tracks operation status in the database.
@@ -27,16 +34,13 @@ def track_operation_status(func: Callable) -> Callable:
     @functools.wraps(func)
     async def wrapper(self, input: Any) -> Any:
         info = workflow.info()
-        uuid = info.search_attributes.get(OPERATION_UUID_ATTR_NAME)
-        if not uuid:
+        operation_uuid = get_operation_uuid()
+        if not operation_uuid:
             raise RuntimeError(
                 f"Status tracking has been enabled for workflow {info.workflow_type}"
                 f" but the Search Attribute {OPERATION_UUID_ATTR_NAME} has not been set."
             )
 
-        # the search attribute is always a list
-        operation_uuid = str(uuid[0])
-
         try:
             workflow.logger.info(f"Starting workflow for operation {operation_uuid}")
             await workflow.execute_local_activity(
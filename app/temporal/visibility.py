@@ -0,0 +1,102 @@
+"""Helpers for querying Temporal visibility about operations' workflows."""
+
+import asyncio
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Iterable, List, Optional
+
+from temporalio.client import Client, WorkflowExecution, WorkflowExecutionStatus
+
+from app.constants import OPERATION_UUID_ATTR_NAME
+
+
+@dataclass
+class VisibilityStats:
+    rpcs: int = 0
+
+
+def operation_uuid_of(workflow: WorkflowExecution) -> Optional[str]:
+    uuid = workflow.search_attributes.get(OPERATION_UUID_ATTR_NAME)
+    if not uuid:
+        return None
+
+    # the search attribute is always a list
+    return str(uuid[0])
+
+
+async def list_workflows(
+    client: Client,
+    query: str,
+    stats: VisibilityStats,
+    page_size: int = 1000,
+    on_page_done: Optional[Callable[[int], None]] = None,
+) -> AsyncIterator[WorkflowExecution]:
+    """
+    Same as `Client.list_workflows`, but counting the RPCs in `stats`.
+    `on_page_done` is called with the number of pages listed so far, e.g. to
+    heartbeat.
+    """
+    iterator = client.list_workflows(query, page_size=page_size)
+    pages = 0
+    while True:
+        await iterator.fetch_next_page()
+        stats.rpcs += 1
+
+        for workflow in iterator.current_page or []:
+            yield workflow
+
+        pages += 1
+        if on_page_done:
+            on_page_done(pages)
+
+        if not iterator.next_page_token:
+            return
+
+
+async def get_workflows_status(
+    client: Client,
+    operations_uuids: Iterable[str],
+    stats: VisibilityStats,
+    chunk_size: int,
+    concurrency: int,
+    on_chunk_done: Optional[Callable[[int], None]] = None,
+) -> dict[str, WorkflowExecutionStatus]:
+    """
+    Get the status of the workflows of the given operations.
+
+    Operations are looked up in chunks of `chunk_size` with an
+    `OperationUUID IN (...)` query, running up to `concurrency` queries at a time.
+    Operations without a workflow are missing from the result. If an operation
+    has several workflows, the first one returned by visibility (i.e. the most
+    recent one) is used. `on_chunk_done` is called with the number of chunks
+    looked up so far, e.g. to heartbeat.
+    """
+    uuids = sorted(operations_uuids)
+    chunks = [uuids[i : i + chunk_size] for i in range(0, len(uuids), chunk_size)]
+    semaphore = asyncio.Semaphore(concurrency)
+    chunks_done = 0
+
+    async def lookup(chunk: List[str]) -> dict[str, WorkflowExecutionStatus]:
+        nonlocal chunks_done
+        in_list = ", ".join(f"'{uuid}'" for uuid in chunk)
+        statuses: dict[str, WorkflowExecutionStatus] = {}
+        async with semaphore:
+            async for workflow in list_workflows(
+                client,
+                f"{OPERATION_UUID_ATTR_NAME} IN ({in_list})",
+                stats,
+                page_size=len(chunk),
+            ):
+                uuid = operation_uuid_of(workflow)
+                if uuid and workflow.status and uuid not in statuses:
+                    statuses[uuid] = workflow.status
+
+        chunks_done += 1
+        if on_chunk_done:
+            on_chunk_done(chunks_done)
+        return statuses
+
+    result: dict[str, WorkflowExecutionStatus] = {}
+    for statuses in await asyncio.gather(*(lookup(chunk) for chunk in chunks)):
+        result.update(statuses)
+
+    return result
@@ -2,19 +2,48 @@ import asyncio
 import logging
 import signal
 import sys
+from datetime import timedelta
 
+from prometheus_client import start_http_server
 from temporalio.client import Client
 from temporalio.worker import Worker
 
-from app.constants import TEMPORAL_HOST, TEMPORAL_NAMESPACE, TEMPORAL_TASK_QUEUE
+from app.constants import (
+    TEMPORAL_HOST,
+    TEMPORAL_NAMESPACE,
+    TEMPORAL_TASK_QUEUE,
+    WORKER_ACTIVITY_TASK_POLLERS,
+    WORKER_GRACEFUL_SHUTDOWN_SECONDS,
+    WORKER_MAX_CACHED_WORKFLOWS,
+    WORKER_MAX_CONCURRENT_ACTIVITIES,
+    WORKER_MAX_CONCURRENT_LOCAL_ACTIVITIES,
+    WORKER_MAX_CONCURRENT_WORKFLOW_TASKS,
+    WORKER_METRICS_PORT,
+    WORKER_WORKFLOW_TASK_POLLERS,
+)
+from app.database import dispose_engines
+from app.metrics import register_stats, temporal_metrics
 from app.temporal.activities import (
+    archive_operations_partition,
+    create_operations_partitions,
+    get_archivable_partitions,
     get_running_operations,
+    reconcile_closed_operations,
     reconcile_operation_status,
+    roll_up_operation_stats,
     simulate_work,
     update_operation_status,
 )
+from app.temporal.converter import data_converter
+from app.temporal.progress_writer import get_progress_writer
+from app.temporal.status_writer import get_status_writer
+from app.temporal.workflows.archival import ArchivalWorkflow
 from app.temporal.workflows.long_running_operation import LongRunningOperationWorkflow
-from app.temporal.workflows.reconciliation import ReconciliationWorkflow
+from app.temporal.workflows.reconciliation import (
+    ReconciliationShardWorkflow,
+    ReconciliationWorkflow,
+)
+from app.temporal.workflows.stats_rollup import StatsRollupWorkflow
 
 logging.basicConfig(
     level=logging.INFO,
@@ -24,40 +53,83 @@ logging.basicConfig(
 
 logging.getLogger("temporalio").setLevel(logging.INFO)
 
+WORKFLOWS = [
+    LongRunningOperationWorkflow,
+    ReconciliationWorkflow,
+    ReconciliationShardWorkflow,
+    ArchivalWorkflow,
+    StatsRollupWorkflow,
+]
+ACTIVITIES = [
+    update_operation_status,
+    simulate_work,
+    get_running_operations,
+    reconcile_operation_status,
+    reconcile_closed_operations,
+    create_operations_partitions,
+    get_archivable_partitions,
+    archive_operations_partition,
+    roll_up_operation_stats,
+]
+
+
+def create_worker(client: Client) -> Worker:
+    return Worker(
+        client,
+        task_queue=TEMPORAL_TASK_QUEUE,
+        workflows=WORKFLOWS,
+        activities=ACTIVITIES,
+        max_concurrent_activities=WORKER_MAX_CONCURRENT_ACTIVITIES,
+        max_concurrent_local_activities=WORKER_MAX_CONCURRENT_LOCAL_ACTIVITIES,
+        max_concurrent_workflow_tasks=WORKER_MAX_CONCURRENT_WORKFLOW_TASKS,
+        max_cached_workflows=WORKER_MAX_CACHED_WORKFLOWS,
+        max_concurrent_workflow_task_polls=WORKER_WORKFLOW_TASK_POLLERS,
+        max_concurrent_activity_task_polls=WORKER_ACTIVITY_TASK_POLLERS,
+        graceful_shutdown_timeout=timedelta(seconds=WORKER_GRACEFUL_SHUTDOWN_SECONDS),
+    )
+
+
+async def run_worker(index: int = 0) -> None:
+    """
+    Run a worker until SIGINT or SIGTERM, then shut it down gracefully: it stops
+    polling and waits for its running activities.
 
-async def main():
+    `index` tells apart the worker processes started by app/temporal/launcher.py,
+    each one serving its metrics on `WORKER_METRICS_PORT + index`.
+    """
     print(f"Connecting to Temporal at {TEMPORAL_HOST}")
     print(f"Namespace: {TEMPORAL_NAMESPACE}")
     print(f"Task Queue: {TEMPORAL_TASK_QUEUE}")
 
-    client = await Client.connect(TEMPORAL_HOST, namespace=TEMPORAL_NAMESPACE)
-
-    print("Connected to Temporal server")
-
-    worker = Worker(
-        client,
-        task_queue=TEMPORAL_TASK_QUEUE,
-        workflows=[LongRunningOperationWorkflow, ReconciliationWorkflow],
-        activities=[
-            update_operation_status,
-            simulate_work,
-            get_running_operations,
-            reconcile_operation_status,
-        ],
+    # Before connecting, for the client to use the instrumented runtime
+    temporal_metrics.install()
+    temporal_metrics.start()
+    register_stats("status_writer", lambda: get_status_writer().stats)
+    register_stats("progress_writer", lambda: get_progress_writer().stats)
+    start_http_server(WORKER_METRICS_PORT + index)
+    print(f"Metrics served on port {WORKER_METRICS_PORT + index}")
+
+    # Workers use the data converter of their client
+    client = await Client.connect(
+        TEMPORAL_HOST, namespace=TEMPORAL_NAMESPACE, data_converter=data_converter
     )
 
-    print(f"Worker RUNNING on task queue: {TEMPORAL_TASK_QUEUE}")
+    print("Connected to Temporal server")
 
-    await worker.run()
+    shutdown = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, shutdown.set)
 
+    async with create_worker(client):
+        print(f"Worker {index} RUNNING on task queue: {TEMPORAL_TASK_QUEUE}")
+        await shutdown.wait()
+        print(f"Shutdown signal received, stopping worker {index}...")
 
-def handle_shutdown(signum, frame):
-    print("\nShutdown signal received, stopping worker...")
-    sys.exit(0)
+    await temporal_metrics.stop()
+    await dispose_engines()
+    print(f"Worker {index} stopped")
 
 
 if __name__ == "__main__":
-    signal.signal(signal.SIGINT, handle_shutdown)
-    signal.signal(signal.SIGTERM, handle_shutdown)
-
-    asyncio.run(main())
+    asyncio.run(run_worker())
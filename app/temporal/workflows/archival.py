@@ -0,0 +1,69 @@
+"""Archival workflow managing the monthly partitions of the operations."""
+
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import List
+
+from temporalio import workflow
+
+with workflow.unsafe.imports_passed_through():
+    from app.temporal.activities import (
+        ArchivePartitionInput,
+        archive_operations_partition,
+        create_operations_partitions,
+        get_archivable_partitions,
+    )
+
+
+@dataclass
+class ArchivalWorkflowOutput:
+    created_partitions: List[str] = field(default_factory=list)
+    archived_partitions: List[str] = field(default_factory=list)
+    archived_operations: int = 0
+    # Not archived yet because some of their operations aren't finished
+    skipped_partitions: List[str] = field(default_factory=list)
+
+
+@workflow.defn(name="ArchivalWorkflow")
+class ArchivalWorkflow:
+    """
+    Workflow maintaining the monthly partitions of the operations (see
+    app/archive.py). This workflow:
+    1. Creates the partitions of the next months
+    2. Moves the partitions of the old months to the archive, one at a time,
+       skipping the ones with operations that aren't finished
+    """
+
+    @workflow.run
+    async def run(self) -> ArchivalWorkflowOutput:
+        output = ArchivalWorkflowOutput()
+
+        output.created_partitions = await workflow.execute_activity(
+            create_operations_partitions,
+            start_to_close_timeout=timedelta(minutes=1),
+        )
+
+        months = await workflow.execute_activity(
+            get_archivable_partitions,
+            start_to_close_timeout=timedelta(minutes=1),
+        )
+        for month in months:
+            result = await workflow.execute_activity(
+                archive_operations_partition,
+                ArchivePartitionInput(month=month),
+                start_to_close_timeout=timedelta(hours=1),
+                heartbeat_timeout=timedelta(minutes=1),
+            )
+            if result.skipped:
+                output.skipped_partitions.append(month)
+            else:
+                output.archived_partitions.append(month)
+                output.archived_operations += result.archived
+
+        workflow.logger.info(
+            f"Archival complete: {len(output.created_partitions)} partitions"
+            f" created, {output.archived_operations} operations of"
+            f" {len(output.archived_partitions)} partitions archived,"
+            f" {len(output.skipped_partitions)} partitions skipped"
+        )
+        return output
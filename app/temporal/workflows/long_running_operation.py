@@ -5,7 +5,8 @@ from datetime import timedelta
 
 from temporalio import workflow
 
-from app.temporal.utils import track_operation_status
+from app.constants import WORK_HEARTBEAT_TIMEOUT_SECONDS
+from app.temporal.utils import get_operation_uuid, track_operation_status
 
 with workflow.unsafe.imports_passed_through():
     from app.temporal.activities import (
@@ -28,6 +29,13 @@ class LongRunningOperationWorkflow:
 
         await workflow.execute_activity(
             simulate_work,
-            SimulateWorkInput(duration=duration, task_name="task1"),
+            SimulateWorkInput(
+                duration=duration,
+                task_name="task1",
+                operation_uuid=get_operation_uuid(),
+            ),
             start_to_close_timeout=timedelta(seconds=duration + 10),
+            # A crashed worker is detected within seconds instead of after the
+            # whole duration, and the retry resumes from the last checkpoint
+            heartbeat_timeout=timedelta(seconds=WORK_HEARTBEAT_TIMEOUT_SECONDS),
         )
@@ -1,22 +1,42 @@
 """Reconciliation workflow for syncing operation status with Temporal."""
 
-from dataclasses import dataclass
+import asyncio
+import uuid
+from dataclasses import dataclass, field
 from datetime import timedelta
+from typing import Optional
 
 from temporalio import workflow
 
+from app.constants import (
+    RECONCILIATION_PAGE_SIZE,
+    RECONCILIATION_PAGES_PER_RUN,
+    RECONCILIATION_SHARDS,
+)
+
 with workflow.unsafe.imports_passed_through():
     from app.temporal.activities import (
+        GetRunningOperationsInput,
         get_running_operations,
+        reconcile_closed_operations,
         reconcile_operation_status,
         ReconcileOperationInput,
     )
 
 
+@dataclass
+class ReconciliationWorkflowInput:
+    # Check every RUNNING operation instead of the workflows closed since the
+    # last run
+    full_scan: bool = False
+
+
 @dataclass
 class ReconciliationWorkflowOutput:
     total_checked: int
     reconciled: int
+    visibility_rpcs: int = 0
+    duration_seconds: float = 0.0
 
 
 @workflow.defn(name="ReconciliationWorkflow")
@@ -24,41 +44,148 @@ class ReconciliationWorkflow:
     """
     Workflow for reconciling operation status between database and Temporal.
 
-    This workflow:
-    1. Fetches all operations with status "RUNNING" from the database
+    By default (incremental mode) this workflow:
+    1. Queries Temporal for the tracked workflows closed since the last run
+    2. Updates the database for the operations still marked as not finished
+
+    With `full_scan` this workflow splits the UUIDs space in key ranges and starts a
+    `ReconciliationShardWorkflow` per range, each one:
+    1. Fetches a page of operations with status "RUNNING" from the database
     2. Queries Temporal for the actual status of each workflow
     3. Updates the database if there's a mismatch
+    4. Moves on to the next page
     """
 
     @workflow.run
-    async def run(self) -> ReconciliationWorkflowOutput:
-        workflow.logger.info("Starting reconciliation workflow")
+    async def run(
+        self, input: Optional[ReconciliationWorkflowInput] = None
+    ) -> ReconciliationWorkflowOutput:
+        if input is None or not input.full_scan:
+            return await self._reconcile_closed()
+
+        return await self._reconcile_running()
+
+    async def _reconcile_closed(self) -> ReconciliationWorkflowOutput:
+        workflow.logger.info("Starting incremental reconciliation workflow")
+
+        result = await workflow.execute_activity(
+            reconcile_closed_operations,
+            start_to_close_timeout=timedelta(minutes=10),
+            heartbeat_timeout=timedelta(minutes=1),
+        )
 
-        # Step 1: Get all operations with RUNNING status
-        running_ops = await workflow.execute_activity(
-            get_running_operations,
-            start_to_close_timeout=timedelta(seconds=30),
+        workflow.logger.info(
+            f"Reconciliation complete: {result.reconciled} updated,"
+            f" {result.visibility_rpcs} visibility RPCs in"
+            f" {result.duration_seconds:.2f}s"
+        )
+        return ReconciliationWorkflowOutput(
+            total_checked=result.checked,
+            reconciled=result.reconciled,
+            visibility_rpcs=result.visibility_rpcs,
+            duration_seconds=result.duration_seconds,
         )
 
+    async def _reconcile_running(self) -> ReconciliationWorkflowOutput:
         workflow.logger.info(
-            f"Found {len(running_ops.operations_uuids)} operations in RUNNING state"
+            f"Starting full reconciliation workflow with {RECONCILIATION_SHARDS} shards"
         )
 
-        if not running_ops.operations_uuids:
-            return ReconciliationWorkflowOutput(
-                total_checked=0,
-                reconciled=0,
+        # UUIDs are random, so equal key ranges give balanced shards
+        bounds = [
+            str(uuid.UUID(int=(2**128 * i) // RECONCILIATION_SHARDS))
+            for i in range(1, RECONCILIATION_SHARDS)
+        ]
+        lower_bounds = [None, *bounds]
+        upper_bounds = [*bounds, None]
+
+        # The shards run in parallel: the scan lasts as long as the slowest one,
+        # not the sum of their durations
+        started_at = workflow.now()
+        results = await asyncio.gather(
+            *(
+                workflow.execute_child_workflow(
+                    ReconciliationShardWorkflow.run,
+                    ReconciliationShardInput(after=after, until=until),
+                    id=f"{workflow.info().workflow_id}-shard-{i}",
+                )
+                for i, (after, until) in enumerate(zip(lower_bounds, upper_bounds))
             )
+        )
 
-        # Step 2: Reconcile all operations in a single activity call
-        result = await workflow.execute_activity(
-            reconcile_operation_status,
-            ReconcileOperationInput(operations_uuids=running_ops.operations_uuids),
-            start_to_close_timeout=timedelta(seconds=60),
+        output = ReconciliationWorkflowOutput(
+            total_checked=sum(r.total_checked for r in results),
+            reconciled=sum(r.reconciled for r in results),
+            visibility_rpcs=sum(r.visibility_rpcs for r in results),
+            duration_seconds=(workflow.now() - started_at).total_seconds(),
         )
+        workflow.logger.info(
+            f"Reconciliation complete: {output.total_checked} checked,"
+            f" {output.reconciled} updated, {output.visibility_rpcs} visibility RPCs"
+            f" in {output.duration_seconds:.2f}s"
+        )
+        return output
 
-        workflow.logger.info(f"Reconciliation complete: {result.reconciled} updated")
-        return ReconciliationWorkflowOutput(
-            total_checked=len(running_ops.operations_uuids),
-            reconciled=result.reconciled,
+
+@dataclass
+class ReconciliationShardInput:
+    # Key range (after, until] of the operations UUIDs, unbounded if None. `after`
+    # is moved forward page after page
+    after: Optional[str]
+    until: Optional[str]
+    page_size: int = RECONCILIATION_PAGE_SIZE
+    pages_per_run: int = RECONCILIATION_PAGES_PER_RUN
+    # Totals of the previous runs, carried over by continue-as-new
+    totals: ReconciliationWorkflowOutput = field(
+        default_factory=lambda: ReconciliationWorkflowOutput(
+            total_checked=0, reconciled=0
+        )
+    )
+
+
+@workflow.defn(name="ReconciliationShardWorkflow")
+class ReconciliationShardWorkflow:
+    """
+    Workflow reconciling the RUNNING operations of a key range of UUIDs.
+
+    This workflow pages through the RUNNING operations of its key range and
+    reconciles them page by page. It continues as new every `pages_per_run` pages
+    so that its history stays bounded whatever the number of operations.
+    """
+
+    @workflow.run
+    async def run(self, input: ReconciliationShardInput) -> ReconciliationWorkflowOutput:
+        totals = input.totals
+
+        for _ in range(input.pages_per_run):
+            page = await workflow.execute_activity(
+                get_running_operations,
+                GetRunningOperationsInput(
+                    after=input.after, until=input.until, limit=input.page_size
+                ),
+                start_to_close_timeout=timedelta(seconds=30),
+            )
+
+            if page.operations_uuids:
+                result = await workflow.execute_activity(
+                    reconcile_operation_status,
+                    ReconcileOperationInput(operations_uuids=page.operations_uuids),
+                    start_to_close_timeout=timedelta(seconds=60),
+                    heartbeat_timeout=timedelta(seconds=20),
+                )
+
+                totals.total_checked += len(page.operations_uuids)
+                totals.reconciled += result.reconciled
+                totals.visibility_rpcs += result.visibility_rpcs
+                totals.duration_seconds += result.duration_seconds
+
+            if page.next_after is None:
+                return totals
+
+            input.after = page.next_after
+
+        workflow.logger.info(
+            f"Continuing as new after {totals.total_checked} operations"
+            f" (cursor {input.after})"
         )
+        workflow.continue_as_new(input)
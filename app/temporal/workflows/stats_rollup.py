@@ -0,0 +1,24 @@
+"""Stats rollup workflow recomputing the hour and day buckets of the stats."""
+
+from datetime import timedelta
+
+from temporalio import workflow
+
+with workflow.unsafe.imports_passed_through():
+    from app.temporal.activities import roll_up_operation_stats
+
+
+@workflow.defn(name="StatsRollupWorkflow")
+class StatsRollupWorkflow:
+    """
+    Workflow rolling the minute buckets of the operation stats up into the hour
+    and day ones (see app/stats.py). Transitions only count in the minute
+    buckets, so a window is answered from the minute buckets after the last run.
+    """
+
+    @workflow.run
+    async def run(self) -> None:
+        await workflow.execute_activity(
+            roll_up_operation_stats,
+            start_to_close_timeout=timedelta(minutes=5),
+        )
@@ -0,0 +1,304 @@
+"""
+Status transitions of operations.
+
+Transitions are applied with a single conditional UPDATE guarded by
+`ALLOWED_TRANSITIONS`: operations only move forward, so stale or duplicated
+transitions (e.g. local activity retries, or reconciliation racing with the
+workflow itself) are no-ops instead of overwriting a newer status.
+"""
+
+import json
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Final, Optional, Sequence
+
+from sqlalchemy import (
+    UUID,
+    DateTime,
+    Row,
+    String,
+    Text,
+    Update,
+    and_,
+    bindparam,
+    cast,
+    column,
+    func,
+    or_,
+    select,
+    text,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.constants import OPERATION_STATUS_CHANNEL
+from app.enums import OperationStatus
+from app.models import Operation
+from app.stats import QUEUE_WAIT, RUN_TIME, StatsDelta, record_stats
+
+operations = Operation.__table__
+
+
+TERMINAL_STATUSES: Final[frozenset[OperationStatus]] = frozenset(
+    {OperationStatus.COMPLETED, OperationStatus.FAILED, OperationStatus.CANCELLED}
+)
+ACTIVE_STATUSES: Final[frozenset[OperationStatus]] = (
+    frozenset(OperationStatus) - TERMINAL_STATUSES
+)
+
+# For each status, the statuses an operation can move to it from
+ALLOWED_TRANSITIONS: Final[dict[OperationStatus, frozenset[OperationStatus]]] = {
+    OperationStatus.ACCEPTED: frozenset(),
+    OperationStatus.RUNNING: frozenset({OperationStatus.ACCEPTED}),
+    OperationStatus.COMPLETED: frozenset(
+        {OperationStatus.ACCEPTED, OperationStatus.RUNNING}
+    ),
+    OperationStatus.FAILED: frozenset(
+        {OperationStatus.ACCEPTED, OperationStatus.RUNNING}
+    ),
+    OperationStatus.CANCELLED: frozenset(
+        {OperationStatus.ACCEPTED, OperationStatus.RUNNING}
+    ),
+}
+
+
+def can_transition(old: OperationStatus, new: OperationStatus) -> bool:
+    return old in ALLOWED_TRANSITIONS[new]
+
+
+@dataclass
+class StatusTransition:
+    operation_uuid: uuid.UUID
+    status: OperationStatus
+    result: Optional[dict] = None
+    at: datetime = field(default_factory=datetime.utcnow)
+
+    @property
+    def started_at(self) -> Optional[datetime]:
+        return self.at if self.status == OperationStatus.RUNNING else None
+
+    @property
+    def finished_at(self) -> Optional[datetime]:
+        return self.at if self.status in TERMINAL_STATUSES else None
+
+    @property
+    def progress(self) -> Optional[dict]:
+        # Progress reports still pending when an operation completes are dropped,
+        # as they are only written to RUNNING operations. Failed and cancelled
+        # operations keep the last progress written
+        if self.status != OperationStatus.COMPLETED:
+            return None
+        return {"percent": 100.0, "phase": None, "updated_at": self.at.isoformat()}
+
+
+@dataclass
+class TransitionsOutcome:
+    # Transitions written to the database
+    applied: set[uuid.UUID] = field(default_factory=set)
+    # Transitions not allowed from the current status, i.e. no-ops
+    rejected: set[uuid.UUID] = field(default_factory=set)
+    # Transitions of operations not in the database
+    missing: set[uuid.UUID] = field(default_factory=set)
+
+
+def _single_transition_statement(transition: StatusTransition) -> Update:
+    values_to_set: dict = {"status": transition.status}
+    if transition.started_at:
+        values_to_set["started_at"] = transition.started_at
+    if transition.finished_at:
+        values_to_set["finished_at"] = transition.finished_at
+    if transition.result is not None:
+        values_to_set["result"] = transition.result
+    if transition.progress is not None:
+        values_to_set["progress"] = transition.progress
+
+    return (
+        update(operations)
+        .where(
+            operations.c.uuid == transition.operation_uuid,
+            operations.c.status.in_(sorted(ALLOWED_TRANSITIONS[transition.status])),
+        )
+        .values(**values_to_set)
+    )
+
+
+def _bulk_transitions_statement(transitions: Sequence[StatusTransition]) -> Update:
+    # `None` values are rendered as untyped NULL literals, hence the casts: a
+    # column that is NULL in every row would otherwise be resolved as text
+    rows = values(
+        column("uuid", UUID(as_uuid=True)),
+        column("status", String(20)),
+        column("started_at", DateTime),
+        column("finished_at", DateTime),
+        column("result", JSONB(none_as_null=True)),
+        column("progress", JSONB(none_as_null=True)),
+        name="transitions",
+    ).data(
+        [
+            (
+                t.operation_uuid,
+                t.status,
+                t.started_at,
+                t.finished_at,
+                t.result,
+                t.progress,
+            )
+            for t in transitions
+        ]
+    )
+
+    allowed = or_(
+        *(
+            and_(rows.c.status == new, operations.c.status.in_(sorted(old)))
+            for new, old in ALLOWED_TRANSITIONS.items()
+            if old
+        )
+    )
+
+    return (
+        update(operations)
+        .where(operations.c.uuid == rows.c.uuid, allowed)
+        .values(
+            status=rows.c.status,
+            started_at=func.coalesce(
+                cast(rows.c.started_at, DateTime), operations.c.started_at
+            ),
+            finished_at=func.coalesce(
+                cast(rows.c.finished_at, DateTime), operations.c.finished_at
+            ),
+            result=func.coalesce(cast(rows.c.result, JSONB), operations.c.result),
+            progress=func.coalesce(
+                cast(rows.c.progress, JSONB), operations.c.progress
+            ),
+        )
+    )
+
+
+def transitions_statement(transitions: Sequence[StatusTransition]) -> Update:
+    """
+    Build a single statement applying all the given transitions, returning the
+    UUID, op type, acceptance and start times of the updated operations.
+
+    A single transition is written with `UPDATE ... WHERE uuid = :u AND status IN
+    (:allowed_from)`, several ones with `UPDATE ... FROM (VALUES ...)`. Each
+    operation must appear at most once in `transitions`, as Postgres doesn't
+    define which row of the VALUES list wins when several of them match the same
+    operation.
+    """
+    if len(transitions) == 1:
+        statement = _single_transition_statement(transitions[0])
+    else:
+        statement = _bulk_transitions_statement(transitions)
+
+    return statement.returning(
+        operations.c.uuid,
+        operations.c.op_type,
+        operations.c.accepted_at,
+        operations.c.started_at,
+    )
+
+
+def transitions_stats(
+    transitions: Sequence[StatusTransition], applied_rows: Sequence[Row]
+) -> StatsDelta:
+    """Stats of the applied transitions, from the rows of `transitions_statement`."""
+    by_uuid = {t.operation_uuid: t for t in transitions}
+    delta = StatsDelta()
+    for row in applied_rows:
+        transition = by_uuid[row.uuid]
+        delta.count(transition.at, row.op_type, transition.status)
+        if transition.status == OperationStatus.RUNNING:
+            delta.observe(
+                transition.at,
+                row.op_type,
+                QUEUE_WAIT,
+                (transition.at - row.accepted_at).total_seconds(),
+            )
+        elif transition.status in TERMINAL_STATUSES and row.started_at:
+            delta.observe(
+                transition.at,
+                row.op_type,
+                RUN_TIME,
+                (transition.at - row.started_at).total_seconds(),
+            )
+    return delta
+
+
+_notify_statement = text(
+    "SELECT pg_notify(:channel, payload) FROM unnest(:payloads) AS payload"
+).bindparams(bindparam("payloads", type_=ARRAY(Text)))
+
+
+async def notify_transitions(
+    db: AsyncSession, transitions: Sequence[StatusTransition]
+) -> None:
+    """
+    Notify the transitions on `OPERATION_STATUS_CHANNEL` with a single statement.
+
+    Postgres delivers the notifications only when (and if) the transaction
+    commits, so listeners never see a transition that is rolled back.
+    """
+    payloads = [
+        json.dumps({"uuid": str(t.operation_uuid), "status": t.status})
+        for t in transitions
+    ]
+    await db.execute(
+        _notify_statement, {"channel": OPERATION_STATUS_CHANNEL, "payloads": payloads}
+    )
+
+
+# Keeps the statements well below the 32767 bind parameters limit of Postgres
+MAX_TRANSITIONS_PER_STATEMENT: Final = 1000
+
+
+async def apply_transitions(
+    db: AsyncSession,
+    transitions: Sequence[StatusTransition],
+    check_not_applied: bool = True,
+) -> TransitionsOutcome:
+    """
+    Apply the transitions with a single statement per
+    `MAX_TRANSITIONS_PER_STATEMENT` transitions.
+
+    Only if some transitions are not applied, a second query tells apart the
+    operations that don't exist from the ones whose transition is not allowed.
+    Callers expecting most transitions to be no-ops can skip it with
+    `check_not_applied=False`, leaving `rejected` and `missing` empty.
+
+    Applied transitions are notified on `OPERATION_STATUS_CHANNEL` when the
+    transaction commits, and counted in the stats rollups (see app/stats.py).
+    """
+    outcome = TransitionsOutcome()
+    delta = StatsDelta()
+
+    for i in range(0, len(transitions), MAX_TRANSITIONS_PER_STATEMENT):
+        chunk = transitions[i : i + MAX_TRANSITIONS_PER_STATEMENT]
+        applied_rows = (await db.execute(transitions_statement(chunk))).all()
+        applied = {row.uuid for row in applied_rows}
+        outcome.applied |= applied
+
+        if applied:
+            await notify_transitions(
+                db, [t for t in chunk if t.operation_uuid in applied]
+            )
+            stats = transitions_stats(chunk, applied_rows)
+            delta.counts += stats.counts
+            delta.durations += stats.durations
+
+        not_applied = {t.operation_uuid for t in chunk} - applied
+        if check_not_applied and not_applied:
+            existing = set(
+                await db.scalars(
+                    select(operations.c.uuid).where(operations.c.uuid.in_(not_applied))
+                )
+            )
+            outcome.rejected |= existing
+            outcome.missing |= not_applied - existing
+
+    if delta:
+        await record_stats(db, delta)
+
+    return outcome
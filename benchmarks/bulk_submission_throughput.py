@@ -0,0 +1,57 @@
+"""Throughput of `POST /operations/batch` for batches of various sizes.
+
+Run it against a running API (e.g. the docker-compose stack). Every submitted
+operation starts a real workflow, so use a short `--timeout`. Workflows are
+started asynchronously by the outbox dispatcher: the time to drain the outbox is
+reported separately.
+
+    python -m benchmarks.bulk_submission_throughput --sizes 1000 10000
+"""
+
+import argparse
+import asyncio
+import time
+from typing import List
+
+import httpx
+
+
+async def run(base_url: str, sizes: List[int], timeout: int) -> None:
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        print(f"{'items':>7} {'seconds':>8} {'items/s':>9} {'drained in':>11}")
+        for size in sizes:
+            items = [
+                {
+                    "machine_id": f"B{i % 100000:05d}",
+                    "op": "DEPLOY",
+                    "parameters": {"timeout": timeout},
+                }
+                for i in range(size)
+            ]
+
+            start = time.perf_counter()
+            response = await client.post("/operations/batch", json={"items": items})
+            elapsed = time.perf_counter() - start
+            response.raise_for_status()
+
+            while (await client.get("/outbox")).json()["depth"] > 0:
+                await asyncio.sleep(0.1)
+            drained = time.perf_counter() - start
+
+            print(
+                f"{size:>7} {elapsed:>8.2f} {size / elapsed:>9.1f} {drained:>10.2f}s"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--timeout", type=int, default=1)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.base_url, args.sizes, args.timeout))
+
+
+if __name__ == "__main__":
+    main()
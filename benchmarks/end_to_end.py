@@ -0,0 +1,398 @@
+"""End-to-end benchmark of the API, the worker and the reconciliation.
+
+Runs everything in-process against the Postgres database pointed to by
+ASYNC_DATABASE_URL (a dedicated one, with the migrations applied) and a local
+Temporal dev server started by the Temporal test framework, so that no other
+service is needed:
+
+1. `submit`: creates N operations with `POST /machines/{id}`
+2. `workflows`: runs their `LongRunningOperationWorkflow` through a real worker,
+   measured from the first submission until all of them are COMPLETED
+3. `get`: queries them with `GET /operations/{uuid}`
+4. `reconciliation`: marks some of them as RUNNING again, as if their workflow
+   had been terminated, and runs a full `ReconciliationWorkflow` to fix them
+
+Each phase reports its throughput, its latency percentiles and the number of DB
+statements per operation. The report is written as JSON, and two reports can be
+compared with `--compare`. Seeded operations, their outbox entries and the stats
+buckets of the run's time span are deleted at the end.
+
+SQLite can't stand in for Postgres here: status transitions and rollups rely on
+Postgres statements (`UPDATE ... FROM (VALUES ...)`, `ON CONFLICT`, `NOTIFY`).
+The dev server is used instead of the time-skipping test server, which doesn't
+support the visibility queries done by the reconciliation.
+
+    python -m benchmarks.end_to_end --operations 500 --output report.json
+    python -m benchmarks.end_to_end --compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import uuid
+from contextlib import AsyncExitStack, asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+from prometheus_client import REGISTRY
+from sqlalchemy import delete, func, select, update
+from temporalio.testing import WorkflowEnvironment
+
+from app import api
+from app.constants import (
+    OPERATION_UUID_ATTR_NAME,
+    TEMPORAL_NAMESPACE,
+    TEMPORAL_TASK_QUEUE,
+)
+from app.database import get_db
+from app.enums import OperationStatus
+from app.models import (
+    Operation,
+    OperationDurationHistogram,
+    OperationStatusCount,
+    StatsRollupWatermark,
+    WorkflowOutbox,
+)
+from app.notifications import status_listener
+from app.outbox import outbox_dispatcher
+from app.stats import ROLLUP_SPANS, bucket_start
+from app.temporal import client as temporal_client
+from app.temporal.converter import data_converter
+from app.temporal.worker import create_worker
+from app.temporal.workflows.reconciliation import (
+    ReconciliationWorkflow,
+    ReconciliationWorkflowInput,
+)
+
+# Machine IDs of the seeded operations are BE0000, BE0001...
+BENCH_SYSTEM_ID_PREFIX = "BE"
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def db_statements() -> int:
+    """Statements executed so far by this process, from `db_query_duration_seconds`."""
+    return int(
+        sum(
+            sample.value
+            for metric in REGISTRY.collect()
+            if metric.name == "db_query_duration_seconds"
+            for sample in metric.samples
+            if sample.name == "db_query_duration_seconds_count"
+        )
+    )
+
+
+class Phase:
+    """Measures the throughput, latencies and DB statements of a phase."""
+
+    def __init__(self) -> None:
+        self.latencies: List[float] = []
+        self._start = 0.0
+        self._statements = 0
+        # Statements of the benchmark itself, e.g. polling
+        self.excluded = 0
+
+    def __enter__(self) -> "Phase":
+        self._start = time.perf_counter()
+        self._statements = db_statements()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.elapsed = time.perf_counter() - self._start
+        self.statements = db_statements() - self._statements - self.excluded
+
+    def report(self, operations: int) -> Dict:
+        report = {
+            "operations": operations,
+            "seconds": round(self.elapsed, 3),
+            "ops_per_second": round(operations / self.elapsed, 1),
+            "db_statements_per_operation": round(self.statements / operations, 2),
+        }
+        if self.latencies:
+            report["p50_ms"] = round(percentile(self.latencies, 50) * 1000, 2)
+            report["p99_ms"] = round(percentile(self.latencies, 99) * 1000, 2)
+        return report
+
+
+async def concurrently(phase: Phase, requests: List, concurrency: int) -> List:
+    """Send the requests (coroutine functions) with `concurrency` clients."""
+    results: List = []
+    pending = list(reversed(requests))
+
+    async def worker() -> None:
+        while pending:
+            request = pending.pop()
+            start = time.perf_counter()
+            results.append(await request())
+            phase.latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+async def count_operations(op_uuids: List[str], status: OperationStatus) -> int:
+    async with get_db() as db:
+        return await db.scalar(
+            select(func.count()).where(
+                Operation.uuid.in_([uuid.UUID(op_uuid) for op_uuid in op_uuids]),
+                Operation.status == status,
+            )
+        )
+
+
+async def wait_for_status(
+    phase: Phase, op_uuids: List[str], status: OperationStatus, timeout: float
+) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        phase.excluded += 1
+        if await count_operations(op_uuids, status) == len(op_uuids):
+            return
+        if time.monotonic() > deadline:
+            raise SystemExit(f"Operations not {status} after {timeout}s")
+        await asyncio.sleep(0.1)
+
+
+async def cleanup(started_at: datetime) -> None:
+    """
+    Delete the seeded operations, their outbox entries and the stats buckets
+    covering the run, i.e. all the buckets of its time span in the database.
+    """
+    seeded = select(Operation.uuid).where(
+        Operation.system_id.startswith(BENCH_SYSTEM_ID_PREFIX)
+    )
+    async with get_db() as db:
+        await db.execute(
+            delete(WorkflowOutbox).where(WorkflowOutbox.operation_uuid.in_(seeded))
+        )
+        await db.execute(
+            delete(Operation).where(
+                Operation.system_id.startswith(BENCH_SYSTEM_ID_PREFIX)
+            )
+        )
+
+        for span in ROLLUP_SPANS:
+            first_bucket = bucket_start(started_at, span)
+            for table in (OperationStatusCount, OperationDurationHistogram):
+                await db.execute(
+                    delete(table).where(
+                        table.span_seconds == span, table.bucket >= first_bucket
+                    )
+                )
+            # The minutes of these buckets before the run get rolled up again
+            await db.execute(
+                update(StatsRollupWatermark)
+                .where(
+                    StatsRollupWatermark.span_seconds == span,
+                    StatsRollupWatermark.rolled_up_until > first_bucket,
+                )
+                .values(rolled_up_until=first_bucket)
+            )
+
+
+@asynccontextmanager
+async def worker_processes(env: WorkflowEnvironment, processes: int) -> AsyncIterator:
+    """Run the workers with app/temporal/launcher.py instead of in-process."""
+    launcher = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-m",
+        "app.temporal.launcher",
+        "--processes",
+        str(processes),
+        env={
+            **os.environ,
+            "TEMPORAL_HOST": env.client.service_client.config.target_host,
+            "TEMPORAL_NAMESPACE": env.client.namespace,
+            "WORKER_METRICS_PORT": "9200",
+        },
+    )
+    try:
+        yield
+    finally:
+        launcher.terminate()
+        await launcher.wait()
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    env = await WorkflowEnvironment.start_local(
+        namespace=TEMPORAL_NAMESPACE,
+        data_converter=data_converter,
+        dev_server_existing_path=args.dev_server_path,
+        dev_server_extra_args=[
+            "--search-attribute",
+            f"{OPERATION_UUID_ATTR_NAME}=Keyword",
+        ],
+    )
+    # Used by the outbox dispatcher and the activities
+    temporal_client._temporal_client = env.client
+
+    phases = {}
+    started_at = datetime.utcnow()
+    transport = httpx.ASGITransport(app=api.app)
+    try:
+        async with AsyncExitStack() as stack:
+            if args.worker_processes:
+                await stack.enter_async_context(
+                    worker_processes(env, args.worker_processes)
+                )
+            else:
+                await stack.enter_async_context(create_worker(env.client))
+            client = await stack.enter_async_context(
+                httpx.AsyncClient(transport=transport, base_url="http://api")
+            )
+            status_listener.start()
+            outbox_dispatcher.start()
+
+            def submit(i: int):
+                async def request() -> str:
+                    response = await client.post(
+                        f"/machines/{BENCH_SYSTEM_ID_PREFIX}{i % 10000:04d}",
+                        params={"op": "DEPLOY"},
+                        json={"timeout": args.workflow_seconds},
+                    )
+                    response.raise_for_status()
+                    return response.json()["uuid"]
+
+                return request
+
+            # Workflows run during the submission, so their phase starts with it
+            with Phase() as workflows_phase:
+                with Phase() as phase:
+                    op_uuids = await concurrently(
+                        phase,
+                        [submit(i) for i in range(args.operations)],
+                        args.concurrency,
+                    )
+                phases["submit"] = phase.report(args.operations)
+
+                await wait_for_status(
+                    workflows_phase, op_uuids, OperationStatus.COMPLETED, args.timeout
+                )
+            phases["workflows"] = workflows_phase.report(args.operations)
+
+            def get(op_uuid: str):
+                async def request() -> None:
+                    response = await client.get(f"/operations/{op_uuid}")
+                    response.raise_for_status()
+
+                return request
+
+            with Phase() as phase:
+                await concurrently(
+                    phase,
+                    [get(op_uuids[i % len(op_uuids)]) for i in range(args.requests)],
+                    args.concurrency,
+                )
+            phases["get"] = phase.report(args.requests)
+
+            stale = [uuid.UUID(op_uuid) for op_uuid in op_uuids[: args.stale]]
+            async with get_db() as db:
+                await db.execute(
+                    update(Operation)
+                    .where(Operation.uuid.in_(stale))
+                    .values(status=OperationStatus.RUNNING, finished_at=None)
+                )
+
+            with Phase() as phase:
+                output = await env.client.execute_workflow(
+                    ReconciliationWorkflow.run,
+                    ReconciliationWorkflowInput(full_scan=True),
+                    id=f"benchmark-reconciliation-{uuid.uuid4()}",
+                    task_queue=TEMPORAL_TASK_QUEUE,
+                )
+            phases["reconciliation"] = phase.report(len(stale))
+            phases["reconciliation"]["reconciled"] = output.reconciled
+            phases["reconciliation"]["visibility_rpcs"] = output.visibility_rpcs
+    finally:
+        await outbox_dispatcher.stop()
+        await status_listener.stop()
+        await cleanup(started_at)
+        await env.shutdown()
+
+    return {
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "parameters": {
+            "operations": args.operations,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "stale": args.stale,
+            "workflow_seconds": args.workflow_seconds,
+            "worker_processes": args.worker_processes,
+        },
+        "phases": phases,
+    }
+
+
+def compare(before: Dict, after: Dict) -> None:
+    for name, metrics in after["phases"].items():
+        for metric, value in metrics.items():
+            previous: Optional[float] = before["phases"].get(name, {}).get(metric)
+            change = f"{(value - previous) / previous:+.1%}" if previous else "n/a"
+            print(f"{name:>14} {metric:<28} {previous!s:>10} -> {value!s:>10} {change}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--operations", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--stale", type=int, default=100, help="Operations to reconcile"
+    )
+    parser.add_argument(
+        "--workflow-seconds",
+        type=int,
+        default=0,
+        help="Duration of the simulated work of each workflow",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=600, help="Maximum time to run workflows"
+    )
+    parser.add_argument(
+        "--worker-processes",
+        type=int,
+        default=0,
+        help="Run the workers with the multi-process launcher instead of in-process"
+        " (their DB statements are then not counted)",
+    )
+    parser.add_argument(
+        "--dev-server-path",
+        default=None,
+        help="Existing Temporal CLI binary, downloaded if not given",
+    )
+    parser.add_argument("--output", default=None, help="Where to write the report")
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Compare two reports"
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as before, open(args.compare[1]) as after:
+            compare(json.load(before), json.load(after))
+        return
+
+    args.stale = min(args.stale, args.operations)
+    # The worker module logs every activity at INFO
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Latency benchmark for `GET /operations/{uuid}` under concurrent load.
+
+Run it against a running API (e.g. the docker-compose stack) once per version
+to compare, for example before and after a change to the database layer:
+
+    python -m benchmarks.get_operation_latency --concurrency 50 --requests 5000
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List, Optional
+
+import httpx
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def create_operation(client: httpx.AsyncClient) -> str:
+    response = await client.post(
+        "/machines/BENCH1", params={"op": "DEPLOY"}, json={"timeout": 1}
+    )
+    response.raise_for_status()
+    return response.json()["uuid"]
+
+
+async def run(
+    base_url: str, concurrency: int, requests: int, operation_uuid: Optional[str]
+) -> None:
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+        if operation_uuid is None:
+            operation_uuid = await create_operation(client)
+
+        latencies: List[float] = []
+        remaining = requests
+
+        async def worker() -> None:
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                response = await client.get(f"/operations/{operation_uuid}")
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    print(f"requests:    {len(latencies)}")
+    print(f"concurrency: {concurrency}")
+    print(f"throughput:  {len(latencies) / elapsed:.1f} req/s")
+    print(f"mean:        {statistics.mean(latencies) * 1000:.2f} ms")
+    for pct in (50, 95, 99):
+        print(f"p{pct}:         {percentile(latencies, pct) * 1000:.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument(
+        "--operation-uuid",
+        default=None,
+        help="Existing operation to query, a new one is created if not given",
+    )
+    args = parser.parse_args()
+
+    asyncio.run(
+        run(args.base_url, args.concurrency, args.requests, args.operation_uuid)
+    )
+
+
+if __name__ == "__main__":
+    main()
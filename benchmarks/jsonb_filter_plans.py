@@ -0,0 +1,160 @@
+"""Query plans of the `filter` query parameters of the operations lists.
+
+Seeds N operations with varied JSONB `parameters` and `result` in the database
+pointed to by ASYNC_DATABASE_URL (migrations must have been applied), then
+checks with EXPLAIN that a page of `GET /operations` filtered on them is served
+by the index expected for each kind of filter, and prints the execution time.
+Exits with an error if a plan doesn't use its index. Seeded rows are deleted at
+the end.
+
+    python -m benchmarks.jsonb_filter_plans --operations 200000
+"""
+
+import argparse
+import asyncio
+import sys
+from typing import Dict, Iterator, Set
+
+import orjson
+from sqlalchemy import ClauseElement, Executable, delete, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+
+from app.database import get_db
+from app.json_filters import parse_json_filter
+from app.models import Operation
+from app.serialization import select_operation_rows
+
+BENCH_SYSTEM_ID = "BENCH1"
+PAGE_SIZE = 100
+
+# Filter -> index of the partitioned table that must serve it
+FILTERS = {
+    "parameters.timeout=600": "ix_operations_parameters",
+    "parameters.timeout>3590": "ix_operations_parameters_timeout",
+    "result.exit_code=137": "ix_operations_result",
+    "result.error~disk full": "ix_operations_result_error_trgm",
+}
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement: ClauseElement) -> None:
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element: Explain, compiler, **kw) -> str:
+    statement = compiler.process(element.statement, **kw)
+    return f"EXPLAIN (ANALYZE, FORMAT JSON) {statement}"
+
+
+async def seed(count: int) -> None:
+    # 1 operation in 3600 has a given timeout, 1 in 500 failed with exit code
+    # 137, 1 in 1000 failed with "disk full"
+    async with get_db() as db:
+        await db.execute(
+            text(
+                """
+                INSERT INTO operations
+                    (uuid, system_id, op_type, status, accepted_at, parameters,
+                     result)
+                SELECT gen_random_uuid(), :system_id, 'DEPLOY', 'FAILED', now(),
+                    jsonb_build_object(
+                        'timeout', 1 + (random() * 3599)::int,
+                        'notes', md5(i::text)
+                    ),
+                    jsonb_build_object(
+                        'exit_code', CASE WHEN i % 500 = 0 THEN 137 ELSE 1 END,
+                        'error', CASE
+                            WHEN i % 1000 = 0 THEN 'No space left: disk full'
+                            ELSE 'Step ' || md5(i::text) || ' failed'
+                        END
+                    )
+                FROM generate_series(1, :count) AS i
+                """
+            ),
+            {"system_id": BENCH_SYSTEM_ID, "count": count},
+        )
+        await db.execute(text("ANALYZE operations"))
+
+
+async def cleanup() -> None:
+    async with get_db() as db:
+        await db.execute(
+            delete(Operation).where(Operation.system_id == BENCH_SYSTEM_ID)
+        )
+
+
+async def partition_indexes(db: AsyncSession) -> Dict[str, str]:
+    """Indexes of the partitions -> index of `operations` they belong to."""
+    rows = await db.execute(
+        text(
+            "SELECT child.relname AS child, parent.relname AS parent"
+            " FROM pg_inherits"
+            " JOIN pg_class parent ON parent.oid = pg_inherits.inhparent"
+            " JOIN pg_class child ON child.oid = pg_inherits.inhrelid"
+            " WHERE parent.relkind = 'I'"
+        )
+    )
+    return {row.child: row.parent for row in rows}
+
+
+def index_names(plan: dict) -> Iterator[str]:
+    if "Index Name" in plan:
+        yield plan["Index Name"]
+    for child in plan.get("Plans", []):
+        yield from index_names(child)
+
+
+async def explain(expression: str) -> dict:
+    query = (
+        select_operation_rows()
+        .where(parse_json_filter(expression))
+        .order_by(Operation.accepted_at.desc(), Operation.uuid.desc())
+        .limit(PAGE_SIZE)
+    )
+    async with get_db() as db:
+        # The JSON of the plan is returned as text by asyncpg
+        return orjson.loads(await db.scalar(Explain(query)))[0]
+
+
+async def run(operations: int, verbose: bool) -> bool:
+    await seed(operations)
+    try:
+        async with get_db() as db:
+            parents = await partition_indexes(db)
+
+        print(f"{'filter':>26} {'expected index':>34} {'used':>5} {'ms':>8}")
+        ok = True
+        for expression, expected in FILTERS.items():
+            result = await explain(expression)
+            used: Set[str] = {
+                parents.get(name, name) for name in index_names(result["Plan"])
+            }
+            found = expected in used
+            ok = ok and found
+            print(
+                f"{expression:>26} {expected:>34} {'yes' if found else 'NO':>5}"
+                f" {result['Execution Time']:>8.2f}"
+            )
+            if verbose or not found:
+                print(f"    indexes used: {', '.join(sorted(used)) or 'none'}")
+        return ok
+    finally:
+        await cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--operations", type=int, default=200_000)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if not asyncio.run(run(args.operations, args.verbose)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Throughput of `GET /operations/{uuid}` with and without the operation cache.
+
+Runs the API in-process (no HTTP server, so that the network doesn't hide the
+cost of the request handling) against the database pointed to by
+ASYNC_DATABASE_URL, querying the most recent operations in a loop.
+
+    python -m benchmarks.operation_cache_throughput --operations 100 --requests 20000
+"""
+
+import argparse
+import asyncio
+import time
+from typing import List
+
+import httpx
+from sqlalchemy import select
+
+from app import api
+from app.cache import OperationCache
+from app.constants import OPERATION_CACHE_TTL_SECONDS
+from app.database import get_db
+from app.models import Operation
+
+
+async def recent_operations(count: int) -> List[str]:
+    async with get_db() as db:
+        uuids = await db.scalars(
+            select(Operation.uuid).order_by(Operation.accepted_at.desc()).limit(count)
+        )
+        return [str(op_uuid) for op_uuid in uuids]
+
+
+async def measure(uuids: List[str], requests: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://api") as client:
+        remaining = requests
+
+        async def worker() -> None:
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                response = await client.get(
+                    f"/operations/{uuids[remaining % len(uuids)]}"
+                )
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return requests / (time.perf_counter() - start)
+
+
+async def run(operations: int, requests: int, concurrency: int) -> None:
+    uuids = await recent_operations(operations)
+    if not uuids:
+        raise SystemExit("No operations in the database")
+
+    for name, max_size in [("uncached", 0), ("cached", len(uuids))]:
+        api.operation_cache = OperationCache(
+            max_size=max_size, ttl=OPERATION_CACHE_TTL_SECONDS
+        )
+        throughput = await measure(uuids, requests, concurrency)
+        stats = api.operation_cache.stats
+        print(
+            f"{name:>9}: {throughput:8.1f} req/s"
+            f" (hits {stats.hits}, misses {stats.misses})"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--operations", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.operations, args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Serialization cost per row of a page of operations.
+
+Compares the ORM path (`Operation.to_dict`, then `OperationResponse` and FastAPI's
+encoding of the list) with the fast path of `app.serialization`, on synthetic
+operations. Doesn't need a database.
+
+    python -m benchmarks.operation_serialization --rows 1000 --repeat 50
+"""
+
+import argparse
+import json
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+from fastapi.encoders import jsonable_encoder
+
+from app.api import OperationResponse
+from app.enums import OperationStatus
+from app.models import Operation
+from app.serialization import render_operations, select_operation_rows
+
+# Same fields and `_asdict` as the rows returned by `select_operation_rows`
+OperationRow = namedtuple(
+    "OperationRow",
+    [column.key for column in select_operation_rows().selected_columns],
+)
+
+
+def synthetic_operations(count: int) -> List[Operation]:
+    accepted_at = datetime(2024, 1, 1)
+    return [
+        Operation(
+            uuid=uuid.uuid4(),
+            system_id=f"M{i % 1000:05d}",
+            op_type="DEPLOY",
+            status=OperationStatus.COMPLETED,
+            accepted_at=accepted_at + timedelta(seconds=i),
+            started_at=accepted_at + timedelta(seconds=i + 1),
+            finished_at=accepted_at + timedelta(seconds=i + 60),
+            parameters={"timeout": 60, "version": "1.2.3"},
+            result={"message": "ok"},
+        )
+        for i in range(count)
+    ]
+
+
+def render_orm(operations: List[Operation]) -> bytes:
+    """What FastAPI does with a list of `OperationResponse` and a response_model."""
+    responses = [OperationResponse(**op.to_dict()) for op in operations]
+    validated = [OperationResponse.validate(response) for response in responses]
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def measure(render: Callable[[], bytes], rows: int, repeat: int) -> float:
+    """Microseconds per row."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        render()
+    return (time.perf_counter() - start) / (rows * repeat) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    operations = synthetic_operations(args.rows)
+    rows = [
+        OperationRow(*(getattr(op, field, None) for field in OperationRow._fields))
+        for op in operations
+    ]
+    assert json.loads(render_orm(operations)) == json.loads(render_operations(rows))
+
+    orm = measure(lambda: render_orm(operations), args.rows, args.repeat)
+    fast = measure(lambda: render_operations(rows), args.rows, args.repeat)
+    print(f"     orm: {orm:8.2f} us/row")
+    print(f"    fast: {fast:8.2f} us/row ({orm / fast:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Size and encoding cost of the reconciliation payloads, JSON vs compact.
+
+Compares Temporal's default data converter with the compact one of
+app/temporal/converter.py on pages of N RUNNING operations UUIDs: payload bytes
+and encode/decode time of `GetRunningOperationsOutput`. With `--history`, also
+runs a `ReconciliationShardWorkflow` over `--pages` pages with each converter,
+against a local Temporal dev server started by the Temporal test framework and
+with stand-in activities (no database needed), and reports the size of its
+history.
+
+    python -m benchmarks.payload_size --sizes 100 1000 10000
+    python -m benchmarks.payload_size --sizes 1000 --history --pages 10
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from temporalio import activity
+from temporalio.converter import DataConverter
+from temporalio.testing import WorkflowEnvironment
+from temporalio.worker import Worker
+
+from app.temporal.activities import (
+    GetRunningOperationsInput,
+    GetRunningOperationsOutput,
+    ReconcileOperationInput,
+    ReconcileOperationOutput,
+)
+from app.temporal.converter import data_converter
+from app.temporal.workflows.reconciliation import (
+    ReconciliationShardInput,
+    ReconciliationShardWorkflow,
+)
+
+CONVERTERS: Dict[str, DataConverter] = {
+    "json": DataConverter.default,
+    "compact": data_converter,
+}
+TASK_QUEUE = "payload-size-benchmark"
+
+
+def random_page(size: int) -> GetRunningOperationsOutput:
+    uuids = {str(uuid.uuid4()) for _ in range(size)}
+    return GetRunningOperationsOutput(operations_uuids=uuids, next_after=max(uuids))
+
+
+async def measure_encoding(
+    converter: DataConverter, page: GetRunningOperationsOutput, repeat: int
+) -> Dict:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        payloads = await converter.encode([page])
+    encode = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await converter.decode(payloads, [GetRunningOperationsOutput])
+    decode = (time.perf_counter() - start) / repeat
+
+    return {"bytes": payloads[0].ByteSize(), "encode": encode, "decode": decode}
+
+
+def stand_in_activities(page_size: int, pages: int) -> List:
+    served = {"pages": 0}
+
+    @activity.defn(name="get_running_operations")
+    async def get_running_operations(
+        input: GetRunningOperationsInput,
+    ) -> GetRunningOperationsOutput:
+        served["pages"] += 1
+        page = random_page(page_size)
+        if served["pages"] == pages:
+            page.next_after = None
+        return page
+
+    @activity.defn(name="reconcile_operation_status")
+    async def reconcile_operation_status(
+        input: ReconcileOperationInput,
+    ) -> ReconcileOperationOutput:
+        return ReconcileOperationOutput(reconciled=0)
+
+    return [get_running_operations, reconcile_operation_status]
+
+
+async def measure_history(
+    name: str, page_size: int, pages: int, dev_server_path: Optional[str]
+) -> int:
+    """Size in bytes of the history of a shard reconciling `pages` pages."""
+    async with await WorkflowEnvironment.start_local(
+        data_converter=CONVERTERS[name], dev_server_existing_path=dev_server_path
+    ) as env:
+        async with Worker(
+            env.client,
+            task_queue=TASK_QUEUE,
+            workflows=[ReconciliationShardWorkflow],
+            activities=stand_in_activities(page_size, pages),
+        ):
+            handle = await env.client.start_workflow(
+                ReconciliationShardWorkflow.run,
+                ReconciliationShardInput(
+                    after=None,
+                    until=None,
+                    page_size=page_size,
+                    pages_per_run=pages,
+                ),
+                id=f"payload-size-{name}",
+                task_queue=TASK_QUEUE,
+            )
+            await handle.result()
+            history = await handle.fetch_history()
+    return sum(event.ByteSize() for event in history.events)
+
+
+async def run(args: argparse.Namespace) -> None:
+    print(
+        f"{'uuids':>7} {'converter':>9} {'bytes':>9} {'bytes/uuid':>10}"
+        f" {'encode ms':>10} {'decode ms':>10}"
+    )
+    for size in args.sizes:
+        page = random_page(size)
+        for name, converter in CONVERTERS.items():
+            result = await measure_encoding(converter, page, args.repeat)
+            print(
+                f"{size:>7} {name:>9} {result['bytes']:>9} "
+                f"{result['bytes'] / size:>10.1f} {result['encode'] * 1000:>10.3f}"
+                f" {result['decode'] * 1000:>10.3f}"
+            )
+
+    if not args.history:
+        return
+
+    print()
+    print(f"{'uuids':>7} {'pages':>5} {'converter':>9} {'history bytes':>14}")
+    for size in args.sizes:
+        for name in CONVERTERS:
+            history_bytes = await measure_history(
+                name, size, args.pages, args.dev_server_path
+            )
+            print(f"{size:>7} {args.pages:>5} {name:>9} {history_bytes:>14}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument(
+        "--history",
+        action="store_true",
+        help="Also measure the history size of a reconciliation shard",
+    )
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument(
+        "--dev-server-path",
+        help="Temporal CLI binary to use instead of downloading one",
+    )
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Memory benchmark for the scan of RUNNING operations done by reconciliation.
+
+Seeds N RUNNING operations in the database pointed to by ASYNC_DATABASE_URL
+(migrations must have been applied), then compares the peak Python memory of
+loading every ORM row at once with the paged, streamed `get_running_operations`
+activity used by the full reconciliation. Seeded rows are deleted at the end.
+
+    python -m benchmarks.running_operations_memory --sizes 10000 100000 1000000
+"""
+
+import argparse
+import asyncio
+import time
+import tracemalloc
+from typing import Awaitable, Callable, List, Tuple
+
+from sqlalchemy import delete, select, text
+from temporalio.testing import ActivityEnvironment
+
+from app.database import get_db
+from app.enums import OperationStatus
+from app.models import Operation
+from app.temporal.activities import GetRunningOperationsInput, get_running_operations
+
+BENCH_SYSTEM_ID = "BENCH0"
+
+
+async def seed(count: int) -> None:
+    async with get_db() as db:
+        await db.execute(
+            text(
+                """
+                INSERT INTO operations
+                    (uuid, system_id, op_type, status, accepted_at, parameters)
+                SELECT gen_random_uuid(), :system_id, 'DEPLOY', 'RUNNING', now(),
+                    jsonb_build_object('timeout', 3600, 'notes', repeat('x', 200))
+                FROM generate_series(1, :count)
+                """
+            ),
+            {"system_id": BENCH_SYSTEM_ID, "count": count},
+        )
+
+
+async def cleanup() -> None:
+    async with get_db() as db:
+        await db.execute(delete(Operation).where(Operation.system_id == BENCH_SYSTEM_ID))
+
+
+async def load_all_orm_rows() -> int:
+    async with get_db() as db:
+        operations = await db.scalars(
+            select(Operation).where(Operation.status == OperationStatus.RUNNING)
+        )
+        return len({str(op.uuid) for op in operations.all()})
+
+
+async def scan_pages() -> int:
+    env = ActivityEnvironment()
+    total = 0
+    after = None
+    while True:
+        page = await env.run(
+            get_running_operations, GetRunningOperationsInput(after=after)
+        )
+        total += len(page.operations_uuids)
+        if page.next_after is None:
+            return total
+        after = page.next_after
+
+
+async def measure(fn: Callable[[], Awaitable[int]]) -> Tuple[int, float, float]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = await fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rows, peak / 2**20, elapsed
+
+
+async def run(sizes: List[int], skip_orm_above: int) -> None:
+    print(f"{'rows':>10} {'method':>12} {'peak MiB':>10} {'seconds':>9}")
+    seeded = 0
+    try:
+        for size in sorted(sizes):
+            await seed(size - seeded)
+            seeded = size
+
+            methods = [("paged", scan_pages)]
+            if size <= skip_orm_above:
+                methods.insert(0, ("orm .all()", load_all_orm_rows))
+
+            for name, fn in methods:
+                rows, peak, elapsed = await measure(fn)
+                print(f"{rows:>10} {name:>12} {peak:>10.1f} {elapsed:>9.2f}")
+    finally:
+        await cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument(
+        "--skip-orm-above",
+        type=int,
+        default=1_000_000,
+        help="Don't run the ORM baseline above this number of rows",
+    )
+    args = parser.parse_args()
+
+    asyncio.run(run(args.sizes, args.skip_orm_above))
+
+
+if __name__ == "__main__":
+    main()